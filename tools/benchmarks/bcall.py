@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare thread churn and wall time of backends calls between a pool created
+for every call, with up to one thread per backend (former behaviour), and the
+long-lived WorkerPool shared by WebNip.
+
+Usage: bcall.py [CALLS]
+"""
+from __future__ import print_function
+
+import sys
+from time import sleep, time
+
+from weboob.core.bcall import BackendsCall, WorkerPool
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+
+
+class FakeModule(Module):
+    NAME = 'fake'
+
+    def iter_numbers(self, count):
+        for i in range(count):
+            # Simulate network latency.
+            sleep(0.0005)
+            yield i
+
+
+def run(backends, calls, shared=None):
+    threads = 0
+    start = time()
+    for _ in range(calls):
+        pool = shared or WorkerPool(max_workers=len(backends))
+        for _ in BackendsCall(backends, 'iter_numbers', 5, pool=pool):
+            pass
+        if pool is not shared:
+            pool.shutdown()
+            threads += pool.started
+    if shared:
+        threads = shared.started
+    return time() - start, threads
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    weboob = WebNip(modules_path=False)
+
+    print('%8s %22s %22s' % ('backends', 'pool per call', 'shared pool'))
+    for count in (10, 100, 500):
+        backends = [FakeModule(weboob, 'fake%d' % i) for i in range(count)]
+
+        shared = WorkerPool()
+        before = run(backends, calls)
+        after = run(backends, calls, shared)
+        shared.shutdown(wait=True)
+
+        print('%8d %12.3fs %4d thr %12.3fs %4d thr' % ((count,) + before + after))
+
+
+if __name__ == '__main__':
+    main()
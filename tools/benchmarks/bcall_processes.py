@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare wall time of CPU-bound backends (parsing pages with lxml and
+filters) run in threads, and in worker processes with processes=True. Worker
+processes only help on a machine with several CPUs.
+
+Usage: bcall_processes.py [BACKENDS]
+"""
+from __future__ import print_function
+
+import sys
+from time import time
+
+import lxml.html
+
+from weboob.browser.filters.standard import CleanDecimal, CleanText
+from weboob.capabilities.base import BaseObject, DecimalField, StringField
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+
+
+ROWS = u''.join(u'<tr><td>  Label   %d </td><td>1 234,%02d €</td></tr>' % (i, i % 100) for i in range(500))
+HTML = u'<html><body><table>%s</table></body></html>' % ROWS
+
+
+class Line(BaseObject):
+    label = StringField('Label')
+    amount = DecimalField('Amount')
+
+
+class ParsingModule(Module):
+    NAME = 'parsing'
+
+    def iter_lines(self, pages):
+        for _ in range(pages):
+            doc = lxml.html.fromstring(HTML)
+            for i, tr in enumerate(doc.xpath('//tr')):
+                line = Line(str(i))
+                line.label = CleanText('./td[1]')(tr)
+                line.amount = CleanDecimal('./td[2]', replace_dots=True)(tr)
+                if i % 50 == 0:
+                    yield line
+
+
+def run(weboob, **kwargs):
+    start = time()
+    count = len(list(weboob.do('iter_lines', 5, **kwargs)))
+    return time() - start, count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    weboob = WebNip(modules_path=False)
+    for i in range(count):
+        name = 'parsing%d' % i
+        weboob.backend_instances[name] = ParsingModule(weboob, name)
+
+    print('%8s %10.3fs %d results' % (('threads',) + run(weboob)))
+    # First call starts worker processes.
+    run(weboob, processes=True)
+    print('%8s %10.3fs %d results (%d processes)' % (('processes',) + run(weboob, processes=True) +
+                                                    (weboob.process_pool.max_processes,)))
+    weboob.deinit()
+
+
+if __name__ == '__main__':
+    main()
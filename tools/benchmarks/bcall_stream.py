@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure first-result latency, wall time and peak RSS of a backends call
+streaming a lot of objects to a slow consumer, with an unbounded queue and
+with a bounded one.
+
+Usage: bcall_stream.py [OBJECTS]
+"""
+from __future__ import print_function
+
+import resource
+import subprocess
+import sys
+from time import time
+
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+
+
+class FakeModule(Module):
+    NAME = 'fake'
+
+    def iter_objects(self, count):
+        # Use light objects to measure the cost of the call itself, building
+        # a BaseObject is much more expensive than streaming it.
+        for i in range(count):
+            yield (i, u'label %d' % i * 20)
+
+
+def measure(count, queue_size):
+    weboob = WebNip(modules_path=False)
+    weboob.backend_instances['fake'] = FakeModule(weboob, 'fake')
+
+    start = time()
+    first = None
+    for obj in weboob.do('iter_objects', count, queue_size=queue_size):
+        if first is None:
+            first = time() - start
+        # Simulate a formatter, slower than the backend.
+        for _ in range(10):
+            u'%10d %s' % (obj[0], obj[1][:40].rjust(40))
+    total = time() - start
+    weboob.deinit()
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%10s %10.2fms %9.2fs %10.1fMiB' % (queue_size or 'unbounded', first * 1000, total, rss / 1024.))
+
+
+def main():
+    if len(sys.argv) > 2:
+        measure(int(sys.argv[1]), int(sys.argv[2]))
+        return
+
+    count = sys.argv[1] if len(sys.argv) > 1 else '1000000'
+    print('%10s %12s %10s %13s' % ('queue size', 'first result', 'total', 'peak RSS'))
+    # Run each measure in its own process, to get a meaningful peak RSS.
+    for queue_size in ('0', '1000'):
+        subprocess.check_call([sys.executable, __file__, count, queue_size])
+
+
+if __name__ == '__main__':
+    main()
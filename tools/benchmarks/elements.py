@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the iteration of a ListElement over synthetic items, with a loader
+and 8 fields by item.
+
+With --profile, print the functions where most time is spent.
+
+Usage: elements.py [--profile] [ITEMS [RUNS]]
+"""
+from __future__ import print_function
+
+import cProfile
+import pstats
+import sys
+from time import time
+
+import lxml.html
+
+from weboob.browser.elements import ItemElement, ListElement
+from weboob.browser.filters.html import Attr
+from weboob.browser.filters.standard import CleanDecimal, CleanText, Regexp
+from weboob.capabilities.base import BaseObject, DecimalField, Field, StringField
+
+
+class Item(BaseObject):
+    label = StringField('Label')
+    category = StringField('Category')
+    link = StringField('Link')
+    amount = DecimalField('Amount')
+    reference = StringField('Reference')
+    kind = Field('Kind', int)
+
+
+class PageStub(object):
+    params = {}
+    browser = None
+
+    def __init__(self, doc):
+        self.doc = doc
+
+
+class ItemsList(ListElement):
+    item_xpath = '//li'
+
+    class item(ItemElement):
+        klass = Item
+
+        load_details = Attr('.', 'data-details')
+
+        obj_id = Attr('.', 'id')
+        obj_label = CleanText('./span[@class="label"]')
+        obj_category = CleanText('./span[@class="category"]', children=False)
+        obj_link = Attr('./a', 'href')
+        obj_amount = CleanDecimal('./span[@class="amount"]', replace_dots=True)
+        obj_reference = Regexp(CleanText('./span[@class="ref"]'), r'Ref\. (\w+)')
+        obj_kind = 1
+
+        def obj_url(self):
+            return self.page.url if hasattr(self.page, 'url') else None
+
+
+def build_doc(items):
+    return lxml.html.fromstring(u'<html><body><ul>%s</ul></body></html>' % u''.join(
+        u'<li id="item-%d" data-details="%d"><span class="label"> Item   %d </span>'
+        u'<span class="category">Category <b>%d</b></span><a href="/items/%d">link</a>'
+        u'<span class="amount">%d,%02d €</span><span class="ref">Ref. R%05d</span></li>'
+        % (i, i, i, i % 10, i, i, i % 100, i) for i in range(items)))
+
+
+def measure(page, runs):
+    best = None
+    for _ in range(runs):
+        start = time()
+        count = len(list(ItemsList(page)()))
+        duration = time() - start
+        best = duration if best is None else min(best, duration)
+    return count, best
+
+
+def main():
+    args = sys.argv[1:]
+    profile = '--profile' in args
+    args = [arg for arg in args if arg != '--profile']
+    items = int(args[0]) if len(args) > 0 else 5000
+    runs = int(args[1]) if len(args) > 1 else 3
+
+    page = PageStub(build_doc(items))
+    count, duration = measure(page, runs)
+    print('%d items: %.1f ms, %.1f us by item' % (count, duration * 1000, duration / count * 1e6))
+
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(lambda: list(ItemsList(page)()))
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(15)
+
+
+if __name__ == '__main__':
+    main()
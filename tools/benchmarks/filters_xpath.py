@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the parsing of a recorded transactions table with TableElement and
+filters, with XPath expressions and CSS selectors compiled once, and with
+lxml compiling them on each evaluation as before.
+
+Usage: filters_xpath.py [ROWS [RUNS]]
+"""
+from __future__ import print_function
+
+import sys
+from time import time
+
+from requests import Response
+
+import weboob.browser.elements
+import weboob.browser.filters.base
+import weboob.browser.filters.html
+import weboob.browser.filters.standard
+from weboob.browser import Browser
+from weboob.browser.elements import ItemElement, TableElement, method
+from weboob.browser.filters.html import CSS, Attr, Link, TableCell
+from weboob.browser.filters.standard import CleanDecimal, CleanText, Date, Regexp
+from weboob.browser.pages import HTMLPage
+from weboob.capabilities.bank import Transaction
+
+
+MODULES = [weboob.browser.elements, weboob.browser.filters.base, weboob.browser.filters.html,
+           weboob.browser.filters.standard]
+
+ROW = u'''<tr class="%(kind)s">
+    <td class="date">%(day)02d/01/2018</td>
+    <td class="vdate"><span>%(day)02d/01/2018</span></td>
+    <td class="label"><a href="/operation?id=%(i)d" title="Opération %(i)d">  CB CARTE   %(i)d  </a></td>
+    <td class="category"><img src="/img/cat-%(cat)d.png" alt="Catégorie %(cat)d" /></td>
+    <td class="debit">%(debit)s</td>
+    <td class="credit">%(credit)s</td>
+</tr>'''
+
+
+class TransactionsPage(HTMLPage):
+    @method
+    class iter_history(TableElement):
+        head_xpath = '//table[@id="history"]/thead/tr/th'
+        item_xpath = '//table[@id="history"]/tbody/tr[has-class("operation")]'
+
+        col_date = u'Date'
+        col_vdate = u'Date de valeur'
+        col_label = u'Libellé'
+        col_category = u'Catégorie'
+        col_debit = u'Débit'
+        col_credit = u'Crédit'
+
+        class item(ItemElement):
+            klass = Transaction
+
+            obj_id = Regexp(Link('.//td[@class="label"]/a'), r'id=(\d+)')
+            obj_date = Date(CleanText(TableCell('date')), dayfirst=True)
+            obj_vdate = Date(CleanText(CSS('td.vdate span')), dayfirst=True)
+            obj_raw = CleanText(TableCell('label'), children=False)
+            obj_label = CleanText(Attr('.//td[@class="label"]/a', 'title'))
+            obj_category = Attr('.//td[@class="category"]/img', 'alt')
+            obj_type = Transaction.TYPE_CARD
+
+            def obj_amount(self):
+                return CleanDecimal(TableCell('credit'), replace_dots=True, default=0)(self) - \
+                    CleanDecimal(TableCell('debit'), replace_dots=True, default=0)(self)
+
+def record(rows):
+    body = u''.join(ROW % {'i': i, 'day': i % 28 + 1, 'cat': i % 10, 'kind': 'operation',
+                           'debit': u'%d,%02d' % (i, i % 100) if i % 3 else u'',
+                           'credit': u'' if i % 3 else u'%d,00' % i}
+                    for i in range(rows))
+    head = u''.join(u'<th>%s</th>' % title for title in
+                    (u'Date', u'Date de valeur', u'Libellé', u'Catégorie', u'Débit', u'Crédit'))
+    html = u'<html><head><meta charset="utf-8"></head><body><table id="history"><thead><tr>%s</tr></thead>' \
+           u'<tbody>%s</tbody></table></body></html>' % (head, body)
+
+    response = Response()
+    response.status_code = 200
+    response.url = 'https://weboob.org/history'
+    response._content = html.encode('utf-8')
+    return response
+
+
+def measure(page, runs):
+    best = None
+    for _ in range(runs):
+        start = time()
+        count = len(list(page.iter_history()))
+        duration = time() - start
+        best = duration if best is None else min(best, duration)
+    return count, best * 1000
+
+
+def uncompiled(el, selector, **kwargs):
+    return el.xpath(selector, **kwargs)
+
+
+def uncompiled_css(el, selector, **kwargs):
+    return el.cssselect(selector, **kwargs)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    page = TransactionsPage(Browser(), record(rows))
+
+    compiled = {}
+    for module in MODULES:
+        compiled[module] = dict((name, getattr(module, name)) for name in ('select_xpath', 'select_css')
+                                if hasattr(module, name))
+        for name in compiled[module]:
+            setattr(module, name, uncompiled if name == 'select_xpath' else uncompiled_css)
+    count, before = measure(page, runs)
+
+    for module, functions in compiled.items():
+        for name, function in functions.items():
+            setattr(module, name, function)
+    count, after = measure(page, runs)
+
+    print('%d transactions' % count)
+    print('compiled on each evaluation: %8.1f ms' % before)
+    print('compiled once:               %8.1f ms (%.2fx)' % (after, before / after))
+
+
+if __name__ == '__main__':
+    main()
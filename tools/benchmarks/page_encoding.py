@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Count documents built twice by HTMLPage because the encoding declared in the
+document is not the one of the HTTP header, with and without the prescan of
+meta tags, on pages with usual combinations of declarations.
+
+Usage: page_encoding.py [RUNS]
+"""
+from __future__ import print_function
+
+import sys
+from time import time
+
+from requests import Response
+
+from weboob.browser import Browser
+from weboob.browser.pages import HTMLPage, Page
+
+
+BODY = u'<table>%s</table>' % u''.join(u'<tr><td>Opération n°%d</td><td>%d,00 €</td></tr>' % (i, i)
+                                       for i in range(500))
+
+# (header encoding, meta tags, encoding of the content)
+CASES = [
+    ('ISO-8859-1', '<meta charset="utf-8">', 'utf-8'),
+    ('ISO-8859-1', '<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">', 'windows-1252'),
+    ('iso-8859-1', '', 'windows-1252'),
+    (None, '<meta charset="utf-8">', 'utf-8'),
+    ('utf-8', '<meta charset="utf-8">', 'utf-8'),
+    ('utf-8', '', 'utf-8'),
+]
+
+
+class NoPrescanPage(HTMLPage):
+    def prescan_encoding(self):
+        return None
+
+
+def build(klass, browser, header, meta, encoding):
+    content = (u'<html><head><title>Comptes</title>%s</head><body>%s</body></html>' % (meta, BODY)).encode(encoding)
+    response = Response()
+    response.status_code = 200
+    response.url = 'https://weboob.org/'
+    response._content = content
+    response.encoding = header
+    return klass(browser, response)
+
+
+def measure(klass, runs):
+    browser = Browser()
+    built, rebuilt = Page.docs_built, Page.docs_rebuilt
+    start = time()
+    for _ in range(runs):
+        for case in CASES:
+            build(klass, browser, *case)
+    duration = (time() - start) / runs / len(CASES) * 1000
+    return Page.docs_built - built, Page.docs_rebuilt - rebuilt, duration
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    print('%d pages' % (runs * len(CASES)))
+    for title, klass in (('without prescan', NoPrescanPage), ('with prescan', HTMLPage)):
+        built, rebuilt, duration = measure(klass, runs)
+        print('%-16s built %5d  rebuilt %5d  %6.2f ms by page' % (title + ':', built, rebuilt, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure PagesBrowser.pagination over a list of pages, with and without
+ListElement.prefetch_next_page.
+
+Pages are recorded in a temporary directory, and served by a local HTTP
+server which waits LATENCY milliseconds before each response. The consumer
+spends CONSUME milliseconds on each item.
+
+Usage: pagination_prefetch.py [PAGES [LATENCY [CONSUME]]]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+from threading import Thread
+from time import sleep, time
+
+try:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+from weboob.browser import PagesBrowser, URL
+from weboob.browser.elements import ItemElement, ListElement, method
+from weboob.browser.filters.html import AbsoluteLink, Link
+from weboob.browser.filters.standard import CleanText
+from weboob.browser.pages import HTMLPage
+from weboob.capabilities.base import BaseObject
+
+
+ITEMS = 50
+RUNS = 3
+
+
+class RequestHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        sleep(self.server.latency)
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def translate_path(self, path):
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ItemsList(ListElement):
+    item_xpath = '//tr'
+    next_page = AbsoluteLink('//a[@rel="next"]', default=None)
+
+    class item(ItemElement):
+        klass = BaseObject
+
+        obj_id = CleanText('./td[1]')
+        obj_url = Link('./td[2]/a')
+
+
+class PrefetchedItemsList(ItemsList):
+    prefetch_next_page = True
+
+
+class ListPage(HTMLPage):
+    iter_items = method(ItemsList)
+    iter_prefetched = method(PrefetchedItemsList)
+
+
+class ListBrowser(PagesBrowser):
+    list = URL(r'/list-(?P<num>\d+).html', ListPage)
+
+
+def record(root, pages):
+    for num in range(1, pages + 1):
+        rows = ''.join('<tr><td>%d-%d</td><td><a href="/item-%d-%d.html">%s</a></td></tr>'
+                       % (num, i, num, i, 'Item %d of page %d' % (i, num)) for i in range(ITEMS))
+        link = '<a rel="next" href="list-%d.html">next</a>' % (num + 1) if num < pages else ''
+        with open(os.path.join(root, 'list-%d.html' % num), 'w') as f:
+            f.write('<html><body><table>%s</table>%s</body></html>' % (rows, link))
+
+
+def measure(browser, method, consume):
+    best = None
+    for _ in range(RUNS):
+        start = time()
+        browser.list.go(num=1)
+        for obj in browser.pagination(lambda: getattr(browser.page, method)()):
+            sleep(consume)
+        duration = time() - start
+        best = duration if best is None else min(best, duration)
+    return best * 1000
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2] if len(sys.argv) > 2 else 100)
+    consume = float(sys.argv[3] if len(sys.argv) > 3 else 2)
+
+    root = tempfile.mkdtemp()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+    server.root = root
+    server.latency = latency / 1000
+    thread = Thread(target=server.serve_forever, args=(0.05,))
+    thread.start()
+    try:
+        record(root, pages)
+        browser = ListBrowser(baseurl='http://127.0.0.1:%d' % server.server_port)
+
+        print('pagination: %d pages of %d items, latency %dms, %.1fms by item' % (pages, ITEMS, latency, consume))
+        without = measure(browser, 'iter_items', consume / 1000)
+        print('without prefetch:  %8.1f ms' % without)
+        prefetch = measure(browser, 'iter_prefetched', consume / 1000)
+        print('with prefetch:     %8.1f ms (%.2fx)' % (prefetch, without / prefetch))
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare wall time of a full build of the index of a repository, with the
+previous sequential build, and with an incremental build after a change in
+one module. Sources of modules are copied to a temporary directory.
+
+Usage: repos_build_index.py [MODULES_PATH]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+from time import time
+
+from weboob.core.repositories import Repository
+
+
+def build(source, target, incremental=True, **kwargs):
+    if incremental:
+        kwargs['cache_path'] = os.path.join(os.path.dirname(target), 'build.cache')
+    r = Repository('file://%s' % target)
+    r.name = 'benchmark'
+    start = time()
+    r.build_index(source, os.path.join(target, r.INDEX), **kwargs)
+    return time() - start, len(r.modules)
+
+
+def read_index(target):
+    with open(os.path.join(target, Repository.INDEX)) as f:
+        return [line for line in f if not line.startswith('update = ')]
+
+
+def main():
+    if len(sys.argv) > 1:
+        modules_path = sys.argv[1]
+    else:
+        modules_path = os.path.join(os.path.dirname(__file__), '..', '..', 'modules')
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'modules')
+        target = os.path.join(tmpdir, 'repo')
+        shutil.copytree(modules_path, source, ignore=shutil.ignore_patterns('*.pyc', '__pycache__'))
+        os.mkdir(target)
+
+        print('%12s %10.3fs %d modules' % (('sequential',) + build(source, target, incremental=False, max_workers=1)))
+        print('%12s %10.3fs %d modules' % (('full',) + build(source, target, incremental=False)))
+
+        name = sorted(n for n in os.listdir(source) if os.path.isdir(os.path.join(source, n)))[0]
+        with open(os.path.join(source, name, '__init__.py'), 'a') as f:
+            f.write('\n# changed\n')
+        print('%12s %10.3fs %d modules' % (('incremental',) + build(source, target)))
+        incremental = read_index(target)
+        build(source, target, incremental=False)
+        print('same index as a full build: %s' % (read_index(target) == incremental))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
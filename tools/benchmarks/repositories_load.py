@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the startup cost of Repositories, when indexes of repositories are
+parsed and when they are read from the cache, in the style of
+"python -X importtime" (microseconds, one line per step).
+
+Usage: repositories_load.py [MODULES [REPOSITORIES]]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+from time import time
+
+from weboob.core.ouiboube import Weboob
+from weboob.core.repositories import ModuleInfo, Repositories, Repository, Versions
+
+
+RUNS = 20
+
+
+def setup(tmpdir, modules, repositories):
+    sources = []
+    os.makedirs(os.path.join(tmpdir, Repositories.REPOS_DIR))
+    for i in range(repositories):
+        url = 'https://updates%d.example.org/' % i
+        sources.append(url)
+
+        r = Repository(url)
+        r.name = 'repo%d' % i
+        r.update = 201801010000
+        for j in range(modules):
+            m = r.modules['module%d' % j] = ModuleInfo('module%d' % j)
+            m.version = 201801010000 + j
+            m.capabilities = ['CapBank', 'CapProfile']
+            m.description = u'Module number %d' % j
+            m.maintainer = u'Maintainer <maintainer@example.org>'
+            m.license = u'AGPLv3+'
+        filename = '%02d-%s' % (i, Repositories.url2filename(url))
+        r.save(os.path.join(tmpdir, Repositories.REPOS_DIR, filename), private=True)
+
+    with open(os.path.join(tmpdir, Repositories.SOURCES_LIST), 'w') as f:
+        f.write('\n'.join(sources))
+
+    versions = Versions(os.path.join(tmpdir, Repositories.MODULES_DIR, Weboob.VERSION))
+    os.makedirs(versions.path)
+    for j in range(modules):
+        versions.versions['module%d' % j] = 201801010000 + j
+    versions.save()
+
+
+def measure(tmpdir, cached):
+    total = 0
+    for _ in range(RUNS):
+        if not cached and os.path.exists(os.path.join(tmpdir, Repositories.CACHE)):
+            os.remove(os.path.join(tmpdir, Repositories.CACHE))
+        start = time()
+        repositories = Repositories(tmpdir, tmpdir, Weboob.VERSION)
+        repositories.check_repositories()
+        total += time() - start
+    return int(total / RUNS * 1e6)
+
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    repositories = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        setup(tmpdir, modules, repositories)
+        print('startup: step                  | time [us] (%d modules, %d repositories)' % (modules, repositories))
+        print('startup: parse indexes         | %9d' % measure(tmpdir, False))
+        measure(tmpdir, True)
+        print('startup: read cache            | %9d' % measure(tmpdir, True))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
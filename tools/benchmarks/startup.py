@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure cold and warm start time of applications, with the phases reported
+by --profile-startup.
+
+Each application is run with "--profile-startup --version" on a fresh
+configuration (without backends nor repositories, so nothing uses the
+network). The cold start is the first run: the cache of repositories is
+empty, and with Python 3 the bytecode of weboob is compiled again. The warm
+start is the best of next runs.
+
+To track start times across commits, results can be appended to a file,
+one JSON object by application and by run of this script.
+
+Usage: startup.py [-o RESULTS] [-n RUNS] [APPLICATION...]
+"""
+from __future__ import print_function
+
+import json
+import optparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import time
+
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SCRIPTS = os.path.join(ROOT, 'scripts')
+
+
+def list_applications():
+    # Qt applications are skipped, PyQt may not be installed.
+    return [name for name in sorted(os.listdir(SCRIPTS))
+            if not name.startswith('q') and not name.endswith('-qt')]
+
+
+def run(app, env):
+    start = time()
+    proc = subprocess.Popen([sys.executable, os.path.join(SCRIPTS, app), '--profile-startup', '--version'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env, cwd=ROOT)
+    out, err = proc.communicate()
+    duration = time() - start
+    if proc.returncode != 0:
+        raise RuntimeError(err.decode('utf-8', 'replace').strip().splitlines()[-1])
+
+    phases = {}
+    for line in err.decode('utf-8', 'replace').splitlines():
+        m = re.match(r'^  (.+?)\s+([\d.]+) ms$', line)
+        if m:
+            phases[m.group(1)] = float(m.group(2))
+    return duration * 1000, phases
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [-o RESULTS] [-n RUNS] [APPLICATION...]')
+    parser.add_option('-o', '--output', help='append results to this file')
+    parser.add_option('-n', '--runs', type='int', default=5, help='number of warm runs')
+    options, apps = parser.parse_args()
+    apps = apps or list_applications()
+
+    commit = get_commit()
+    results = []
+    print('%-16s %10s %10s   %s' % ('application', 'cold [ms]', 'warm [ms]', 'warm phases [ms]'))
+    for app in apps:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'sources.list'), 'w') as f:
+                f.write('# No repository\n')
+            env = dict(os.environ,
+                       WEBOOB_WORKDIR=tmpdir,
+                       WEBOOB_DATADIR=tmpdir,
+                       PYTHONPATH=os.pathsep.join([ROOT] + [p for p in [os.environ.get('PYTHONPATH')] if p]),
+                       PYTHONPYCACHEPREFIX=os.path.join(tmpdir, 'pycache'))
+
+            cold, _ = run(app, env)
+            warm, phases = min(run(app, env) for _ in range(options.runs))
+        except RuntimeError as e:
+            print('%-16s failed: %s' % (app, e))
+            continue
+        finally:
+            shutil.rmtree(tmpdir)
+
+        print('%-16s %10.1f %10.1f   %s' % (app, cold, warm,
+                                            ' '.join('%s=%.1f' % item for item in sorted(phases.items()))))
+        results.append({'commit': commit,
+                        'date': datetime.now().isoformat(),
+                        'python': '%d.%d' % sys.version_info[:2],
+                        'application': app,
+                        'cold': cold,
+                        'warm': warm,
+                        'phases': phases})
+
+    if options.output:
+        with open(options.output, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the cost of finding the URL object which handles a response, for
+every PagesBrowser of modules which can be imported, comparing the loop on
+URL.match() which built regexps on each call with the compiled router.
+
+For each browser, the dispatched urls are the url of each of its URL objects
+which can be built without arguments, and an url which matches none.
+
+Usage: url_dispatch.py [MODULES_DIR]
+"""
+from __future__ import print_function
+
+import importlib
+import os
+import re
+import sys
+from time import time
+
+from weboob.browser import PagesBrowser, URL
+from weboob.browser.url import URLRouter
+from weboob.tools.compat import urljoin
+
+
+RUNS = 200
+
+
+def iter_browsers(modules_dir):
+    sys.path.insert(0, modules_dir)
+    seen = set()
+    for root, dirs, files in sorted(os.walk(modules_dir)):
+        for filename in sorted(files):
+            if filename != 'browser.py':
+                continue
+            name = os.path.relpath(os.path.join(root, filename[:-3]), modules_dir).replace(os.sep, '.')
+            try:
+                module = importlib.import_module(name)
+            except Exception:
+                continue
+            for obj in vars(module).values():
+                if isinstance(obj, type) and issubclass(obj, PagesBrowser) and obj not in seen \
+                   and obj.__module__ == module.__name__:
+                    seen.add(obj)
+                    yield name, obj
+
+
+def get_urls(klass):
+    attrs = [(attr, getattr(klass, attr, None)) for attr in dir(klass)]
+    attrs = [v for v in attrs if isinstance(v[1], URL) and v[1].klass is not None]
+    attrs.sort(key=lambda v: v[1]._creation_counter)
+    return attrs
+
+
+def legacy_dispatch(urls, base, url):
+    # URL.match() before the router.
+    for name, url_object in urls:
+        for regex in url_object.urls:
+            if not re.match(r'^[\w\?]+://.*', regex):
+                regex = re.escape(base).rstrip('/') + '/' + regex.lstrip('/')
+            if re.match(regex, url):
+                return name
+
+
+def router_dispatch(router, base, url):
+    for name, match in router.match(url):
+        return name
+
+
+def sample_urls(urls, base):
+    class FakeBrowser(object):
+        BASEURL = base
+
+        def absurl(self, uri, base=None):
+            return urljoin(self.BASEURL, uri)
+
+    samples = []
+    for name, url_object in urls:
+        try:
+            samples.append(url_object.build(browser=FakeBrowser()))
+        except Exception:
+            # Some patterns can not be reversed.
+            pass
+    samples.append(base.rstrip('/') + '/unknown/page.html')
+    return samples
+
+
+def measure(func, urls, base, samples):
+    start = time()
+    for _ in range(RUNS):
+        for url in samples:
+            func(urls, base, url)
+    return (time() - start) / RUNS / len(samples) * 1e6
+
+
+def main():
+    modules_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), '..', '..', 'modules')
+
+    results = []
+    for name, klass in iter_browsers(os.path.realpath(modules_dir)):
+        urls = get_urls(klass)
+        if not urls:
+            continue
+        base = klass.BASEURL or 'https://www.example.org/'
+        samples = sample_urls(urls, base)
+        # A browser compiles its router once.
+        router = URLRouter(urls, base)
+        for url in samples:
+            assert legacy_dispatch(urls, base, url) == router_dispatch(router, base, url), (klass, url)
+        results.append(('%s.%s' % (name, klass.__name__), len(urls),
+                        measure(legacy_dispatch, urls, base, samples),
+                        measure(router_dispatch, router, base, samples)))
+
+    results.sort(key=lambda r: -r[1])
+    print('%-60s %5s %12s %12s' % ('browser', 'urls', 'match [us]', 'router [us]'))
+    for name, count, legacy, router in results[:15]:
+        print('%-60s %5d %12.1f %12.1f' % (name, count, legacy, router))
+    print('%-60s %5d %12.1f %12.1f' % ('mean of %d browsers' % len(results),
+                                       sum(r[1] for r in results) / len(results),
+                                       sum(r[2] for r in results) / len(results),
+                                       sum(r[3] for r in results) / len(results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,21 @@ from weboob.tools.config.yamlconfig import YamlConfig
 __all__ = ['Boobcoming']
 
 
+def start_date_key(event):
+    """
+    Key to sort events by start date. Naive and aware dates can't be
+    compared, so they are all converted to naive local dates.
+    """
+    date = event.start_date
+    if empty(date):
+        return datetime.min
+    if not isinstance(date, datetime):
+        return datetime.combine(date, time.min)
+    if date.tzinfo is not None:
+        date = date.astimezone(tz.tzlocal()).replace(tzinfo=None)
+    return date
+
+
 class UpcomingSimpleFormatter(IFormatter):
     MANDATORY_FIELDS = ('id', 'start_date', 'category', 'summary', 'status')
 
@@ -337,7 +352,9 @@ class Boobcoming(ReplApplication):
             date_from = datetime.now()
             date_to = None
 
-        for event in self.do('list_events', date_from, date_to):
+        # Events of all backends are displayed in chronological order, once
+        # each backend has given a few events to fix their order.
+        for event in self.do('list_events', date_from, date_to, merge_key=start_date_key):
             self.cached_format(event)
 
     def complete_info(self, text, line, *ignored):
@@ -28,7 +28,7 @@ import subprocess
 from copy import copy
 from contextlib import closing
 
-from weboob.core.repositories import Repository
+from weboob.core.repositories import ModuleManifest, Repositories, Repository
 
 from weboob.tools.application.repl import ReplApplication
 from weboob.tools.misc import find_exe
@@ -100,7 +100,13 @@ class WeboobRepos(ReplApplication):
             print('Use the "create" command before.', file=self.stderr)
             return 1
 
-        r.build_index(source_path, index_file)
+        # Modules can be installed file by file, see ModuleManifest.
+        r.manifests = True
+        # Information of unchanged modules is kept in the data directory,
+        # as the repository is published.
+        cache_path = os.path.join(self.weboob.repositories.datadir, 'builds',
+                                  '%s.cache' % Repositories.url2filename(os.path.realpath(repo_path)))
+        r.build_index(source_path, index_file, cache_path=cache_path)
 
         if r.signed:
             sigfiles = [r.KEYRING, Repository.INDEX]
@@ -139,10 +145,12 @@ class WeboobRepos(ReplApplication):
 
         for name, module in r.modules.items():
             tarname = os.path.join(repo_path, '%s.tar.gz' % name)
+            manifestname = os.path.join(repo_path, '%s.manifest' % name)
             if r.signed:
                 sigfiles.append(os.path.basename(tarname))
+                sigfiles.append(os.path.basename(manifestname))
             module_path = os.path.join(source_path, name)
-            if os.path.exists(tarname):
+            if os.path.exists(tarname) and os.path.exists(manifestname):
                 tar_mtime = int(datetime.fromtimestamp(os.path.getmtime(tarname)).strftime('%Y%m%d%H%M'))
                 if tar_mtime >= module.version:
                     continue
@@ -153,6 +161,18 @@ class WeboobRepos(ReplApplication):
             tar_mtime = mktime(strptime(str(module.version), '%Y%m%d%H%M'))
             os.utime(tarname, (tar_mtime, tar_mtime))
 
+            # Files of the archive are also available one by one, by hash.
+            manifest = ModuleManifest.from_tree(module_path, exclude=self._archive_excludes)
+            for relpath, digest in manifest.files.items():
+                object_path = os.path.join(repo_path, *ModuleManifest.object_path(digest).split('/'))
+                if not os.path.exists(object_path):
+                    if not os.path.isdir(os.path.dirname(object_path)):
+                        os.makedirs(os.path.dirname(object_path))
+                    shutil.copy(os.path.join(module_path, *relpath.split('/')), object_path)
+            with open(manifestname, 'wb') as fp:
+                fp.write(manifest.dump())
+            os.utime(manifestname, (tar_mtime, tar_mtime))
+
             # Copy icon.
             icon_path = os.path.join(module_path, 'favicon.png')
             if os.path.exists(icon_path):
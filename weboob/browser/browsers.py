@@ -47,6 +47,7 @@ except ImportError:
 from weboob.exceptions import BrowserHTTPSDowngrade, ModuleInstallError
 
 from weboob.tools.log import getLogger
+from weboob.tools.profiler import startup_profiler
 from weboob.tools.compat import basestring, unicode, urlparse, urljoin
 from weboob.tools.json import json
 
@@ -55,7 +56,7 @@ from .exceptions import HTTPNotFound, ClientError, ServerError
 from .sessions import FuturesSession
 from .profiles import Firefox
 from .pages import NextPage
-from .url import URL, normalize_url
+from .url import URL, URLRouter, normalize_url
 
 
 class Browser(object):
@@ -105,6 +106,20 @@ class Browser(object):
     Example: weboob.browser.cookies.BlockAllCookies()
     """
 
+    COALESCE_REQUESTS = False
+    """
+    Send only once identical GET, HEAD or OPTIONS requests made at the same
+    time (for example by several AsyncLoad filters), and give a copy of the
+    response to each caller. `session.coalesced` counts requests which were
+    not sent.
+    """
+
+    cancel_token = None
+    """
+    :class:`weboob.tools.cancel.CancelToken` of the running task, set by
+    the module. Once cancelled, requests are not sent anymore.
+    """
+
     @classmethod
     def asset(cls, localfile):
         """
@@ -198,6 +213,7 @@ class Browser(object):
         session = self._create_session()
 
         session.proxies = self.PROXIES
+        session.coalesce = self.COALESCE_REQUESTS
 
         session.verify = not self.logger.settings['ssl_insecure'] and self.VERIFY
         if not session.verify:
@@ -260,6 +276,7 @@ class Browser(object):
                    data_encoding=None,
                    is_async=False,
                    callback=lambda response: response,
+                   cancel_token=None,
                    **kwargs):
         """
         Make an HTTP request like a browser does:
@@ -304,6 +321,10 @@ class Browser(object):
                          with response as its first and only argument
         :type callback: function
 
+        :param cancel_token: token which cancels this request, in addition
+                             to the cancel_token of the browser
+        :type cancel_token: :class:`weboob.tools.cancel.CancelToken`
+
         :rtype: :class:`requests.Response`
         """
         if 'async' in kwargs:
@@ -312,6 +333,10 @@ class Browser(object):
             is_async = kwargs['async']
             del kwargs['async']
 
+        tokens = [token for token in (self.cancel_token, cancel_token) if token is not None]
+        for token in tokens:
+            token.check()
+
         if isinstance(url, basestring):
             url = normalize_url(url)
         elif isinstance(url, requests.Request):
@@ -340,6 +365,13 @@ class Browser(object):
         # We define an inner_callback here in order to execute the same code
         # regardless of is_async param.
         def inner_callback(future, response):
+            if startup_profiler.waiting_request:
+                startup_profiler.request_done()
+
+            for token in tokens:
+                # Nobody will read this response.
+                token.check(request=False)
+
             if allow_redirects:
                 response = self.handle_refresh(response)
 
@@ -356,6 +388,9 @@ class Browser(object):
                                      proxies=proxies,
                                      callback=inner_callback,
                                      is_async=is_async)
+        if is_async:
+            for token in tokens:
+                token.add_future(response)
         return response
 
     def async_open(self, url, **kwargs):
@@ -641,6 +676,7 @@ class PagesBrowser(DomainBrowser):
     """
 
     _urls = None
+    _url_router = None
 
     def __init__(self, *args, **kwargs):
         self.highlight_el = kwargs.pop('highlight_el', False)
@@ -678,12 +714,18 @@ class PagesBrowser(DomainBrowser):
         def internal_callback(response):
             # Try to handle the response page with an URL instance.
             response.page = None
-            for url in self._urls.values():
-                page = url.handle(response)
-                if page is not None:
-                    self.logger.debug('Handle %s with %s' % (response.url, page.__class__.__name__))
-                    response.page = page
-                    break
+            # Candidate pages share the documents they build from the
+            # response, see Page.SHARE_DOC.
+            response.page_docs = {}
+            try:
+                for name, match in self.get_url_router().match(response.url):
+                    page = self._urls[name].handle(response, match)
+                    if page is not None:
+                        self.logger.debug('Handle %s with %s' % (response.url, page.__class__.__name__))
+                        response.page = page
+                        break
+            finally:
+                del response.page_docs
 
             if response.page is None:
                 regexp = r'^(?P<proto>\w+)://.*'
@@ -702,18 +744,40 @@ class PagesBrowser(DomainBrowser):
 
         return super(PagesBrowser, self).open(callback=internal_callback, *args, **kwargs)
 
+    def get_url_router(self):
+        """
+        Get the router of URL objects with a page class, compiled again when
+        the URL patterns or :attr:`BASEURL` change.
+
+        :rtype: :class:`weboob.browser.url.URLRouter`
+        """
+        urls = [(name, url) for name, url in self._urls.items() if url.klass is not None]
+        router = self._url_router
+        if router is None or router.key != URLRouter.make_key(urls, self.BASEURL):
+            router = self._url_router = URLRouter(urls, self.BASEURL)
+        return router
+
     def location(self, *args, **kwargs):
         """
         Same method than
         :meth:`weboob.browser.browsers.Browser.location`, but if the
         url matches any :class:`URL` object, an attribute `page` is added to
         response, and the attribute :attr:`PagesBrowser.page` is set.
+
+        :param prefetched: future of the response, returned by
+                           :meth:`async_open`, to use instead of sending
+                           the request again
         """
+        prefetched = kwargs.pop('prefetched', None)
+
         if self.page is not None:
             # Call leave hook.
             self.page.on_leave()
 
-        response = self.open(*args, **kwargs)
+        if prefetched is not None:
+            response = prefetched.result()
+        else:
+            response = self.open(*args, **kwargs)
 
         self.response = response
         self.page = response.page
@@ -758,7 +822,9 @@ class PagesBrowser(DomainBrowser):
                 for r in func(*args, **kwargs):
                     yield r
             except NextPage as e:
-                self.location(e.request)
+                if self.cancel_token is not None:
+                    self.cancel_token.check()
+                self.location(e.request, prefetched=e.prefetched)
             else:
                 return
 
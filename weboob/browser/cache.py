@@ -17,37 +17,357 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ['CacheMixin']
+import errno
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from email.utils import mktime_tz, parsedate_tz
+from time import time
+
+from requests import Request, Response
+from requests.exceptions import ConnectionError, Timeout
+from requests.structures import CaseInsensitiveDict
+
+from weboob.tools.compat import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .exceptions import ServerError
+
+
+__all__ = ['CacheMixin', 'FileCacheStore']
+
+
+def parse_cache_control(value):
+    """
+    Parse a Cache-Control header.
+
+    >>> sorted(parse_cache_control('no-cache, max-age=60, stale-if-error="300"').items())
+    [('max-age', '60'), ('no-cache', None), ('stale-if-error', '300')]
+
+    :rtype: :class:`dict`
+    """
+    directives = {}
+    for directive in (value or '').split(','):
+        name, _, arg = directive.partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"') or None
+    return directives
+
+
+def parse_http_date(value):
+    """
+    Parse a HTTP date to a timestamp, or None if it is invalid.
+    """
+    try:
+        return mktime_tz(parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
 
 
 class CacheEntry(object):
-    def __init__(self, response):
+    """
+    Cached response, with its freshness information (RFC 7234).
+
+    :param response: response to cache
+    :type response: :class:`requests.Response`
+    :param vary: values of request headers listed by the Vary header of
+                 the response
+    :type vary: :class:`dict`
+    :param default_max_age: freshness lifetime when the response has no
+                            explicit one, in seconds
+    :type default_max_age: int
+    """
+
+    def __init__(self, response, vary=None, default_max_age=0):
         self.response = response
-        self.etag = response.headers.get('ETag')
-        self.last_modified = response.headers.get('Last-Modified')
+        self.vary = vary or {}
+        self.default_max_age = default_max_age
+        self.stored = time()
+        self.refresh(response)
+
+    def refresh(self, response):
+        """
+        Update freshness information with headers of a response to a
+        revalidation request (usually a 304).
+        """
+        if response is not self.response:
+            for name in ('Cache-Control', 'Expires', 'Date', 'ETag', 'Last-Modified', 'Age'):
+                if name in response.headers:
+                    self.response.headers[name] = response.headers[name]
+            self.stored = time()
+
+        headers = self.response.headers
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.cache_control = parse_cache_control(headers.get('Cache-Control'))
+
+        try:
+            self.age = max(0, int(headers.get('Age', 0)))
+        except ValueError:
+            self.age = 0
+
+        self.max_age = self.default_max_age
+        if 'max-age' in self.cache_control:
+            self.max_age = self._seconds('max-age')
+        elif 'Expires' in headers:
+            expires = parse_http_date(headers['Expires'])
+            date = parse_http_date(headers.get('Date')) or self.stored
+            # An invalid date means the response is already expired.
+            self.max_age = expires - date if expires is not None else 0
+        if 'no-cache' in self.cache_control:
+            self.max_age = 0
+
+    def _seconds(self, directive):
+        try:
+            return max(0, int(self.cache_control.get(directive) or 0))
+        except ValueError:
+            return 0
 
     def has_cache_key(self):
         return (self.etag or self.last_modified)
 
+    def is_storable(self, shared=False):
+        """
+        Whether the response can be stored.
+
+        :param shared: the store is shared or persistent, so responses for
+                       a single user (Cache-Control private) are not stored
+        :type shared: bool
+        """
+        return 'no-store' not in self.cache_control and \
+               not (shared and 'private' in self.cache_control) and \
+               '*' not in self.vary and \
+               (self.has_cache_key() or self.max_age > 0)
+
+    def current_age(self):
+        return self.age + time() - self.stored
+
+    def is_fresh(self):
+        """
+        Whether the response can be used without contacting the server.
+        """
+        return self.current_age() < self.max_age
+
+    def can_serve_stale(self, directive):
+        """
+        Whether the response, if stale, can be used anyway under a
+        directive (stale-while-revalidate or stale-if-error, RFC 5861).
+        """
+        if directive not in self.cache_control or 'must-revalidate' in self.cache_control:
+            return False
+        return self.current_age() < self.max_age + self._seconds(directive)
+
     def update_request(self, request):
         if self.last_modified:
             request.headers['If-Modified-Since'] = self.last_modified
         if self.etag:
             request.headers['If-None-Match'] = self.etag
 
+    def __getstate__(self):
+        # The request of the response can't be pickled, it may have hooks.
+        response = self.response
+        return {'url': response.url,
+                'status_code': response.status_code,
+                'reason': response.reason,
+                'headers': list(response.headers.items()),
+                'encoding': response.encoding,
+                'content': response.content,
+                'vary': self.vary,
+                'default_max_age': self.default_max_age,
+                'stored': self.stored,
+                }
+
+    def __setstate__(self, state):
+        response = Response()
+        response.url = state['url']
+        response.status_code = state['status_code']
+        response.reason = state['reason']
+        response.headers = CaseInsensitiveDict(state['headers'])
+        response.encoding = state['encoding']
+        response._content = state['content']
+        self.__init__(response, state['vary'], state['default_max_age'])
+        self.stored = state['stored']
+
+
+class FileCacheStore(object):
+    """
+    Cache store in a directory, which keeps responses between processes.
+
+    It can be used as :attr:`CacheMixin.cache`. Each entry is a file named
+    by the hash of its key, written atomically, so several processes can
+    share a store.
+
+    Entries older than `max_age` are removed, and when the store is larger
+    than `max_size`, the least recently used entries are removed.
+
+    :param path: directory of the store
+    :type path: str
+    :param max_size: maximum size of the store, in bytes
+    :type max_size: int
+    :param max_age: maximum age of entries, in seconds
+    :type max_age: int
+    :param compress: compress entries with zlib
+    :type compress: bool
+    """
+
+    MAX_SIZE = 50 * 1024 * 1024
+    MAX_AGE = 30 * 24 * 3600
+
+    shared = True
+    """
+    Entries are kept on disk, so private responses are not stored.
+    """
+
+    def __init__(self, path, max_size=MAX_SIZE, max_age=MAX_AGE, compress=True):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress = compress
+        # Size of the store, computed on first write.
+        self.size = None
+
+    def get_path(self, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def get(self, key, default=None):
+        path = self.get_path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime + self.max_age < time():
+                self._remove(path)
+                return default
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = pickle.loads(zlib.decompress(data[1:]) if data[:1] == b'Z' else data[1:])
+            # The access time is the date of last use, for eviction.
+            os.utime(path, (time(), mtime))
+        except (IOError, OSError):
+            return default
+        except Exception:
+            # Corrupted or written by an incompatible version.
+            self._remove(path)
+            return default
+        return entry
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, entry):
+        data = pickle.dumps(entry, 2)
+        data = b'Z' + zlib.compress(data) if self.compress else b'P' + data
+
+        path = self.get_path(key)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        fd, tmppath = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmppath, path)
+        except BaseException:
+            self._remove(tmppath)
+            raise
+
+        if self.size is None:
+            self.size = sum(size for _, size, _, _ in self._iter_files())
+        else:
+            self.size += len(data)
+        if self.size > self.max_size:
+            self.evict()
+
+    def __delitem__(self, key):
+        if not self._remove(self.get_path(key)):
+            raise KeyError(key)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            # Already removed by another process.
+            return False
+        return True
+
+    def _iter_files(self):
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_atime, st.st_mtime
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used entries until
+        the store is smaller than 90% of its maximum size.
+        """
+        now = time()
+        files = []
+        self.size = 0
+        for path, size, atime, mtime in self._iter_files():
+            if mtime + self.max_age < now:
+                self._remove(path)
+            else:
+                files.append((atime, size, path))
+                self.size += size
+
+        files.sort()
+        for atime, size, path in files:
+            if self.size <= self.max_size * 0.9:
+                break
+            self._remove(path)
+            self.size -= size
+
 
 class CacheMixin(object):
-    """Mixin to inherit in a Browser"""
+    """Mixin to inherit in a Browser
+
+    Responses are cached according to HTTP (RFC 7234): a fresh response
+    (Cache-Control max-age or Expires) is returned without any request, and
+    a stale one is revalidated with its ETag or Last-Modified. The
+    stale-while-revalidate and stale-if-error directives are supported,
+    and the Vary header is honoured.
+
+    :class:`weboob.browser.url.URL` objects of the browser can change the
+    caching of responses of their pages, with their `cache` and
+    `cache_ignore_params` arguments.
+
+    :param cache_store: store of the cache, see :attr:`cache`
+    """
+
+    CACHE_SESSION_COOKIES = ()
+    """
+    Names of cookies which identify the user, and are part of the cache key.
+    Other cookies (trackers, rotated tokens...) are ignored.
+    """
 
     def __init__(self, *args, **kwargs):
+        cache_store = kwargs.pop('cache_store', None)
         super(CacheMixin, self).__init__(*args, **kwargs)
 
-        self.cache = {}
+        self.cache = cache_store if cache_store is not None else {}
 
         """Cache store object
 
         To limit the size of the cache, a :class:`weboob.tools.lrudict.LimitedLRUDict`
-        instance can be used.
+        instance can be used. To keep it between processes, use a
+        :class:`FileCacheStore` instance.
         """
 
         self.is_updatable = True
@@ -57,42 +377,154 @@ class CacheMixin(object):
         If `False`, once a request has been successfully executed, its response
         will always be returned.
 
-        If `True`, the `ETag` and `Last-Modified` of the response will be
-        stored along with the cache. When the request is re-executed, instead
-        of simply returning the previous response, the server is queried to
-        check if a newer version of the page exists.
+        If `True`, the response is returned while it is fresh. Then, the
+        `ETag` and `Last-Modified` of the response are used to check with
+        the server if a newer version of the page exists.
         If a newer page exists, it is returned instead and overwrites the
         obsolete page in the cache.
         """
 
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_bytes_saved = 0
+
+    def deinit(self):
+        super(CacheMixin, self).deinit()
+        if self.cache_hits or self.cache_misses:
+            self.logger.debug('cache: %d hits, %d misses, %d bytes saved',
+                              self.cache_hits, self.cache_misses, self.cache_bytes_saved)
+
+    def get_cache_url(self, url):
+        """
+        Get the :class:`weboob.browser.url.URL` object with caching options
+        which matches this url, if any.
+        """
+        for url_object in (getattr(self, '_urls', None) or {}).values():
+            if (url_object.cache is not None or url_object.cache_ignore_params) and url_object.match(url):
+                return url_object
+
+    def normalize_cache_url(self, url, ignore_params=()):
+        """
+        Normalize an url for a cache key: the scheme and host are lower case,
+        default ports and the fragment are removed, and parameters of the
+        query are sorted.
+
+        :param ignore_params: names of query parameters to remove
+        :type ignore_params: list
+        """
+        scheme, netloc, path, query, _ = urlsplit(url)
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+        if (scheme, netloc.rpartition(':')[2]) in (('http', '80'), ('https', '443')):
+            netloc = netloc.rpartition(':')[0]
+        params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in ignore_params)
+        return urlunsplit((scheme, netloc, path or '/', urlencode(params), ''))
+
     def make_cache_key(self, request):
-        """Make a key for the cache corresponding to the request."""
+        """Make a key for the cache corresponding to the request.
+
+        The key is made of the method, the normalized url, the body and a
+        hash of the credentials sent with the request: the Authorization
+        header, from the request or its `auth`, and the cookies listed in
+        :attr:`CACHE_SESSION_COOKIES`. Other headers are handled with the
+        Vary header of responses.
+        """
+
+        url_object = self.get_cache_url(request.url)
+        ignore_params = url_object.cache_ignore_params if url_object is not None else ()
+        body = getattr(request, 'body', None) or getattr(request, 'data', None) or None
+        if isinstance(body, dict):
+            body = sorted(body.items())
+        return (request.method, self.normalize_cache_url(request.url, ignore_params), body,
+                self.get_credentials_hash(request))
+
+    def get_credentials_hash(self, request):
+        """
+        Get a hash of the Authorization header and of the session cookies
+        which would be sent with a request.
+        """
+        prepared = self.prepare_request(request) if isinstance(request, Request) else request
+        cookies = []
+        if self.CACHE_SESSION_COOKIES:
+            for cookie in (prepared.headers.get('Cookie') or '').split(';'):
+                name, _, value = cookie.strip().partition('=')
+                if name in self.CACHE_SESSION_COOKIES:
+                    cookies.append((name, value))
+        credentials = repr((prepared.headers.get('Authorization'), sorted(cookies)))
+        return hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+
+    def _request_header(self, request, name):
+        value = CaseInsensitiveDict(request.headers).get(name)
+        if value is None:
+            value = self.session.headers.get(name)
+        return value
 
-        body = getattr(request, 'body', None)
-        headers = tuple(request.headers.values())
-        return (request.method, request.url, body, headers)
+    def _get_vary(self, request, response):
+        names = [name.strip().lower() for name in response.headers.get('Vary', '').split(',') if name.strip()]
+        return dict((name, self._request_header(request, name)) for name in names)
+
+    def _cache_hit(self, request, entry, response=None):
+        self.logger.debug('cache HIT for %r', request.url)
+        if entry.response.request is None:
+            # Entry read from a FileCacheStore.
+            entry.response.request = response.request if response is not None else self.prepare_request(request)
+        self.cache_hits += 1
+        self.cache_bytes_saved += len(entry.response.content)
+        return entry.response
+
+    def _store(self, key, request, response, default_max_age, entry=None):
+        if response.status_code == 304 and entry is not None:
+            entry.refresh(response)
+        elif response.status_code == 200:
+            entry = CacheEntry(response, self._get_vary(request, response), default_max_age)
+        else:
+            return
+
+        if entry.is_storable(shared=getattr(self.cache, 'shared', False)):
+            self.logger.debug('storing %r response in cache', request.url)
+            self.cache[key] = entry
 
     def open_with_cache(self, url, **kwargs):
         """Perform a request using the cache if possible."""
         request = self.build_request(url, **kwargs)
 
+        url_object = self.get_cache_url(request.url)
+        if url_object is not None and url_object.cache is False:
+            return super(CacheMixin, self).open(request, **kwargs)
+        default_max_age = 0
+        if url_object is not None and not isinstance(url_object.cache, bool) and url_object.cache is not None:
+            default_max_age = url_object.cache
+
         key = self.make_cache_key(request)
-        if key in self.cache:
-            if not self.is_updatable:
-                self.logger.debug('cache HIT for %r', request.url)
-                return self.cache[key].response
-            else:
-                self.cache[key].update_request(request)
+        entry = self.cache.get(key)
+        if entry is not None and any(self._request_header(request, name) != value
+                                     for name, value in entry.vary.items()):
+            entry = None
 
-        response = super(CacheMixin, self).open(request, **kwargs)
-        if response.status_code == 304:
-            self.logger.debug('cache HIT for %r', request.url)
-            return self.cache[key].response
-        elif response.status_code == 200:
-            entry = CacheEntry(response)
-            if entry.has_cache_key():
-                self.logger.debug('storing %r response in cache', request.url)
-                self.cache[key] = entry
+        if entry is not None:
+            if not self.is_updatable or entry.is_fresh():
+                return self._cache_hit(request, entry)
+
+            entry.update_request(request)
+            if entry.can_serve_stale('stale-while-revalidate'):
+                self.logger.debug('revalidating %r in background', request.url)
+                super(CacheMixin, self).open(request, is_async=True,
+                                             callback=lambda response: self._store(key, request, response,
+                                                                                   default_max_age, entry))
+                return self._cache_hit(request, entry)
+
+        try:
+            response = super(CacheMixin, self).open(request, **kwargs)
+        except (ServerError, ConnectionError, Timeout) as e:
+            if entry is not None and entry.can_serve_stale('stale-if-error'):
+                self.logger.debug('using stale %r response after error: %s', request.url, e)
+                return self._cache_hit(request, entry)
+            raise
+
+        self._store(key, request, response, default_max_age, entry)
+        if response.status_code == 304 and entry is not None:
+            return self._cache_hit(request, entry, response)
 
         self.logger.debug('cache MISS for %r', request.url)
+        self.cache_misses += 1
         return response
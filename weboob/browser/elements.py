@@ -29,9 +29,11 @@ import traceback
 import lxml.html
 
 from weboob.tools.log import getLogger, DEBUG_FILTERS
+from weboob.tools.cancel import CancelToken
 from weboob.tools.compat import basestring, unicode, with_metaclass
-from weboob.browser.pages import NextPage
+from weboob.browser.pages import NextPage, select_css, select_xpath
 
+from .filters.base import filters_logger
 from .filters.standard import _Filter, CleanText
 from .filters.html import AttributeNotFound, XPathNotFound
 
@@ -58,6 +60,8 @@ def method(klass):
 class AbstractElement(object):
     _creation_counter = 0
     condition = None
+    _loaders = None
+    _logger = None
 
     def __init__(self, page, parent=None, el=None):
         self.page = page
@@ -97,18 +101,39 @@ class AbstractElement(object):
     def parse(self, obj):
         pass
 
-    def cssselect(self, *args, **kwargs):
-        return self.el.cssselect(*args, **kwargs)
+    def cssselect(self, selector, **kwargs):
+        return select_css(self.el, selector, **kwargs)
+
+    def xpath(self, path, **kwargs):
+        return select_xpath(self.el, path, **kwargs)
+
+    @classmethod
+    def get_logger(cls):
+        """
+        Get the logger of elements of this class, created once.
+        """
+        if '_logger' not in cls.__dict__:
+            cls._logger = getLogger(cls.__name__.lower())
+        return cls._logger
 
-    def xpath(self, *args, **kwargs):
-        return self.el.xpath(*args, **kwargs)
+    @classmethod
+    def get_loaders(cls):
+        """
+        Get (name, attribute name) of load_* attributes of this class, found
+        once.
+        """
+        if '_loaders' not in cls.__dict__:
+            # Built before being published, as other threads may read it.
+            loaders = []
+            for attrname in dir(cls):
+                m = re.match('load_(.*)', attrname)
+                if m:
+                    loaders.append((m.group(1), attrname))
+            cls._loaders = loaders
+        return cls._loaders
 
     def handle_loaders(self):
-        for attrname in dir(self):
-            m = re.match('load_(.*)', attrname)
-            if not m:
-                continue
-            name = m.group(1)
+        for name, attrname in self.get_loaders():
             if name in self.loaders:
                 continue
             loader = getattr(self, attrname)
@@ -119,12 +144,32 @@ class ListElement(AbstractElement):
     item_xpath = None
     flush_at_end = False
     ignore_duplicate = False
+    # Start to load the page of next_page before returning items, so it is
+    # downloaded and parsed (by a PagesBrowser) while items are consumed.
+    prefetch_next_page = False
+    _elements = None
 
     def __init__(self, *args, **kwargs):
         super(ListElement, self).__init__(*args, **kwargs)
-        self.logger = getLogger(self.__class__.__name__.lower())
+        self.logger = self.get_logger()
         self.objects = OrderedDict()
 
+    @classmethod
+    def get_elements(cls):
+        """
+        Get element classes of this class, which are built for each node
+        found by :meth:`find_elements`, found once.
+        """
+        if '_elements' not in cls.__dict__:
+            # Built before being published, as other threads may read it.
+            elements = []
+            for attrname in dir(cls):
+                attr = getattr(cls, attrname)
+                if isinstance(attr, type) and issubclass(attr, AbstractElement) and attr != cls:
+                    elements.append(attr)
+            cls._elements = elements
+        return cls._elements
+
     def __call__(self, *args, **kwargs):
         for key, value in kwargs.items():
             self.env[key] = value
@@ -138,7 +183,7 @@ class ListElement(AbstractElement):
         sufficient.
         """
         if self.item_xpath is not None:
-            for el in self.el.xpath(self.item_xpath):
+            for el in select_xpath(self.el, self.item_xpath):
                 yield el
         else:
             yield self.el
@@ -150,43 +195,66 @@ class ListElement(AbstractElement):
         self.parse(self.el)
 
         items = []
+        elements = self.get_elements()
         for el in self.find_elements():
-            for attrname in dir(self):
-                attr = getattr(self, attrname)
-                if isinstance(attr, type) and issubclass(attr, AbstractElement) and attr != type(self):
-                    item = attr(self.page, self, el)
-                    if item.condition is not None and not item.condition():
-                        continue
-
-                    item.handle_loaders()
-                    items.append(item)
-
-        for item in items:
-            for obj in item:
-                obj = self.store(obj)
-                if obj and not self.flush_at_end:
-                    yield obj
+            for klass in elements:
+                item = klass(self.page, self, el)
+                if item.condition is not None and not item.condition():
+                    continue
+
+                item.handle_loaders()
+                items.append(item)
 
-        if self.flush_at_end:
-            for obj in self.flush():
-                yield obj
+        next_page = prefetched = None
+        if self.prefetch_next_page:
+            next_page = self.get_next_page()
+            if next_page is not None:
+                prefetch_token = CancelToken()
+                prefetched = self.page.browser.async_open(next_page, cancel_token=prefetch_token)
+
+        cancel_token = getattr(self.page.browser, 'cancel_token', None)
+        done = False
+        try:
+            for item in items:
+                if cancel_token is not None:
+                    # Do not parse items which will not be read.
+                    cancel_token.check(request=False)
+
+                for obj in item:
+                    obj = self.store(obj)
+                    if obj and not self.flush_at_end:
+                        yield obj
+
+            if self.flush_at_end:
+                for obj in self.flush():
+                    yield obj
+            done = True
+        finally:
+            if prefetched is not None and not done:
+                # The next page will not be read: do not send the request,
+                # or drop its response before it is parsed.
+                prefetch_token.cancel()
 
+        if prefetched is not None:
+            raise NextPage(next_page, prefetched)
         self.check_next_page()
 
     def flush(self):
         for obj in self.objects.values():
             yield obj
 
-    def check_next_page(self):
+    def get_next_page(self):
         if not hasattr(self, 'next_page'):
-            return
+            return None
 
         next_page = getattr(self, 'next_page')
         try:
-            value = self.use_selector(next_page)
+            return self.use_selector(next_page)
         except (AttributeNotFound, XPathNotFound):
-            return
+            return None
 
+    def check_next_page(self):
+        value = self.get_next_page()
         if value is None:
             return
 
@@ -228,12 +296,13 @@ class _ItemElementMeta(type):
         attrs['_class_file'], attrs['_class_line'] = traceback.extract_stack()[-2][:2]
         new_class = super(_ItemElementMeta, mcs).__new__(mcs, name, bases, attrs)
         new_class._attrs = _attrs + [f[0] for f in filters]
+        new_class._attrnames = [(attr, 'obj_%s' % attr) for attr in new_class._attrs]
         return new_class
 
 
 class ItemElement(with_metaclass(_ItemElementMeta, AbstractElement)):
     _attrs = None
-    _loaders = None
+    _attrnames = None
     klass = None
     validate = None
 
@@ -242,7 +311,7 @@ class ItemElement(with_metaclass(_ItemElementMeta, AbstractElement)):
 
     def __init__(self, *args, **kwargs):
         super(ItemElement, self).__init__(*args, **kwargs)
-        self.logger = getLogger(self.__class__.__name__.lower())
+        self.logger = self.get_logger()
         self.obj = None
         self.saved_attrib = {}  # safer way would be to clone lxml tree
 
@@ -303,8 +372,8 @@ class ItemElement(with_metaclass(_ItemElementMeta, AbstractElement)):
                     self.obj = self.build_object()
                 self.parse(self.el)
                 self.handle_loaders()
-                for attr in self._attrs:
-                    self.handle_attr(attr, getattr(self, 'obj_%s' % attr))
+                for attr, attrname in self._attrnames:
+                    self.handle_attr(attr, getattr(self, attrname))
             except SkipItem:
                 return
 
@@ -330,8 +399,7 @@ class ItemElement(with_metaclass(_ItemElementMeta, AbstractElement)):
             # If we are here, we have probably a real parsing issue
             self.logger.warning('Attribute %s (in %s:%s) raises %s', key, self._class_file, self._class_line, repr(e))
             raise
-        logger = getLogger('b2filters')
-        logger.log(DEBUG_FILTERS, "%s.%s = %r" % (self._random_id, key, value))
+        filters_logger.log(DEBUG_FILTERS, "%s.%s = %r", self._random_id, key, value)
         setattr(self.obj, key, value)
 
 
@@ -354,7 +422,7 @@ class TableElement(ListElement):
                 columns[m.group(1)] = [s.lower() if isinstance(s, (str, unicode)) else s for s in cols]
 
         colnum = 0
-        for el in self.el.xpath(self.head_xpath):
+        for el in select_xpath(self.el, self.head_xpath):
             title = self.cleaner.clean(el)
             for name, titles in columns.items():
                 if name in self._cols:
@@ -21,6 +21,7 @@ from functools import wraps
 
 import lxml.html
 
+from weboob.browser.pages import select_xpath
 from weboob.exceptions import ParseError
 from weboob.tools.compat import unicode, basestring
 from weboob.tools.log import getLogger, DEBUG_FILTERS
@@ -87,6 +88,9 @@ class _Filter(object):
             el.attrib['title'] = 'weboob field: %s' % self._key
 
 
+filters_logger = getLogger('b2filters')
+
+
 def debug(*args):
     """
     A decorator function to provide some debug information
@@ -96,7 +100,9 @@ def debug(*args):
     def wraper(function):
         @wraps(function)
         def print_debug(self, value):
-            logger = getLogger('b2filters')
+            if not filters_logger.isEnabledFor(DEBUG_FILTERS):
+                return function(self, value)
+
             result = ''
             outputvalue = value
             if isinstance(value, list):
@@ -125,7 +131,7 @@ def debug(*args):
                     continue
                 result += ", %s=%r" % (arg, getattr(self, arg))
             result += u')'
-            logger.log(DEBUG_FILTERS, result)
+            filters_logger.log(DEBUG_FILTERS, result)
             res = function(self, value)
             return res
         return print_debug
@@ -157,7 +163,7 @@ class Filter(_Filter):
 
     def select(self, selector, item):
         if isinstance(selector, basestring):
-            ret = item.xpath(selector)
+            ret = select_xpath(item, selector)
         elif isinstance(selector, _Filter):
             selector._key = self._key
             selector._obj = self._obj
@@ -20,6 +20,7 @@
 
 import lxml.html as html
 
+from weboob.browser.pages import select_css, select_xpath
 from weboob.exceptions import ParseError
 from weboob.tools.compat import basestring, unicode, urljoin
 from weboob.tools.html import html2text
@@ -53,7 +54,7 @@ class CSS(_Selector):
     will take the text of all ``<div>`` having CSS class "main".
     """
     def select(self, selector, item):
-        ret = item.cssselect(selector)
+        ret = select_css(item, selector)
         if isinstance(ret, list):
             for el in ret:
                 if isinstance(el, html.HtmlElement):
@@ -188,10 +189,10 @@ class FormValue(Filter):
         elif el.tag == 'textarea':
             return unicode(el.text)
         elif el.tag == 'select':
-            options = el.xpath('.//option[@selected]')
+            options = select_xpath(el, './/option[@selected]')
             # default is the first one
             if len(options) == 0:
-                options = el.xpath('.//option[1]')
+                options = select_xpath(el, './/option[1]')
             return u'\n'.join([unicode(o.text) for o in options])
         else:
             raise UnrecognizedElement('Element %s is recognized' % el)
@@ -32,6 +32,7 @@ from weboob.capabilities.base import empty
 from weboob.capabilities.base import Currency as BaseCurrency
 from weboob.tools.compat import basestring, unicode, long
 from weboob.exceptions import ParseError
+from weboob.browser.pages import select_xpath
 from weboob.browser.url import URL
 from weboob.tools.compat import parse_qs, urlparse
 
@@ -208,7 +209,7 @@ class TableCell(_Filter):
         for name in self.names:
             idx = item.parent.get_colnum(name)
             if idx is not None:
-                ret = item.xpath(self.td % (idx + 1))
+                ret = select_xpath(item, self.td % (idx + 1))
                 for el in ret:
                     self.highlight_el(el, item)
                 return ret
@@ -310,7 +311,7 @@ class CleanText(Filter):
             if children:
                 txt = [t.strip() for t in txt.itertext()]
             else:
-                txt = [t.strip() for t in txt.xpath('./text()')]
+                txt = [t.strip() for t in select_xpath(txt, './text()')]
             txt = u' '.join(txt)  # 'foo   bar'
         if newlines:
             txt = re.compile(u'\s+', flags=re.UNICODE).sub(u' ', txt)  # 'foo bar'
@@ -27,6 +27,7 @@ import codecs
 from cgi import parse_header
 from functools import reduce
 import re
+import sys
 
 import requests
 
@@ -37,6 +38,81 @@ from weboob.tools.pdf import decompress_pdf
 from .exceptions import LoggedOut
 
 
+# Compiled XPath expressions and CSS selectors, shared by pages, elements and
+# filters. Custom XPath functions (see HTMLPage.define_xpath_functions()) are
+# looked up when expressions are evaluated.
+_selectors = {}
+
+MAX_SELECTORS = 2000
+"""
+Maximum number of compiled expressions kept, the cache is emptied when it is
+reached.
+"""
+
+
+def compile_xpath(path):
+    """
+    Compile a XPath expression, once.
+
+    :rtype: :class:`lxml.etree.XPath`
+    """
+    try:
+        return _selectors[path]
+    except KeyError:
+        from lxml import etree
+        compiled = etree.XPath(path)
+        if len(_selectors) >= MAX_SELECTORS:
+            _selectors.clear()
+        _selectors[path] = compiled
+        return compiled
+
+
+def compile_css(selector, translator='html'):
+    """
+    Compile a CSS selector to a XPath expression, once.
+
+    :rtype: :class:`lxml.cssselect.CSSSelector`
+    """
+    key = ('css', selector, translator)
+    try:
+        return _selectors[key]
+    except KeyError:
+        from lxml.cssselect import CSSSelector
+        compiled = CSSSelector(selector, translator=translator)
+        if len(_selectors) >= MAX_SELECTORS:
+            _selectors.clear()
+        _selectors[key] = compiled
+        return compiled
+
+
+def select_xpath(el, path, **kwargs):
+    """
+    Same as `el.xpath(path, **kwargs)`, with the expression compiled once if
+    `el` is a lxml element or tree.
+    """
+    # If lxml is not imported yet, el is not a lxml object.
+    etree = sys.modules.get('lxml.etree')
+    if kwargs or etree is None or not isinstance(el, (etree._Element, etree._ElementTree)):
+        return el.xpath(path, **kwargs)
+    try:
+        compiled = _selectors[path]
+    except KeyError:
+        compiled = compile_xpath(path)
+    return compiled(el)
+
+
+def select_css(el, selector, **kwargs):
+    """
+    Same as `el.cssselect(selector, **kwargs)`, with the selector compiled once
+    if `el` is a lxml element.
+    """
+    etree = sys.modules.get('lxml.etree')
+    if kwargs or etree is None or not isinstance(el, etree._Element):
+        return el.cssselect(selector, **kwargs)
+    from lxml.html import HtmlMixin
+    return compile_css(selector, 'html' if isinstance(el, HtmlMixin) else 'xml')(el)
+
+
 def pagination(func):
     r"""
     This helper decorator can be used to handle pagination pages easily.
@@ -74,7 +150,7 @@ def pagination(func):
                 for r in func(page, *args, **kwargs):
                     yield r
             except NextPage as e:
-                result = page.browser.location(e.request)
+                result = page.browser.location(e.request, prefetched=e.prefetched)
                 page = result.page
             else:
                 return
@@ -88,11 +164,16 @@ class NextPage(Exception):
     go on the next page.
 
     See :meth:`PagesBrowser.pagination` or decorator :func:`pagination`.
+
+    :param request: url or Request object of the next page
+    :param prefetched: future of the response of the next page, if it has
+                       already been requested with `async_open`
     """
 
-    def __init__(self, request):
+    def __init__(self, request, prefetched=None):
         super(NextPage, self).__init__()
         self.request = request
+        self.prefetched = prefetched
 
 
 class Page(object):
@@ -129,6 +210,25 @@ class Page(object):
     :class:`LoginBrowser` and the :func:`need_login` decorator.
     """
 
+    SHARE_DOC = False
+    """
+    Set it to True if the document only depends on :attr:`data` and
+    :attr:`encoding`, and is not modified after it is built, so it can be
+    shared with other pages built from the same response by the same methods,
+    when the browser tries several page classes for a response.
+    """
+
+    docs_built = 0
+    """
+    Number of documents built by pages since the start of the process.
+    """
+
+    docs_rebuilt = 0
+    """
+    Number of documents built again because :meth:`detect_encoding` found
+    another encoding than the one used to build them.
+    """
+
     def __init__(self, browser, response, params=None, encoding=None):
         self.browser = browser
         self.logger = getLogger(self.__class__.__name__.lower(), browser.logger)
@@ -140,15 +240,55 @@ class Page(object):
         self.forced_encoding = encoding or self.ENCODING
         if self.forced_encoding:
             self.response.encoding = self.forced_encoding
+
+        # Documents already built from this response, see
+        # PagesBrowser.open().
+        docs = getattr(self.response, 'page_docs', None) if self.SHARE_DOC else None
+        if docs is not None:
+            key = self.get_doc_key()
+            if key in docs:
+                self.response.encoding, self.doc = docs[key]
+                return
+
+        # Look for a document-level encoding declaration in the content, to
+        # build the document only once.
+        header_encoding = self.response.encoding
+        if not self.forced_encoding:
+            encoding = self.prescan_encoding()
+            if encoding:
+                self.response.encoding = encoding
+
         self.doc = self.build_doc(self.data)
+        Page.docs_built += 1
 
         # Last chance to change encoding, according to :meth:`detect_encoding`,
         # which can be used to detect a document-level encoding declaration
         if not self.forced_encoding:
-            encoding = self.detect_encoding()
-            if encoding and encoding != self.encoding:
-                self.response.encoding = encoding
+            # Without declaration in the document, the encoding of headers
+            # is used, not the one found by prescan_encoding().
+            built_encoding, self.response.encoding = self.response.encoding, header_encoding
+            encoding = self.detect_encoding() or built_encoding
+            self.response.encoding = encoding
+            if encoding != built_encoding:
                 self.doc = self.build_doc(self.data)
+                Page.docs_built += 1
+                Page.docs_rebuilt += 1
+
+        if docs is not None:
+            docs[key] = docs[self.get_doc_key()] = (self.encoding, self.doc)
+
+    def get_doc_key(self):
+        """
+        Get a key of the document built by this page, which identifies the
+        methods used to build it and the encoding of the response.
+        """
+        cls = type(self)
+        # The constructor of a subclass may change the document.
+        return (getattr(cls.__init__, '__func__', cls.__init__),
+                getattr(cls.build_doc, '__func__', cls.build_doc),
+                getattr(cls.prescan_encoding, '__func__', cls.prescan_encoding),
+                getattr(cls.detect_encoding, '__func__', cls.detect_encoding),
+                cls.data, bool(self.forced_encoding), self.encoding)
 
     # Encoding issues are delegated to Response instance, implemented by
     # requests module.
@@ -202,6 +342,15 @@ class Page(object):
         """
         raise NotImplementedError()
 
+    def prescan_encoding(self):
+        """
+        Override this method to detect the encoding of the document from
+        :attr:`data` before the document is built, if it is cheap. It should
+        find the same encoding as :meth:`detect_encoding`, which is still
+        called on the built document.
+        """
+        return None
+
     def detect_encoding(self):
         """
         Override this method to implement detection of document-level encoding
@@ -536,6 +685,18 @@ class HTMLPage(Page):
     Default value is None, means refreshes aren't handled.
     """
 
+    PRESCAN_SIZE = 4096
+    """
+    Number of bytes of the content in which :meth:`prescan_encoding` looks for
+    encoding declarations.
+    """
+
+    HEAD_END_RE = re.compile(br'</head\b|<body\b', re.IGNORECASE)
+    SKIPPED_RE = re.compile(br'<!--.*?(?:-->|$)|<(script|style|textarea|title)\b.*?(?:</\1\s*>|$)',
+                            re.IGNORECASE | re.DOTALL)
+    META_RE = re.compile(br'<meta\s([^>]*)>', re.IGNORECASE)
+    ATTRIBUTE_RE = re.compile(br'([\w-]+)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s>]+)')
+
     def __init__(self, *args, **kwargs):
         import lxml.html as html
         ns = html.etree.FunctionNamespace(None)
@@ -638,6 +799,40 @@ class HTMLPage(Page):
         parser = html.HTMLParser(encoding=encoding)
         return html.parse(BytesIO(content), parser)
 
+    def prescan_encoding(self):
+        """
+        Look for encoding in "http-equiv" and "charset" meta tags of the first
+        :attr:`PRESCAN_SIZE` bytes of the content, as :meth:`detect_encoding`
+        does in the document. Comments and contents of scripts are skipped.
+        """
+        if getattr(type(self).detect_encoding, '__func__', type(self).detect_encoding) \
+           is not getattr(HTMLPage.detect_encoding, '__func__', HTMLPage.detect_encoding):
+            return None
+
+        head = self.data
+        if not isinstance(head, bytes):
+            return None
+        head = self.SKIPPED_RE.sub(b'', head[:self.PRESCAN_SIZE])
+        head = self.HEAD_END_RE.split(head, 1)[0]
+
+        metas = [dict((name.lower(), value.strip(b'\'"')) for name, value in self.ATTRIBUTE_RE.findall(tag))
+                 for tag in self.META_RE.findall(head)]
+
+        encoding = self.encoding
+        for attrs in metas:
+            if attrs.get(b'http-equiv', b'').lower() == b'content-type' and b'content' in attrs:
+                # meta http-equiv=content-type content=...
+                _, params = parse_header(attrs[b'content'].decode('latin-1'))
+                if 'charset' in params:
+                    encoding = params['charset'].strip("'\"")
+
+        for attrs in metas:
+            if b'charset' in attrs:
+                # meta charset=...
+                encoding = attrs[b'charset'].decode('latin-1').lower()
+
+        return self.check_encoding(encoding)
+
     def detect_encoding(self):
         """
         Look for encoding in the document "http-equiv" and "charset" meta nodes.
@@ -653,6 +848,12 @@ class HTMLPage(Page):
             # meta charset=...
             encoding = charset.lower()
 
+        return self.check_encoding(encoding)
+
+    def check_encoding(self, encoding):
+        """
+        Get the encoding used to decode a document declared with this encoding.
+        """
         if encoding == 'iso-8859-1' or not encoding:
             encoding = 'windows-1252'
         try:
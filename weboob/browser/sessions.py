@@ -20,10 +20,13 @@
 # Inspired by: https://github.com/ross/requests-futures/blob/master/requests_futures/sessions.py
 # XXX Licence issues?
 
+from copy import copy
+from threading import Lock
+
 try:
-    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import Future, ThreadPoolExecutor
 except ImportError:
-    ThreadPoolExecutor = None
+    Future = ThreadPoolExecutor = None
 
 from requests import Session
 from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
@@ -101,6 +104,11 @@ class WeboobSession(Session):
 
 
 class FuturesSession(WeboobSession):
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    """
+    Methods of requests which can be coalesced.
+    """
+
     def __init__(self, executor=None, max_workers=2, max_retries=2, *args, **kwargs):
         """Creates a FuturesSession
 
@@ -112,8 +120,17 @@ class FuturesSession(WeboobSession):
 
         * If you provide both `executor` and `max_workers`, the latter is
           ignored and provided executor is used as is.
+
+        * When `coalesce` is True, identical requests (same method, URL,
+          headers and body) sent while one of them is in flight wait for its response
+          instead of being sent, and each one gets its own copy of the
+          response. The `coalesced` attribute counts these requests.
         """
         super(FuturesSession, self).__init__(*args, **kwargs)
+        self.coalesce = False
+        self.coalesced = 0
+        self._inflight = {}
+        self._inflight_lock = Lock()
         if executor is None and ThreadPoolExecutor is not None:
             executor = ThreadPoolExecutor(max_workers=max_workers)
             # set connection pool size equal to max_workers if needed
@@ -148,7 +165,10 @@ class FuturesSession(WeboobSession):
         callback = kwargs.pop('callback', lambda future, response: response)
         is_async = kwargs.pop('is_async', False)
         def func(*args, **kwargs):
-            resp = sup(*args, **kwargs)
+            if self.coalesce and Future is not None and not kwargs.get('stream'):
+                resp = self.send_coalesced(sup, *args, **kwargs)
+            else:
+                resp = sup(*args, **kwargs)
             return callback(self, resp)
 
         if is_async:
@@ -158,6 +178,58 @@ class FuturesSession(WeboobSession):
 
         return func(*args, **kwargs)
 
+    def send_coalesced(self, send, request, **kwargs):
+        """
+        Send a request with `send`, unless an identical request is already
+        in flight: then wait for its response and return a copy.
+        """
+        if request.method not in self.IDEMPOTENT_METHODS:
+            return send(request, **kwargs)
+
+        # Requests with other headers (Accept, Range, Authorization,
+        # cookies...) may get other responses.
+        headers = tuple(sorted((name.lower(), value) for name, value in request.headers.items()))
+        key = (request.method, request.url, request.body, headers)
+        with self._inflight_lock:
+            inflight = self._inflight.get(key)
+            sender = inflight is None
+            if sender:
+                inflight = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not sender:
+            return self.copy_response(inflight.result(), request)
+
+        try:
+            response = send(request, **kwargs)
+        except BaseException as e:
+            with self._inflight_lock:
+                self._inflight.pop(key)
+            inflight.set_exception(e)
+            raise
+
+        with self._inflight_lock:
+            self._inflight.pop(key)
+        # Share a copy, as callbacks of the sender may change the response.
+        inflight.set_result(self.copy_response(response, request))
+        return response
+
+    @staticmethod
+    def copy_response(response, request):
+        """
+        Copy a response, which can be changed independently of the original
+        one, for another request.
+        """
+        # Response.__getstate__() reads the content, and doesn't keep the
+        # raw stream.
+        response = copy(response)
+        response.headers = CaseInsensitiveDict(response.headers)
+        response.history = list(response.history)
+        response.cookies = response.cookies.copy()
+        response.request = request
+        return response
+
     def close(self):
         super(FuturesSession, self).close()
         if self.executor:
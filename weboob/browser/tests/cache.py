@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+from threading import Thread
+from email.utils import formatdate
+from time import sleep, time
+from unittest import TestCase
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from weboob.browser import Browser, PagesBrowser, URL
+from weboob.browser.cache import CacheEntry, CacheMixin, FileCacheStore
+from weboob.browser.exceptions import ServerError
+from weboob.tools.backend import Module
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        path = self.path.split('?')[0]
+        status, headers = self.server.responses.get(path, (200, {'ETag': '"%s"' % path}))
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if 'ETag' in headers and self.headers.get('If-None-Match') == headers['ETag']:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        body = ('content of %s %s' % (self.path, self.headers.get('Accept-Language'))).encode('ascii') * 100
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CachedBrowser(CacheMixin, Browser):
+    pass
+
+
+class CachedPagesBrowser(CacheMixin, PagesBrowser):
+    never = URL('/never', cache=False)
+    day = URL('/day', cache=24 * 3600)
+    search = URL(r'/search\?.*', cache_ignore_params=['session'])
+
+
+class CacheModule(Module):
+    NAME = 'cache'
+    BROWSER = CachedBrowser
+    CACHE_DIR = 'cache'
+
+
+class MemoryCacheModule(CacheModule):
+    CACHE_DIR = None
+
+
+class FakeRepositories(object):
+    def __init__(self, datadir):
+        self.datadir = datadir
+
+
+class FakeWeboob(object):
+    def __init__(self, datadir):
+        self.repositories = FakeRepositories(datadir)
+
+
+class ServerTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.requests = []
+        self.server.responses = {}
+        self.thread = Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+
+class CacheTest(ServerTestCase):
+    def create_store(self, **kwargs):
+        return FileCacheStore(os.path.join(self.tmpdir, 'cache'), **kwargs)
+
+    def test_store(self):
+        store = self.create_store()
+        browser = CachedBrowser()
+        response = browser.open(self.url + '/page')
+
+        self.assertNotIn('key', store)
+        store['key'] = CacheEntry(response)
+        entry = self.create_store()['key']
+        self.assertEqual(entry.response.content, response.content)
+        self.assertEqual(entry.response.headers['etag'], '"/page"')
+        self.assertEqual(entry.etag, '"/page"')
+        self.assertEqual(entry.response.status_code, 200)
+
+        del store['key']
+        self.assertIsNone(store.get('key'))
+        with self.assertRaises(KeyError):
+            store['key']
+
+    def test_shared(self):
+        browser = CachedBrowser(cache_store=self.create_store())
+        content = browser.open_with_cache(self.url + '/page').content
+        self.assertEqual(browser.cache_misses, 1)
+
+        # A new process.
+        browser = CachedBrowser(cache_store=self.create_store())
+        response = browser.open_with_cache(self.url + '/page')
+        self.assertEqual(response.content, content)
+        self.assertEqual(response.request.url, self.url + '/page')
+        self.assertEqual(self.server.requests, ['/page', '/page'])
+        self.assertEqual((browser.cache_hits, browser.cache_misses, browser.cache_bytes_saved),
+                         (1, 0, len(content)))
+
+        browser.is_updatable = False
+        self.assertEqual(browser.open_with_cache(self.url + '/page').content, content)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_private(self):
+        self.server.responses['/private'] = (200, {'Cache-Control': 'private, max-age=60'})
+        browser = CachedBrowser(cache_store=self.create_store())
+        browser.open_with_cache(self.url + '/private')
+        self.assertNotIn(browser.make_cache_key(browser.build_request(self.url + '/private')), browser.cache)
+
+        # Only kept in the memory of this browser.
+        browser = CachedBrowser()
+        browser.open_with_cache(self.url + '/private')
+        self.assertEqual(len(browser.cache), 1)
+
+    def cache_path(self, browser, path):
+        return browser.cache.get_path(browser.make_cache_key(browser.build_request(self.url + path)))
+
+    def test_max_age(self):
+        browser = CachedBrowser(cache_store=self.create_store(max_age=60))
+        browser.is_updatable = False
+        browser.open_with_cache(self.url + '/page')
+
+        os.utime(self.cache_path(browser, '/page'), (time() - 120, time() - 120))
+        browser.open_with_cache(self.url + '/page')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_max_size(self):
+        store = self.create_store(compress=False)
+        browser = CachedBrowser(cache_store=store)
+        browser.is_updatable = False
+
+        now = time()
+        for path, atime in (('/recent', now - 10), ('/old', now - 300), ('/older', now - 200)):
+            browser.open_with_cache(self.url + path)
+            mtime = os.stat(self.cache_path(browser, path)).st_mtime
+            os.utime(self.cache_path(browser, path), (atime, mtime))
+
+        # Least recently used entries are removed.
+        store.max_size = store.size / 3 * 3.5
+        browser.open_with_cache(self.url + '/new')
+        self.assertLessEqual(store.size, store.max_size * 0.9)
+        self.assertEqual(len(list(store._iter_files())), 3)
+        self.assertFalse(os.path.exists(self.cache_path(browser, '/old')))
+
+        for path in ('/recent', '/older', '/new'):
+            browser.open_with_cache(self.url + path)
+        self.assertEqual(self.server.requests, ['/recent', '/old', '/older', '/new'])
+
+    def test_corrupted(self):
+        store = self.create_store()
+        browser = CachedBrowser(cache_store=store)
+        browser.open_with_cache(self.url + '/page')
+        for path, _, _, _ in store._iter_files():
+            with open(path, 'wb') as f:
+                f.write(b'Zgarbage')
+
+        browser.is_updatable = False
+        browser.open_with_cache(self.url + '/page')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(browser.cache_misses, 2)
+
+    def test_module(self):
+        weboob = FakeWeboob(self.tmpdir)
+        backends = [CacheModule(weboob, name) for name in ('b1', 'b2')]
+        backends[0].browser.open_with_cache(self.url + '/page')
+        # Backends, which may use other accounts, don't share responses.
+        backends[1].browser.open_with_cache(self.url + '/page')
+        self.assertEqual(backends[1].browser.cache_hits, 0)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'cache', 'b1')))
+        self.assertTrue(os.path.isdir(os.path.join(self.tmpdir, 'cache', 'b2')))
+
+        # But a new instance of a backend does.
+        backend = CacheModule(weboob, 'b1')
+        backend.browser.open_with_cache(self.url + '/page')
+        self.assertEqual(backend.browser.cache_hits, 1)
+
+        # Disk stores are opt-in.
+        backend = MemoryCacheModule(weboob, 'b3')
+        self.assertEqual(backend.browser.cache, {})
+
+
+class FreshnessTest(ServerTestCase):
+    def setUp(self):
+        super(FreshnessTest, self).setUp()
+        self.browser = CachedPagesBrowser(baseurl=self.url)
+
+    def open(self, path, **kwargs):
+        return self.browser.open_with_cache(self.url + path, **kwargs)
+
+    def age(self, seconds):
+        for entry in self.browser.cache.values():
+            entry.stored -= seconds
+
+    def test_max_age(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60'})
+        content = self.open('/page').content
+        self.assertEqual(self.open('/page').content, content)
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Stale and without validators.
+        self.age(61)
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.browser.cache_hits, 1)
+
+    def test_revalidate(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60', 'ETag': '"1"'})
+        self.open('/page')
+        self.age(61)
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.browser.cache_hits, 1)
+        # Freshness is updated by the 304 response.
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_no_cache(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'no-cache, max-age=60', 'ETag': '"1"'})
+        self.open('/page')
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.browser.cache_hits, 1)
+
+        self.server.responses['/store'] = (200, {'Cache-Control': 'no-store', 'ETag': '"1"'})
+        self.open('/store')
+        self.assertEqual(len(self.browser.cache), 1)
+
+    def test_expires(self):
+        self.server.responses['/page'] = (200, {'Expires': formatdate(time() + 3600, usegmt=True)})
+        self.open('/page')
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.server.responses['/expired'] = (200, {'Expires': '0', 'ETag': '"1"'})
+        self.open('/expired')
+        self.open('/expired')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_stale_while_revalidate(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60, stale-while-revalidate=60',
+                                                'ETag': '"1"'})
+        self.open('/page')
+        entry = list(self.browser.cache.values())[0]
+        self.age(90)
+        self.open('/page')
+        self.assertEqual(self.browser.cache_hits, 1)
+        for _ in range(50):
+            if entry.is_fresh():
+                break
+            sleep(0.02)
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(len(self.server.requests), 2)
+
+        # Too late to use it.
+        self.age(150)
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.browser.cache_hits, 2)
+
+    def test_stale_if_error(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60, stale-if-error=60'})
+        content = self.open('/page').content
+        self.age(90)
+        self.server.responses['/page'] = (500, {})
+        self.assertEqual(self.open('/page').content, content)
+
+        self.age(60)
+        with self.assertRaises(ServerError):
+            self.open('/page')
+
+    def test_vary(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60', 'Vary': 'Accept-Language'})
+        fr = self.open('/page', headers={'Accept-Language': 'fr'}).content
+        en = self.open('/page', headers={'Accept-Language': 'en'}).content
+        self.assertNotEqual(fr, en)
+        self.assertEqual(len(self.server.requests), 2)
+
+        # Other headers are not part of the key.
+        self.open('/page', headers={'Accept-Language': 'en', 'Referer': self.url})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_key(self):
+        self.server.responses['/page'] = (200, {'Cache-Control': 'max-age=60'})
+        self.open('/page?b=2&a=1#top')
+        self.open('/page?a=1&b=2')
+        self.assertEqual(len(self.server.requests), 1)
+
+        # Credentials are part of the key.
+        self.open('/page', auth=('login', 'password'))
+        self.open('/page', auth=('other', 'password'))
+        self.assertEqual(len(self.server.requests), 3)
+
+        # Cookies which change on each response don't prevent hits.
+        self.browser.session.cookies.set('tracker', '1')
+        self.open('/page')
+        self.browser.session.cookies.set('tracker', '2')
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 4)
+
+        # Session cookies are part of the key.
+        self.browser.CACHE_SESSION_COOKIES = ('session',)
+        self.browser.session.cookies.set('session', '1')
+        self.open('/page')
+        self.browser.session.cookies.set('tracker', '3')
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 5)
+        self.browser.session.cookies.set('session', '2')
+        self.open('/page')
+        self.assertEqual(len(self.server.requests), 6)
+
+        self.assertEqual(self.browser.normalize_cache_url('HTTP://Example.ORG:80?a=1'), 'http://example.org/?a=1')
+        self.assertEqual(self.browser.normalize_cache_url('https://example.org:80/'), 'https://example.org:80/')
+
+    def test_url(self):
+        self.open('/never')
+        self.open('/never')
+        self.assertEqual(self.browser.cache, {})
+        self.assertEqual(len(self.server.requests), 2)
+
+        # Fresh for a day, without Cache-Control.
+        self.open('/day')
+        self.open('/day')
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.responses['/search'] = (200, {'Cache-Control': 'max-age=60'})
+        self.open('/search?q=weboob&session=1')
+        self.open('/search?q=weboob&session=2')
+        self.assertEqual(len(self.server.requests), 4)
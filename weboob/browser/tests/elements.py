@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from lxml.html import fromstring
+
+from weboob.browser.elements import ItemElement, ListElement
+from weboob.browser.filters.html import Attr
+from weboob.browser.filters.standard import CleanText, Env
+from weboob.capabilities.base import BaseObject
+
+
+class PageStub(object):
+    params = {}
+    browser = None
+
+    def __init__(self, doc):
+        self.doc = doc
+
+
+class ValuesList(ListElement):
+    item_xpath = '//li'
+
+    class item(ItemElement):
+        klass = BaseObject
+
+        load_value = Attr('.', 'data-value')
+
+        obj_id = CleanText('.')
+
+        def obj_url(self):
+            return self.loaders['value']
+
+
+class MoreValuesList(ValuesList):
+    class item(ValuesList.item):
+        load_more = Env('more', u'more')
+
+        obj_url = Env('url', None)
+
+        def obj__more(self):
+            return self.loaders['more']
+
+    class other(ItemElement):
+        klass = BaseObject
+
+        obj_id = CleanText('./@class')
+
+
+class ElementsTest(TestCase):
+    def setUp(self):
+        self.page = PageStub(fromstring('<ul><li data-value="a" class="x">1</li><li data-value="b" class="y">2</li></ul>'))
+
+    def test_list(self):
+        for _ in range(2):
+            self.assertEqual([(obj.id, obj.url) for obj in ValuesList(self.page)()], [(u'1', u'a'), (u'2', u'b')])
+
+    def test_subclass(self):
+        # Elements and loaders are found for each class.
+        self.assertEqual([obj.id for obj in ValuesList(self.page)()], [u'1', u'2'])
+        objs = list(MoreValuesList(self.page)())
+        self.assertEqual([obj.id for obj in objs], [u'1', u'x', u'2', u'y'])
+        self.assertEqual(objs[0].url, None)
+        self.assertEqual(objs[0]._more, u'more')
+
+    def test_class_caches(self):
+        list(MoreValuesList(self.page)())
+        self.assertEqual(ValuesList.get_elements(), [ValuesList.item])
+        self.assertEqual(MoreValuesList.get_elements(), [MoreValuesList.item, MoreValuesList.other])
+        self.assertEqual(ValuesList.item.get_loaders(), [('value', 'load_value')])
+        self.assertEqual(MoreValuesList.item.get_loaders(), [('more', 'load_more'), ('value', 'load_value')])
+        self.assertIs(MoreValuesList.item.get_logger(), ValuesList.item.get_logger())
+        self.assertIsNot(MoreValuesList.item.get_logger(), MoreValuesList.other.get_logger())
+        self.assertEqual(MoreValuesList.item._attrnames, [(name, 'obj_%s' % name) for name in MoreValuesList.item._attrs])
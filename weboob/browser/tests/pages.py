@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from requests import Response
+
+from lxml import etree
+from lxml.html import fromstring
+
+from weboob.browser import Browser
+from weboob.browser.filters.html import CSS
+from weboob.browser.filters.standard import CleanText
+from weboob.browser.pages import HTMLPage, Page, MAX_SELECTORS, _selectors, \
+                                 compile_css, compile_xpath, select_css, select_xpath
+
+
+def build_response(content, encoding=None):
+    response = Response()
+    response.status_code = 200
+    response.url = 'http://weboob.org/'
+    response._content = content
+    response.encoding = encoding
+    return response
+
+
+class EncodingTest(TestCase):
+    def setUp(self):
+        self.browser = Browser()
+        self.rebuilt = Page.docs_rebuilt
+
+    def build(self, content, encoding=None):
+        return HTMLPage(self.browser, build_response(content, encoding))
+
+    def assertEncoding(self, page, encoding, rebuilt=0):
+        self.assertEqual(page.encoding, encoding)
+        self.assertEqual(page.detect_encoding(), encoding)
+        self.assertEqual(Page.docs_rebuilt - self.rebuilt, rebuilt)
+
+    def test_meta_charset(self):
+        page = self.build(b'<html><head><meta charset="UTF-8"></head><body>\xc3\xa9</body></html>', 'ISO-8859-1')
+        self.assertEncoding(page, 'utf-8')
+        self.assertEqual(page.doc.xpath('//body')[0].text, u'\xe9')
+
+    def test_http_equiv(self):
+        page = self.build(b'<html><head><META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">'
+                          b'</head><body>\xc3\xa9</body></html>', 'ISO-8859-1')
+        self.assertEncoding(page, 'UTF-8')
+
+        # meta charset is used rather than http-equiv.
+        page = self.build(b'<html><head><meta charset=utf-8>'
+                          b'<meta http-equiv="content-type" content="text/html; charset=iso-8859-15">'
+                          b'</head></html>')
+        self.assertEncoding(page, 'utf-8')
+
+    def test_default(self):
+        page = self.build(b'<html><head></head><body>\xe9</body></html>', 'iso-8859-1')
+        self.assertEncoding(page, 'windows-1252')
+        page = self.build(b'<html><head><meta charset="unknown"></head></html>')
+        self.assertEncoding(page, 'windows-1252')
+
+    def test_body(self):
+        # Declarations out of the head are not used.
+        page = self.build(b'<html><head></head><body><meta charset="utf-8"></body></html>', 'utf-8')
+        self.assertEncoding(page, 'utf-8')
+        page = self.build(b'<html><head></head><body><meta charset="utf-8"></body></html>', 'iso-8859-1')
+        self.assertEncoding(page, 'windows-1252')
+
+    def test_skipped(self):
+        # Declarations in comments and scripts are not used.
+        page = self.build(b'<html><head><!-- <meta charset="utf-8"> --></head><body>\xa4</body></html>',
+                          'iso-8859-15')
+        self.assertEncoding(page, 'iso-8859-15')
+        self.assertEqual(page.doc.xpath('//body')[0].text, u'\u20ac')
+        page = self.build(b'<html><head><script>document.write(\'<meta charset="utf-8">\');</script>'
+                          b'<meta charset="iso-8859-15"></head></html>', 'utf-8')
+        self.assertEncoding(page, 'iso-8859-15')
+        page = self.build(b'<html><head><!-- <body> --><meta charset="utf-8"></head></html>', 'iso-8859-15')
+        self.assertEncoding(page, 'utf-8')
+
+    def test_far(self):
+        # Too far to be prescanned, the document is built again.
+        page = self.build(b'<html><head><title>%s</title><meta charset="utf-8"></head></html>'
+                          % (b'a' * HTMLPage.PRESCAN_SIZE), 'ISO-8859-1')
+        self.assertEncoding(page, 'utf-8', rebuilt=1)
+
+
+class SelectorsTest(TestCase):
+    def setUp(self):
+        self.doc = fromstring('<html><body><p class="a b">1</p><p class="b">2</p></body></html>')
+
+    def test_xpath(self):
+        self.assertIs(compile_xpath('//p'), compile_xpath('//p'))
+        self.assertEqual([p.text for p in select_xpath(self.doc, '//p')], ['1', '2'])
+        self.assertEqual(select_xpath(self.doc.getroottree(), 'count(//p)'), 2)
+        # Variables are given to lxml.
+        self.assertEqual(len(select_xpath(self.doc, '//p[@class=$c]', c='b')), 1)
+        self.assertEqual(CleanText('//p[2]')(self.doc), u'2')
+
+    def test_functions(self):
+        # Functions of HTMLPage are available to compiled expressions.
+        HTMLPage(Browser(), build_response(b'<html></html>'))
+        self.assertEqual(CleanText('//p[has-class("a")]')(self.doc), u'1')
+
+    def test_css(self):
+        self.assertIs(compile_css('p.b'), compile_css('p.b'))
+        self.assertEqual(CleanText(CSS('p.b'))(self.doc), u'1 2')
+        xml = etree.fromstring('<r><P/><p/></r>')
+        self.assertEqual(len(select_css(xml, 'p')), 1)
+        self.assertEqual(len(select_css(fromstring('<div><P/><p/></div>'), 'p')), 2)
+
+    def test_max(self):
+        for i in range(MAX_SELECTORS + 1):
+            compile_xpath('//p[%d]' % i)
+        self.assertLessEqual(len(_selectors), MAX_SELECTORS)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from weboob.browser import PagesBrowser, URL
+from weboob.browser.elements import ItemElement, ListElement, method
+from weboob.browser.filters.html import AbsoluteLink
+from weboob.browser.filters.standard import CleanText
+from weboob.browser.pages import HTMLPage, pagination
+from weboob.capabilities.base import BaseObject
+
+
+PAGES = 3
+ITEMS = 3
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        sleep(self.server.delay)
+        num = int(self.path.rsplit('-', 1)[1])
+        items = ''.join('<li>%d-%d</li>' % (num, i) for i in range(ITEMS))
+        link = '<a rel="next" href="list-%d">next</a>' % (num + 1) if num < PAGES else ''
+        body = ('<html><body><ul>%s</ul>%s</body></html>' % (items, link)).encode('ascii')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ValuesList(ListElement):
+    item_xpath = '//li'
+    next_page = AbsoluteLink('//a[@rel="next"]', default=None)
+
+    class item(ItemElement):
+        klass = BaseObject
+
+        obj_id = CleanText('.')
+
+
+class PrefetchedValuesList(ValuesList):
+    prefetch_next_page = True
+
+
+class ListPage(HTMLPage):
+    iter_values = method(ValuesList)
+    iter_prefetched = method(PrefetchedValuesList)
+
+    def __init__(self, *args, **kwargs):
+        super(ListPage, self).__init__(*args, **kwargs)
+        self.browser.parsed.append(self.url)
+
+    @pagination
+    def iter_decorated(self):
+        return self.iter_prefetched()
+
+
+class ListBrowser(PagesBrowser):
+    list = URL(r'/list-(?P<num>\d+)', ListPage)
+
+    def __init__(self, *args, **kwargs):
+        super(ListBrowser, self).__init__(*args, **kwargs)
+        self.parsed = []
+
+
+class PrefetchTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.requests = []
+        self.server.delay = 0
+        self.thread = Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+        self.browser = ListBrowser(baseurl='http://127.0.0.1:%d' % self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def expected(self):
+        return ['%d-%d' % (num, i) for num in range(1, PAGES + 1) for i in range(ITEMS)]
+
+    def test_without_prefetch(self):
+        self.browser.list.go(num=1)
+        ids = [obj.id for obj in self.browser.pagination(lambda: self.browser.page.iter_values())]
+        self.assertEqual(ids, self.expected())
+
+    def test_prefetch(self):
+        self.browser.list.go(num=1)
+        ids = []
+        for obj in self.browser.pagination(lambda: self.browser.page.iter_prefetched()):
+            if not ids:
+                # The next page is requested before the first item is read.
+                sleep(0.1)
+                self.assertEqual(self.server.requests, ['/list-1', '/list-2'])
+            ids.append(obj.id)
+
+        self.assertEqual(ids, self.expected())
+        self.assertEqual(self.server.requests, ['/list-%d' % num for num in range(1, PAGES + 1)])
+        self.assertEqual(self.browser.url, self.browser.BASEURL + '/list-%d' % PAGES)
+        self.assertIsInstance(self.browser.page, ListPage)
+
+    def test_decorator(self):
+        self.browser.list.go(num=1)
+        ids = [obj.id for obj in self.browser.page.iter_decorated()]
+        self.assertEqual(ids, self.expected())
+        self.assertEqual(len(self.server.requests), PAGES)
+
+    def test_stop(self):
+        self.browser.list.go(num=1)
+        it = self.browser.pagination(lambda: self.browser.page.iter_prefetched())
+        self.assertEqual(next(it).id, '1-0')
+        it.close()
+        sleep(0.1)
+        # The request of the next page is cancelled if it has not started.
+        self.assertIn(self.server.requests, (['/list-1'], ['/list-1', '/list-2']))
+
+    def test_stop_in_flight(self):
+        self.browser.list.go(num=1)
+        self.server.delay = 0.2
+        it = self.browser.pagination(lambda: self.browser.page.iter_prefetched())
+        self.assertEqual(next(it).id, '1-0')
+        sleep(0.1)
+        self.assertEqual(self.server.requests, ['/list-1', '/list-2'])
+        it.close()
+        sleep(0.3)
+        # The response of the next page is dropped without being parsed.
+        self.assertEqual(self.browser.parsed, [self.browser.BASEURL + '/list-1'])
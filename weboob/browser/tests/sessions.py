@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from weboob.browser import Browser
+from weboob.browser.exceptions import HTTPNotFound
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        # Let other requests arrive while this one is in flight.
+        sleep(0.2)
+        if self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = ('content of %s' % self.path).encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class CoalescingBrowser(Browser):
+    COALESCE_REQUESTS = True
+
+
+class CoalesceTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.requests = []
+        self.thread = Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_coalesce(self):
+        browser = CoalescingBrowser()
+        futures = [browser.async_open(self.url + '/page') for _ in range(5)]
+        responses = [future.result() for future in futures]
+
+        self.assertEqual(self.server.requests, ['/page'])
+        self.assertEqual(browser.session.coalesced, 4)
+        self.assertEqual(set(r.content for r in responses), set([b'content of /page']))
+        # Responses are independent copies.
+        self.assertEqual(len(set(id(r) for r in responses)), 5)
+        responses[0].headers['X-Test'] = 'changed'
+        self.assertNotIn('X-Test', responses[1].headers)
+
+        # Once the response has arrived, the request is sent again.
+        browser.open(self.url + '/page')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_disabled(self):
+        browser = Browser()
+        futures = [browser.async_open(self.url + '/page') for _ in range(3)]
+        for future in futures:
+            future.result()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_not_idempotent(self):
+        browser = CoalescingBrowser()
+        futures = [browser.async_open(self.url + '/page', data={'a': 1}) for _ in range(3)]
+        for future in futures:
+            future.result()
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(browser.session.coalesced, 0)
+
+    def test_different(self):
+        browser = CoalescingBrowser()
+        futures = [browser.async_open(self.url + '/page%d' % i) for i in range(3)]
+        for future in futures:
+            future.result()
+        self.assertEqual(len(self.server.requests), 3)
+
+        # Other headers may get other responses.
+        futures = [browser.async_open(self.url + '/page', headers={'Range': 'bytes=%d-' % i}) for i in range(3)]
+        futures.append(browser.async_open(self.url + '/page', auth=('login', 'password')))
+        for future in futures:
+            future.result()
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertEqual(browser.session.coalesced, 0)
+
+    def test_error(self):
+        browser = CoalescingBrowser()
+        futures = [browser.async_open(self.url + '/missing') for _ in range(3)]
+        for future in futures:
+            with self.assertRaises(HTTPNotFound):
+                future.result()
+        self.assertEqual(len(self.server.requests), 1)
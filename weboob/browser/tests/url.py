@@ -17,9 +17,12 @@
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 from unittest import TestCase
 
+from requests import Response
+from requests.adapters import BaseAdapter
+
 from weboob.browser import PagesBrowser, URL
-from weboob.browser.pages import Page
-from weboob.browser.url import UrlNotResolvable
+from weboob.browser.pages import HTMLPage, Page
+from weboob.browser.url import UrlNotResolvable, literal_prefix
 
 
 class MyMockBrowserWithoutBrowser(object):
@@ -135,3 +138,158 @@ class URLTest(TestCase):
         self.assertRaisesRegexp(AssertionError, "You can use this method" +
                                 " only if there is a Page class handler.",
                                 self.myBrowser.urlRegex.is_here, id=2)
+
+
+class MyMockRouterBrowser(PagesBrowser):
+    BASEURL = "http://weboob.org/"
+
+    home = URL("/$", MyMockPage)
+    item = URL("/items/(?P<id>\d+)", "/item\?id=(?P<id>\d+)", MyMockPage)
+    items = URL("/items/.*", MyMockPage)
+    other = URL("https?://(www|m)\.test\.org/(?P<page>.*)", MyMockPage)
+    notHandled = URL("/items/2")
+
+
+# Class that tests the router of URL objects of a browser
+class URLRouterTest(TestCase):
+
+    def setUp(self):
+        self.myBrowser = MyMockRouterBrowser()
+
+    def names(self, url):
+        return [name for name, m in self.myBrowser.get_url_router().match(url)]
+
+    # Check that URL objects are matched in declaration order, and only
+    # once even if several patterns match
+    def test_match_order(self):
+        self.assertEqual(self.names("http://weboob.org/items/2"), ["item", "items"])
+        self.assertEqual(self.names("http://weboob.org/item?id=2"), ["item"])
+        self.assertEqual(self.names("http://weboob.org/"), ["home"])
+        self.assertEqual(self.names("http://m.test.org/news"), ["other"])
+        self.assertEqual(self.names("http://weboob.org/news"), [])
+
+    # Check that the match object is the same as URL.match
+    def test_match_groups(self):
+        name, m = next(self.myBrowser.get_url_router().match("http://weboob.org/items/42"))
+        self.assertEqual(m.groupdict(), self.myBrowser.item.match("http://weboob.org/items/42").groupdict())
+
+    # Check that the router follows changes of BASEURL and of patterns
+    def test_changes(self):
+        router = self.myBrowser.get_url_router()
+        self.assertIs(self.myBrowser.get_url_router(), router)
+        # Routers are not shared between browsers.
+        self.assertIsNot(MyMockRouterBrowser().get_url_router(), router)
+
+        self.myBrowser.BASEURL = "http://weboob.com/"
+        self.assertEqual(self.names("http://weboob.com/items/2"), ["item", "items"])
+        self.assertEqual(self.names("http://weboob.org/items/2"), [])
+
+        self.myBrowser.home.urls.insert(0, "/index.html")
+        self.assertEqual(self.names("http://weboob.com/index.html"), ["home"])
+        self.assertEqual(self.names("http://weboob.com/"), ["home"])
+        self.assertIsNot(self.myBrowser.get_url_router(), router)
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix(r"http://weboob\.org/items/(?P<id>\d+)"), "http://weboob.org/items/")
+        self.assertEqual(literal_prefix(r"http://weboob\.org/items?"), "http://weboob.org/item")
+        self.assertEqual(literal_prefix(r"http://(www|m)\.weboob\.org/"), "")
+        self.assertEqual(literal_prefix(r"http://weboob\.org/\?id=\d+"), "http://weboob.org/?id=")
+
+
+# Adapter which answers the same HTML document to all requests
+class MyMockAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'text/html'
+        response._content = b'<html><head><meta charset="utf-8"></head><body><p id="b">\xc3\xa9</p></body></html>'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class MyMockHTMLPage(HTMLPage):
+    SHARE_DOC = True
+    built = 0
+
+    def build_doc(self, content):
+        MyMockHTMLPage.built += 1
+        return super(MyMockHTMLPage, self).build_doc(content)
+
+
+class MyMockPageA(MyMockHTMLPage):
+    is_here = '//p[@id="a"]'
+
+
+class MyMockPageB(MyMockHTMLPage):
+    def is_here(self):
+        return self.doc.xpath('//p[@id="b"]')
+
+
+class MyMockPageC(MyMockHTMLPage):
+    ENCODING = 'latin-1'
+
+
+class MyMockPageD(MyMockHTMLPage):
+    is_here = '//p[@id="d"]'
+
+    def __init__(self, *args, **kwargs):
+        super(MyMockPageD, self).__init__(*args, **kwargs)
+        self.doc.xpath('//p')[0].set('id', 'a')
+
+
+class MyMockPageE(HTMLPage):
+    def build_doc(self, content):
+        MyMockHTMLPage.built += 1
+        return super(MyMockPageE, self).build_doc(content)
+
+
+class MyMockDocsBrowser(PagesBrowser):
+    BASEURL = "http://weboob.org/"
+
+    d = URL("/changed", MyMockPageD)
+    e = URL("/unshared", MyMockPageE)
+    a = URL("/page", "/changed", MyMockPageA)
+    b = URL("/page", MyMockPageB)
+    c = URL("/page", "/latin", MyMockPageC)
+
+
+# Class that tests documents shared by candidate pages of a response
+class SharedDocTest(TestCase):
+
+    def setUp(self):
+        self.myBrowser = MyMockDocsBrowser()
+        self.myBrowser.session.mount("http://weboob.org/", MyMockAdapter())
+        MyMockHTMLPage.built = 0
+
+    # Check that the document is built once for all candidates
+    def test_shared(self):
+        self.myBrowser.location("/page")
+        self.assertIsInstance(self.myBrowser.page, MyMockPageB)
+        self.assertEqual(self.myBrowser.page.encoding, "utf-8")
+        self.assertEqual(self.myBrowser.page.doc.xpath('//p')[0].text, u"\xe9")
+        self.assertEqual(MyMockHTMLPage.built, 1)
+        self.assertFalse(hasattr(self.myBrowser.response, "page_docs"))
+
+    # Check that a page with a forced encoding builds its own document
+    def test_encoding(self):
+        self.myBrowser.location("/latin")
+        self.assertIsInstance(self.myBrowser.page, MyMockPageC)
+        self.assertEqual(self.myBrowser.page.doc.xpath('//p')[0].text, u"\xc3\xa9")
+        self.assertEqual(MyMockHTMLPage.built, 1)
+
+    # Check that a page whose constructor changes the document builds its own
+    def test_init(self):
+        self.myBrowser.location("/changed")
+        self.assertIsNone(self.myBrowser.page)
+        self.assertEqual(MyMockHTMLPage.built, 2)
+
+    # Check that pages don't share their document by default
+    def test_default(self):
+        self.myBrowser.location("/unshared")
+        self.myBrowser.location("/unshared")
+        self.assertEqual(MyMockHTMLPage.built, 2)
+        self.assertFalse(HTMLPage.SHARE_DOC)
@@ -25,6 +25,8 @@ from weboob.tools.compat import basestring, unquote
 from weboob.tools.regex_helper import normalize
 from weboob.tools.misc import to_unicode
 
+from .pages import select_xpath
+
 
 class UrlNotResolvable(Exception):
     """
@@ -32,19 +34,137 @@ class UrlNotResolvable(Exception):
     """
 
 
+# Compiled regexps of URL patterns, by (pattern, base).
+_regexps = {}
+
+MAX_REGEXPS = 2000
+"""
+Maximum number of compiled regexps kept, the cache is emptied when it is
+reached.
+"""
+
+
+def compile_pattern(pattern, base):
+    """
+    Compile an URL pattern, relative to base if it is not absolute.
+
+    :rtype: regexp object
+    """
+    try:
+        return _regexps[(pattern, base)]
+    except KeyError:
+        regex = pattern
+        if not re.match(r'^[\w\?]+://.*', pattern):
+            regex = re.escape(base).rstrip('/') + '/' + pattern.lstrip('/')
+        compiled = re.compile(regex)
+        if len(_regexps) >= MAX_REGEXPS:
+            _regexps.clear()
+        _regexps[(pattern, base)] = compiled
+        return compiled
+
+
+def literal_prefix(regex):
+    """
+    Get the literal string any match of a regexp starts with.
+
+    >>> literal_prefix(r'https://example\.org/a+/(?P<id>\d+)')
+    'https://example.org/a'
+    >>> literal_prefix(r'https?://example\.org/')
+    'http'
+    """
+    if '|' in regex:
+        return ''
+
+    prefix = []
+    i = 0
+    while i < len(regex):
+        if regex[i] == '\\' and i + 1 < len(regex) and not regex[i + 1].isalnum():
+            char = regex[i + 1]
+            i += 2
+        elif regex[i] in '.^$*+?{}[]()\\':
+            break
+        else:
+            char = regex[i]
+            i += 1
+        if i < len(regex) and regex[i] in '?*{':
+            # The character is optional.
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+class URLRouter(object):
+    """
+    Find URL objects which match an url, among a list of URL objects.
+
+    Patterns are compiled once, and a pattern is only tried if the url
+    starts with its literal prefix.
+
+    :param urls: URL objects, with their names, in declaration order
+    :type urls: list of (str, :class:`URL`)
+    :param base: base url of relative patterns
+    :type base: str
+    """
+
+    def __init__(self, urls, base):
+        self.key = self.make_key(urls, base)
+        self.routes = []
+        for name, url in urls:
+            for pattern in url.urls:
+                regex = compile_pattern(pattern, base)
+                prefix = '' if regex.flags & re.IGNORECASE else literal_prefix(regex.pattern)
+                self.routes.append((prefix, regex, name))
+
+    def match(self, url):
+        """
+        Iterate on names of URL objects which match an url, in declaration
+        order, with their match object.
+        """
+        last = None
+        for prefix, regex, name in self.routes:
+            if name == last or not url.startswith(prefix):
+                continue
+            m = regex.match(url)
+            if m:
+                last = name
+                yield name, m
+
+    @staticmethod
+    def make_key(urls, base):
+        """
+        Get a key which changes with the URL patterns and the base url, to
+        know if a router is outdated.
+        """
+        return (base, tuple((name, tuple(url.urls)) for name, url in urls))
+
+
 class URL(object):
     """
     A description of an URL on the PagesBrowser website.
 
     It takes one or several regexps to match urls, and an optional Page
     class which is instancied by PagesBrowser.open if the page matches a regex.
+
+    Keyword arguments change how responses are cached by a browser using
+    :class:`weboob.browser.cache.CacheMixin`:
+
+    :param cache: False to never cache responses, or a number of seconds
+                  a response is fresh if it has no Cache-Control or Expires
+                  header (True is 0, as None which follows HTTP headers)
+    :type cache: bool or int
+    :param cache_ignore_params: query parameters which are not part of the
+                                cache key (session ids, timestamps...)
+    :type cache_ignore_params: list
     """
     _creation_counter = 0
 
-    def __init__(self, *args):
+    def __init__(self, *args, **kwargs):
         self.urls = []
         self.klass = None
         self.browser = None
+        self.cache = kwargs.pop('cache', None)
+        self.cache_ignore_params = tuple(kwargs.pop('cache_ignore_params', ()))
+        assert not kwargs, 'Unknown arguments: %s' % ', '.join(kwargs)
         for arg in args:
             if isinstance(arg, basestring):
                 self.urls.append(arg)
@@ -160,23 +280,24 @@ class URL(object):
             assert self.browser is not None
             base = self.browser.BASEURL
 
-        for regex in self.urls:
-            if not re.match(r'^[\w\?]+://.*', regex):
-                regex = re.escape(base).rstrip('/') + '/' + regex.lstrip('/')
-            m = re.match(regex, url)
+        for pattern in self.urls:
+            m = compile_pattern(pattern, base).match(url)
             if m:
                 return m
 
-    def handle(self, response):
+    def handle(self, response, match=None):
         """
         Handle a HTTP response to get an instance of the klass if it matches.
+
+        :param match: result of :meth:`match` on the url of the response, if
+                      it is already known
         """
         if self.klass is None:
             return
         if response.request.method == 'HEAD':
             return
 
-        m = self.match(response.url)
+        m = match or self.match(response.url)
         if m:
             page = self.klass(self.browser, response, m.groupdict())
             if hasattr(page, 'is_here'):
@@ -185,7 +306,7 @@ class URL(object):
                         return page
                 else:
                     assert isinstance(page.is_here, basestring)
-                    if page.doc.xpath(page.is_here):
+                    if select_xpath(page.doc, page.is_here):
                         return page
             else:
                 return page
@@ -128,6 +128,10 @@ class NotAvailableType(object):
     def __deepcopy__(self, memo):
         return self
 
+    def __reduce__(self):
+        # Keep the singleton when unpickled.
+        return 'NotAvailable'
+
     def __repr__(self):
         return 'NotAvailable'
 
@@ -159,6 +163,10 @@ class NotLoadedType(object):
     def __deepcopy__(self, memo):
         return self
 
+    def __reduce__(self):
+        # Keep the singleton when unpickled.
+        return 'NotLoaded'
+
     def __repr__(self):
         return 'NotLoaded'
 
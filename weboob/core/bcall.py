@@ -18,20 +18,23 @@
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
 
+import sys
+from collections import deque
 from copy import copy
-from threading import Thread, Event
-try:
-    import Queue
-except ImportError:
-    import queue as Queue
+from heapq import heappop, heappush
+from itertools import count
+from threading import Thread, Event, Condition, Lock, current_thread
+from time import time
 
 from weboob.capabilities.base import BaseObject
-from weboob.tools.compat import basestring
-from weboob.tools.misc import get_backtrace
+from weboob.exceptions import CallCancelled
+from weboob.tools.cancel import CancelToken
+from weboob.tools.compat import basestring, StopAsyncIteration
+from weboob.tools.misc import ReversedKey, get_backtrace
 from weboob.tools.log import getLogger
 
 
-__all__ = ['BackendsCall', 'CallErrors']
+__all__ = ['AsyncBackendsCall', 'BackendsCall', 'CallErrors', 'CallTimeout', 'WorkerPool']
 
 
 class CallErrors(Exception):
@@ -47,27 +50,252 @@ class CallErrors(Exception):
         return self.errors.__iter__()
 
 
+class WorkerPool(object):
+    """
+    Long-lived pool of threads used to run backends calls.
+
+    Threads are started lazily, up to *max_workers*, and are kept alive to
+    serve next calls. Jobs on backends implementing a capability listed in
+    *caps_limits* are not run concurrently more than the given number of
+    times.
+
+    A call done from a job of the pool (for example a backend which calls
+    :func:`weboob.core.ouiboube.WebNip.do`) never waits for a free worker,
+    so it can't deadlock the pool.
+
+    :param max_workers: maximum number of threads
+    :type max_workers: int
+    :param caps_limits: maximum number of concurrent jobs per capability
+    :type caps_limits: dict[:class:`weboob.capabilities.base.Capability`, int]
+    """
+    MAX_WORKERS = 16
+
+    def __init__(self, max_workers=None, caps_limits=None):
+        self.logger = getLogger('bcall.pool')
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.caps_limits = dict(caps_limits or {})
+
+        self.cond = Condition()
+        self.pending = deque()
+        self.workers = set()
+        self.running = dict((cap, 0) for cap in self.caps_limits)
+        self.idle = 0
+        self.stopped = False
+        # Number of threads started since the creation of the pool.
+        self.started = 0
+
+    def submit(self, backend, function, *args):
+        """
+        Run ``function(*args)`` in a thread of the pool.
+
+        :param backend: backend on which the job is run, used to apply
+                        the capabilities limits
+        :type backend: :class:`weboob.tools.backend.Module`
+        """
+        nested = current_thread() in self.workers
+        # Nested jobs are not limited: their parent job may already hold the
+        # slot they would wait for.
+        caps = [] if nested else [cap for cap in self.caps_limits if backend.has_caps(cap)]
+
+        with self.cond:
+            if self.stopped:
+                raise RuntimeError('Unable to submit a job to a stopped pool')
+
+            self.pending.append((caps, function, args))
+            if nested:
+                self._spawn()
+                return
+
+            if self.idle > 0:
+                self.cond.notify()
+            # Notified workers are still counted as idle until they resume,
+            # so they may already be taken by previous jobs.
+            if len(self.pending) > self.idle and len(self.workers) < self.max_workers:
+                self._spawn()
+
+    def _spawn(self):
+        thread = Thread(target=self._worker_run, name='bcall-worker-%d' % self.started)
+        thread.daemon = True
+        self.workers.add(thread)
+        self.started += 1
+        thread.start()
+
+    def _pop_job(self):
+        for job in self.pending:
+            caps = job[0]
+            if all(self.running[cap] < self.caps_limits[cap] for cap in caps):
+                self.pending.remove(job)
+                for cap in caps:
+                    self.running[cap] += 1
+                return job
+        return None
+
+    def _worker_run(self):
+        thread = current_thread()
+        while True:
+            with self.cond:
+                job = self._pop_job()
+                while job is None:
+                    if self.stopped and not self.pending or len(self.workers) > self.max_workers:
+                        self.workers.discard(thread)
+                        return
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+                    job = self._pop_job()
+
+            caps, function, args = job
+            try:
+                function(*args)
+            except Exception as e:
+                self.logger.error('Unexpected error in worker: %s', get_backtrace(e))
+            finally:
+                if caps:
+                    with self.cond:
+                        for cap in caps:
+                            self.running[cap] -= 1
+                        # Wake up workers waiting for a job blocked by a limit.
+                        self.cond.notify_all()
+
+    def shutdown(self, wait=False):
+        """
+        Stop the pool once pending jobs are done.
+
+        :param wait: if True, wait until every worker exited
+        :type wait: bool
+        """
+        with self.cond:
+            self.stopped = True
+            workers = list(self.workers)
+            self.cond.notify_all()
+
+        if wait:
+            for thread in workers:
+                if thread is not current_thread():
+                    thread.join()
+
+
+class CallTimeout(Exception):
+    """
+    Stored in :class:`CallErrors` for a backend which did not finish its
+    task before the deadline.
+    """
+    def __init__(self, backend, timeout):
+        super(CallTimeout, self).__init__('Backend %s did not finish in %.1f seconds' % (backend.name, timeout))
+        self.timeout = timeout
+
+
 class BackendsCall(object):
+    # Returned once there is nothing left to consume.
+    FINISHED = object()
+    # Returned by poll_response() when no result is available yet.
+    EMPTY = object()
+    # Maximum wait on Python 2 main thread, to let it catch KeyboardInterrupt.
+    INTERRUPT_DELAY = 0.5
+    # Default number of results of each backend kept to be reordered, when
+    # results are merged.
+    REORDER_SIZE = 16
+
     def __init__(self, backends, function, *args, **kwargs):
         """
         :param backends: List of backends to call
         :type backends: list[:class:`Module`]
         :param function: backends' method name, or callable object.
         :type function: :class:`str` or :class:`callable`
+        :param pool: pool of threads used to call backends; if not given,
+                     a temporary one is used
+        :type pool: :class:`WorkerPool`
+        :param timeout: maximum duration of the whole call, in seconds
+        :type timeout: float
+        :param per_backend_timeout: maximum duration of the task of each
+                                    backend once it has started, in seconds
+        :type per_backend_timeout: float
+        :param queue_size: if set, maximum number of results waiting to be
+                           consumed; backends are blocked until the consumer
+                           catches up
+        :type queue_size: int
+        :param process_pool: if set, backends tasks are run in processes of
+                             this pool instead of in threads
+        :type process_pool: :class:`weboob.core.processes.ProcessPool`
+        :param merge_key: if set, results of all backends are yielded
+                          sorted by this key
+        :type merge_key: :class:`callable`
+        :param merge_reverse: merge results in descending order
+        :type merge_reverse: bool
+        :param reorder_size: when results are merged, number of results of
+                             each backend kept to fix their order, as they
+                             are expected to be sorted (default is
+                             :attr:`REORDER_SIZE`)
+        :type reorder_size: int
+
+        When a deadline expires, results already gathered are still
+        yielded, and late backends are stored in errors with a
+        :class:`CallTimeout` exception and asked to abort.
+
+        With a *merge_key*, a result is yielded only once every running
+        backend has given more than *reorder_size* results which are not
+        yielded yet, or has finished; *queue_size* is then a limit for each
+        backend.
+
+        Note that with a *queue_size*, results have to be consumed (by
+        iterating on this object or with :func:`callback_thread`), otherwise
+        backends never finish.
         """
         self.logger = getLogger('bcall')
 
-        self.responses = Queue.Queue()
+        self.responses = deque()
         self.errors = []
-        self.tasks = Queue.Queue()
         self.stop_event = Event()
-        self.threads = []
+
+        pool = kwargs.pop('pool', None)
+        self.timeout = kwargs.pop('timeout', None)
+        self.per_backend_timeout = kwargs.pop('per_backend_timeout', None)
+        self.queue_size = kwargs.pop('queue_size', None)
+        self.process_pool = kwargs.pop('process_pool', None)
+        self.merge_key = kwargs.pop('merge_key', None)
+        self.merge_reverse = kwargs.pop('merge_reverse', False)
+        self.reorder_size = kwargs.pop('reorder_size', self.REORDER_SIZE)
+
+        lock = Lock()
+        # Notified when the state of a task changes.
+        self.cond = Condition(lock)
+        # Notified when a result is stored or when a task ends.
+        self.not_empty = Condition(lock)
+        # Notified when a result is consumed or when a task ends.
+        self.not_full = Condition(lock)
+        # Called once on the next change, see poll_response().
+        self.listener = None
+        # Backends which have neither finished nor been aborted.
+        self.unfinished = set(backends)
+        # Backends which have been asked to abort.
+        self.aborted = set()
+        # Start time of tasks, used by per-backend deadlines.
+        self.started = {}
+        # Cancelled when the call is stopped or the backend aborted, to stop
+        # requests of browsers.
+        self.cancel_tokens = dict((backend, CancelToken()) for backend in backends)
+        self.deadline = time() + self.timeout if self.timeout else None
+
+        if self.merge_key is not None:
+            # Heap of (key, seq, backend, result) of results of all backends.
+            self.merged = []
+            self.seq = count()
+            # Number of results of each backend in the heap.
+            self.pending = dict((backend, 0) for backend in backends)
+            # Running backends with no more than reorder_size results in the
+            # heap: the smallest result can't be yielded yet.
+            self.starving = set(backends)
+
+        temporary = pool is None
+        if temporary:
+            pool = WorkerPool(max_workers=max(len(backends), 1))
 
         for backend in backends:
-            t = Thread(target=self.backend_process, args=(function, args, kwargs))
-            t.start()
-            self.threads.append(t)
-            self.tasks.put(backend)
+            pool.submit(backend, self.backend_process, backend, function, args, kwargs)
+
+        if temporary:
+            # Workers will exit as soon as every job is done.
+            pool.shutdown()
 
     def store_result(self, backend, result):
         """Store the result when a backend task finished."""
@@ -76,27 +304,99 @@ class BackendsCall(object):
 
         if isinstance(result, BaseObject):
             result.backend = backend.name
-        self.responses.put(result)
 
-    def backend_process(self, function, args, kwargs):
+        if self.merge_key is not None:
+            self._store_merged(backend, result)
+            return
+
+        with self.cond:
+            while self.queue_size and len(self.responses) >= self.queue_size and not self.is_stopped(backend):
+                self.not_full.wait()
+
+            if backend not in self.aborted:
+                self.responses.append(result)
+                self.not_empty.notify()
+                self._wakeup_listener()
+
+    def _store_merged(self, backend, result):
+        try:
+            key = self.merge_key(result)
+        except Exception as error:
+            self.store_error(backend, error, get_backtrace(error))
+            return
+
+        if self.merge_reverse:
+            key = ReversedKey(key)
+
+        # A backend blocked by the limit always has enough results to let
+        # the consumer go on.
+        limit = max(self.queue_size, self.reorder_size + 1) if self.queue_size else None
+        with self.cond:
+            while limit and self.pending[backend] >= limit and not self.is_stopped(backend):
+                self.not_full.wait()
+
+            if backend not in self.aborted:
+                heappush(self.merged, (key, next(self.seq), backend, result))
+                self.pending[backend] += 1
+                if self.pending[backend] > self.reorder_size:
+                    self.starving.discard(backend)
+                if not self.starving:
+                    self.not_empty.notify()
+                    self._wakeup_listener()
+
+    def _pop_merged(self):
+        # Must be called with the lock held.
+        _, _, backend, result = heappop(self.merged)
+        self.pending[backend] -= 1
+        if backend in self.unfinished and self.pending[backend] <= self.reorder_size:
+            self.starving.add(backend)
+        self.not_full.notify_all()
+        return result
+
+    def store_error(self, backend, error, backtrace):
+        """Store an error raised by a backend."""
+        with self.cond:
+            if backend not in self.aborted:
+                self.errors.append((backend, error, backtrace))
+
+    def is_stopped(self, backend):
+        """
+        Check if a backend has to stop its task.
+        """
+        return self.stop_event.is_set() or backend in self.aborted
+
+    def backend_process(self, backend, function, args, kwargs):
         """
         Internal method to run a method of a backend.
 
-        As this method may be blocking, it should be run on its own thread.
+        As this method may be blocking, it is run in a thread of the pool.
         """
-        backend = self.tasks.get()
+        with self.cond:
+            if backend not in self.unfinished:
+                # Deadline expired before the task could start.
+                return
+            self.started[backend] = time()
+            # Take this new deadline into account.
+            self._notify_all()
+
         with backend:
+            previous_token = backend.cancel_token
+            backend.cancel_token = self.cancel_tokens[backend]
             try:
                 # Call method on backend
                 try:
                     self.logger.debug('%s: Calling function %s', backend, function)
-                    if callable(function):
+                    if self.process_pool is not None:
+                        result = self.process_pool.run(backend, function, args, kwargs)
+                    elif callable(function):
                         result = function(backend, *args, **kwargs)
                     else:
                         result = getattr(backend, function)(*args, **kwargs)
+                except CallCancelled:
+                    pass
                 except Exception as error:
                     self.logger.debug('%s: Called function %s raised an error: %r', backend, function, error)
-                    self.errors.append((backend, error, get_backtrace(error)))
+                    self.store_error(backend, error, self._get_backtrace(error))
                 else:
                     self.logger.debug('%s: Called function %s returned: %r', backend, function, result)
 
@@ -105,24 +405,177 @@ class BackendsCall(object):
                         try:
                             for subresult in result:
                                 self.store_result(backend, subresult)
-                                if self.stop_event.is_set():
+                                if self.is_stopped(backend):
                                     break
+                        except CallCancelled:
+                            pass
                         except Exception as error:
-                            self.errors.append((backend, error, get_backtrace(error)))
+                            self.store_error(backend, error, self._get_backtrace(error))
                     else:
                         self.store_result(backend, result)
             finally:
-                self.tasks.task_done()
+                backend.cancel_token = previous_token
+                token = self.cancel_tokens[backend]
+                if token.cancelled:
+                    self.logger.debug('%s: Task cancelled, %d requests saved', backend, token.saved)
+
+                with self.cond:
+                    self.unfinished.discard(backend)
+                    if self.merge_key is not None:
+                        self.starving.discard(backend)
+                    self._notify_all()
+
+    @staticmethod
+    def _get_backtrace(error):
+        # Errors raised in a worker process keep their original backtrace.
+        return getattr(error, 'remote_backtrace', None) or get_backtrace(error)
+
+    def _notify_all(self):
+        self.cond.notify_all()
+        self.not_empty.notify_all()
+        self.not_full.notify_all()
+        self._wakeup_listener()
+
+    def abort(self, backend, error=None):
+        """
+        Stop waiting for a backend.
+
+        Results it will give from now are ignored.
+
+        :param error: if given, store this error for the backend
+        :type error: :class:`Exception`
+        """
+        with self.cond:
+            self._abort(backend, error)
+
+    def _abort(self, backend, error):
+        # Must be called with the lock held.
+        if backend not in self.unfinished:
+            return
+
+        self.logger.debug('%s: Aborting task: %s', backend, error)
+        if error is not None:
+            self.errors.append((backend, error, ''))
+        self.aborted.add(backend)
+        self.unfinished.discard(backend)
+        self.cancel_tokens[backend].cancel()
+        if self.merge_key is not None:
+            self.starving.discard(backend)
+        self._notify_all()
+
+    def _check_deadlines(self):
+        """
+        Abort backends whose deadline has expired.
+
+        Must be called with the lock held.
+
+        :returns: delay before the next deadline, or None
+        """
+        if self.deadline is None and not self.per_backend_timeout:
+            return None
+
+        now = time()
+        delays = []
+        for backend in list(self.unfinished):
+            if self.deadline is not None:
+                if now >= self.deadline:
+                    self._abort(backend, CallTimeout(backend, self.timeout))
+                    continue
+                delays.append(self.deadline - now)
+
+            if self.per_backend_timeout and backend in self.started:
+                deadline = self.started[backend] + self.per_backend_timeout
+                if now >= deadline:
+                    self._abort(backend, CallTimeout(backend, self.per_backend_timeout))
+                    continue
+                delays.append(deadline - now)
+
+        return min(delays) if delays else None
+
+    def _pop_response(self):
+        """
+        Get the next result without waiting.
+
+        Must be called with the lock held.
+
+        :returns: a tuple (response, delay). response is the result, or
+                  :data:`FINISHED` when every task has ended and every
+                  result has been consumed, or when the call is stopped, or
+                  :data:`EMPTY` if no result is available yet; delay is
+                  the time before the next deadline, or None.
+        """
+        if self.stop_event.is_set():
+            return self.FINISHED, None
+
+        # Deadlines are checked even when results are queued, as a backend
+        # may produce them faster than they are consumed.
+        delay = self._check_deadlines()
+        if self.merge_key is not None:
+            return self._pop_merged_response(delay)
+
+        if self.responses:
+            self.not_full.notify()
+            return self.responses.popleft(), delay
+
+        if not self.unfinished:
+            return self.FINISHED, None
+
+        return self.EMPTY, delay
+
+    def _pop_merged_response(self, delay):
+        # Must be called with the lock held, after the deadlines have been
+        # checked: expired backends can't delay the merge anymore.
+        if self.merged and not self.starving:
+            return self._pop_merged(), delay
+
+        if not self.unfinished:
+            return self.FINISHED, None
+
+        return self.EMPTY, delay
+
+    def _next_response(self):
+        """
+        Wait for the next result.
+
+        :returns: the result, or :data:`FINISHED`.
+        """
+        with self.cond:
+            while True:
+                response, delay = self._pop_response()
+                if response is not self.EMPTY:
+                    return response
+
+                if sys.version_info.major < 3 and current_thread().name == 'MainThread':
+                    # On Python 2, an untimed wait can't be interrupted by
+                    # KeyboardInterrupt.
+                    delay = min(delay or self.INTERRUPT_DELAY, self.INTERRUPT_DELAY)
+                self.not_empty.wait(delay)
+
+    def poll_response(self, listener):
+        """
+        Get the next result without waiting.
+
+        If no result is available yet, *listener* is called once, from any
+        thread, when something changes.
+
+        :returns: same as :func:`_pop_response`
+        """
+        with self.cond:
+            response, delay = self._pop_response()
+            if response is self.EMPTY:
+                self.listener = listener
+            return response, delay
+
+    def _wakeup_listener(self):
+        # Must be called with the lock held.
+        if self.listener is not None:
+            listener, self.listener = self.listener, None
+            listener()
 
     def _callback_thread_run(self, callback, errback, finishback):
-        while not self.stop_event.is_set() and (self.tasks.unfinished_tasks or not self.responses.empty()):
-            try:
-                response = self.responses.get(timeout=0.1)
-            except Queue.Empty:
-                continue
-            else:
-                if callback:
-                    callback(response)
+        for response in iter(self._next_response, self.FINISHED):
+            if callback:
+                callback(response)
 
         # Raise errors
         while errback and self.errors:
@@ -150,13 +603,22 @@ class BackendsCall(object):
         return thread
 
     def wait(self):
-        """Wait until all tasks are finished."""
-        for thread in self.threads:
-            thread.join()
+        """Wait until all tasks are finished, or deadlines expired."""
+        with self.cond:
+            while self.unfinished:
+                self.cond.wait(self._check_deadlines())
 
         if self.errors:
             raise CallErrors(self.errors)
 
+    @property
+    def saved_requests(self):
+        """
+        Number of requests browsers did not send because the call was
+        stopped or backends were aborted.
+        """
+        return sum(token.saved for token in self.cancel_tokens.values())
+
     def stop(self, wait=False):
         """
         Stop all tasks.
@@ -166,20 +628,111 @@ class BackendsCall(object):
         """
 
         self.stop_event.set()
+        for token in self.cancel_tokens.values():
+            token.cancel()
+        with self.cond:
+            self._notify_all()
 
         if wait:
             self.wait()
 
     def __iter__(self):
         try:
-            while not self.stop_event.is_set() and (self.tasks.unfinished_tasks or not self.responses.empty()):
-                try:
-                    yield self.responses.get(timeout=0.1)
-                except Queue.Empty:
-                    continue
+            for response in iter(self._next_response, self.FINISHED):
+                yield response
         except:
             self.stop()
             raise
 
         if self.errors:
             raise CallErrors(self.errors)
+
+
+class AsyncBackendsCall(object):
+    """
+    Asynchronous iterator on the results of a :class:`BackendsCall`, to use
+    in an :mod:`asyncio` event loop::
+
+        async for account in weboob.ado('iter_accounts'):
+            print(account.label)
+
+    Backends still run in the threads of the :class:`WorkerPool`; results
+    are handed to the event loop as soon as they are stored, without
+    blocking it. Cancelling the task iterating on this object stops the
+    call.
+
+    As for :class:`BackendsCall`, a :class:`CallErrors` exception is raised
+    at the end of the iteration if some backends failed.
+
+    :param call: the call to iterate on
+    :type call: :class:`BackendsCall`
+    :param loop: event loop; default is the running one
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :raises: :class:`RuntimeError` if no loop is given and no loop is running
+    """
+
+    def __init__(self, call, loop=None):
+        import asyncio
+
+        if loop is None:
+            try:
+                get_running_loop = asyncio.get_running_loop
+            except AttributeError:
+                # Python < 3.7
+                get_running_loop = asyncio._get_running_loop
+            try:
+                loop = get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is None:
+                call.stop()
+                raise RuntimeError('no running event loop, a loop has to be given')
+
+        self.call = call
+        self.loop = loop
+        self.timer = None
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = self.loop.create_future()
+        future.add_done_callback(self._on_done)
+        self._fill(future)
+        return future
+
+    def _on_done(self, future):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if future.cancelled():
+            self.call.stop()
+
+    def _fill(self, future):
+        if future.done():
+            return
+
+        def listener():
+            self.loop.call_soon_threadsafe(self._fill, future)
+
+        response, delay = self.call.poll_response(listener)
+        if response is BackendsCall.EMPTY:
+            if delay is not None:
+                # Wake up to abort backends whose deadline expired.
+                if self.timer is not None:
+                    self.timer.cancel()
+                self.timer = self.loop.call_later(delay, self._fill, future)
+        elif response is BackendsCall.FINISHED:
+            if self.call.errors:
+                future.set_exception(CallErrors(self.call.errors))
+            else:
+                future.set_exception(StopAsyncIteration())
+        else:
+            future.set_result(response)
+
+    def stop(self):
+        """
+        Stop all tasks.
+        """
+        self.call.stop()
@@ -20,13 +20,17 @@
 import os
 import imp
 import logging
+from threading import local
+from time import time
 
-from weboob.tools.backend import Module
+from weboob.capabilities.base import Capability
+from weboob.tools.backend import Module, SharedLock
+from weboob.tools.profiler import startup_profiler
 from weboob.tools.compat import basestring
 from weboob.tools.log import getLogger
 from weboob.exceptions import ModuleLoadError
 
-__all__ = ['LoadedModule', 'ModulesLoader', 'RepositoryModulesLoader']
+__all__ = ['LazyBackend', 'LoadedModule', 'ModulesLoader', 'RepositoryModulesLoader']
 
 
 class LoadedModule(object):
@@ -95,6 +99,158 @@ class LoadedModule(object):
         return backend_instance
 
 
+def _iter_capabilities(cls=Capability):
+    for sub in cls.__subclasses__():
+        yield sub
+        for subsub in _iter_capabilities(sub):
+            yield subsub
+
+
+_capabilities_attrs = {}
+
+
+def _get_capabilities_attrs(capabilities):
+    """
+    Get attributes of all capabilities, found once for each set of
+    capabilities implemented by a module.
+
+    :param capabilities: names of capabilities of a module
+    :type capabilities: list
+    :returns: True for attributes of these capabilities, False for the ones
+              of other capabilities
+    :rtype: dict
+    """
+    key = tuple(sorted(capabilities))
+    attrs = _capabilities_attrs.get(key)
+    if attrs is None:
+        attrs = {}
+        for cap in _iter_capabilities():
+            supported = cap.__name__ in key
+            for attr in cap.__dict__:
+                attrs[attr] = attrs.get(attr, False) or supported
+        _capabilities_attrs[key] = attrs
+    return attrs
+
+
+class LazyBackend(object):
+    """
+    Proxy of a backend which is created on first use.
+
+    Its name and capabilities come from the metadata index of repositories
+    (:class:`weboob.core.repositories.ModuleInfo`), so backends can be
+    filtered (:func:`has_caps`, and :func:`getattr` on a method of a
+    capability) without importing their module. The module is imported, and
+    the backend created, when any other attribute is needed, for example
+    when a method is called.
+
+    Note that the configuration is checked only when the backend is
+    created, so :class:`weboob.tools.backend.Module.ConfigError` is raised
+    by the first call.
+
+    :param weboob: weboob instance
+    :type weboob: :class:`weboob.core.ouiboube.Weboob`
+    :param minfo: metadata of the module
+    :type minfo: :class:`weboob.core.repositories.ModuleInfo`
+    :param name: name of backend
+    :type name: :class:`str`
+    :param params: configuration of backend
+    :type params: :class:`dict`
+    :param storage: storage object
+    :type storage: :class:`weboob.tools.storage.IStorage`
+    """
+
+    _attrs = ('weboob', 'minfo', 'name', 'NAME', 'lock', '_params', '_storage', '_backend', '_local')
+
+    def __init__(self, weboob, minfo, name, params, storage):
+        for attr, value in zip(self._attrs, (weboob, minfo, name, minfo.name, SharedLock(), params, storage, None, local())):
+            object.__setattr__(self, attr, value)
+
+    def __repr__(self):
+        return "<Backend %r>" % self.name
+
+    @property
+    def loaded(self):
+        return self._backend is not None
+
+    @property
+    def backend(self):
+        """
+        The real backend, created on first access.
+
+        :rtype: :class:`weboob.tools.backend.Module`
+        """
+        if self._backend is None:
+            with self.lock, startup_profiler.phase('backends'):
+                if self._backend is None:
+                    start = time()
+                    if not self.minfo.is_installed():
+                        self.weboob.repositories.install(self.minfo)
+                    module = self.weboob.modules_loader.get_or_load_module(self.NAME)
+                    backend = module.create_instance(self.weboob, self.name, self._params, self._storage)
+                    # Calls which entered the proxy hold this lock.
+                    backend.lock = self.lock
+                    backend.cancel_token = getattr(self._local, 'cancel_token', None)
+                    object.__setattr__(self, '_backend', backend)
+                    self.weboob.logger.debug(u'Backend "%s" created on first use in %.3fs', self.name, time() - start)
+        return self._backend
+
+    def has_caps(self, *caps):
+        """
+        Check if this backend implements at least one of these capabilities.
+        """
+        return self.minfo.has_caps(*caps)
+
+    def __enter__(self):
+        # Calls entered before the creation of the backend only hold the
+        # lock, see Module.__enter__().
+        entered = getattr(self._local, 'entered', None)
+        if entered is None:
+            entered = self._local.entered = []
+
+        if self._backend is None:
+            self.lock.acquire()
+            entered.append(None)
+        else:
+            self._backend.__enter__()
+            entered.append(self._backend)
+
+    def __exit__(self, t, v, tb):
+        backend = self._local.entered.pop()
+        if backend is None:
+            self.lock.release()
+        else:
+            backend.__exit__(t, v, tb)
+
+    def deinit(self):
+        if self._backend is not None:
+            self._backend.deinit()
+
+    def __getattr__(self, attr):
+        if self._backend is None:
+            if attr == 'cancel_token':
+                return getattr(self._local, 'cancel_token', None)
+
+            supported = _get_capabilities_attrs(self.minfo.capabilities).get(attr)
+            if supported is not None:
+                if not supported:
+                    raise AttributeError('%s has no attribute %r' % (self, attr))
+
+                def method(*args, **kwargs):
+                    return getattr(self.backend, attr)(*args, **kwargs)
+                method.__name__ = attr
+                return method
+
+        return getattr(self.backend, attr)
+
+    def __setattr__(self, attr, value):
+        if attr in self._attrs:
+            object.__setattr__(self, attr, value)
+        elif attr == 'cancel_token' and self._backend is None:
+            self._local.cancel_token = value
+        else:
+            setattr(self.backend, attr, value)
+
+
 class ModulesLoader(object):
     """
     Load modules.
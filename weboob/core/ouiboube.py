@@ -19,9 +19,13 @@
 
 
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import time
 
-from weboob.core.bcall import BackendsCall
-from weboob.core.modules import ModulesLoader, RepositoryModulesLoader
+from weboob.core.bcall import AsyncBackendsCall, BackendsCall, WorkerPool
+from weboob.core.processes import ProcessPool
+from weboob.core.modules import LazyBackend, ModulesLoader, RepositoryModulesLoader
 from weboob.core.backendscfg import BackendsConfig
 from weboob.core.requests import RequestsManager
 from weboob.core.repositories import Repositories, PrintProgress
@@ -30,6 +34,7 @@ from weboob.tools.backend import Module
 from weboob.tools.compat import basestring, unicode
 from weboob.tools.config.iconfig import ConfigError
 from weboob.tools.log import getLogger
+from weboob.tools.profiler import startup_profiler
 from weboob.exceptions import ModuleLoadError
 
 
@@ -53,12 +58,14 @@ class WebNip(object):
     :type storage: :class:`weboob.tools.storage.IStorage`
     :param scheduler: what scheduler to use; default is :class:`weboob.core.scheduler.Scheduler`
     :type scheduler: :class:`weboob.core.scheduler.IScheduler`
+    :param pool: pool of threads used to call backends; default is :class:`weboob.core.bcall.WorkerPool`
+    :type pool: :class:`weboob.core.bcall.WorkerPool`
     """
     VERSION = '1.4'
 
-    def __init__(self, modules_path=None, storage=None, scheduler=None):
+    def __init__(self, modules_path=None, storage=None, scheduler=None, pool=None):
         self.logger = getLogger('weboob')
-        self.backend_instances = {}
+        self.backend_instances = OrderedDict()
         self.requests = RequestsManager()
 
         if modules_path is None:
@@ -77,6 +84,11 @@ class WebNip(object):
             scheduler = Scheduler()
         self.scheduler = scheduler
 
+        if pool is None:
+            pool = WorkerPool()
+        self.pool = pool
+        self._process_pool = None
+
         self.storage = storage
 
     def __deinit__(self):
@@ -87,7 +99,19 @@ class WebNip(object):
         Call this method when you stop using Weboob, to
         properly unload all correctly.
         """
-        self.unload_backends()
+        states = {}
+        if self._process_pool is not None:
+            states = self._process_pool.shutdown()
+            self._process_pool = None
+        unloaded = self.unload_backends()
+        # Browsers states of backends which ran in worker processes replace
+        # the ones of this process, saved when backends are unloaded.
+        for name, state in states.items():
+            backend = unloaded.get(name)
+            if backend is not None:
+                backend.storage.set('browser_state', state)
+                backend.storage.save()
+        self.pool.shutdown(wait=True)
 
     def build_backend(self, module_name, params=None, storage=None, name=None, nofail=False):
         """
@@ -163,7 +187,9 @@ class WebNip(object):
 
         for name in names:
             backend = self.backend_instances.pop(name)
-            with backend:
+            # Waits for calls in progress, even on backends with a browser
+            # pool.
+            with backend.lock:
                 backend.deinit()
             unloaded[backend.name] = backend
 
@@ -222,10 +248,22 @@ class WebNip(object):
             return self.do(name, *args, **kwargs)
         return caller
 
+    @property
+    def process_pool(self):
+        """
+        Pool of processes used by :func:`do` with *processes* set, started
+        on first use.
+
+        :rtype: :class:`weboob.core.processes.ProcessPool`
+        """
+        if self._process_pool is None:
+            self._process_pool = ProcessPool(self)
+        return self._process_pool
+
     def do(self, function, *args, **kwargs):
         r"""
-        Do calls on loaded backends with specified arguments, in separated
-        threads.
+        Do calls on loaded backends with specified arguments, in threads of
+        the :attr:`pool`.
 
         This function has two modes:
 
@@ -241,12 +279,28 @@ class WebNip(object):
         :type backends: list[:class:`str`]
         :param caps: iterate on backends which implement this caps
         :type caps: list[:class:`weboob.capabilities.base.Capability`]
+        :param timeout: maximum duration of the call, in seconds
+        :type timeout: float
+        :param per_backend_timeout: maximum duration of the task of each backend, in seconds
+        :type per_backend_timeout: float
+        :param processes: run each backend in a worker process of
+                          :attr:`process_pool`, for CPU-bound backends
+        :type processes: bool
+        :param merge_key: yield results of all backends sorted by this key;
+                          results of each backend have to be sorted already
+        :type merge_key: :class:`callable`
+        :param merge_reverse: merge results in descending order
+        :type merge_reverse: bool
         :rtype: A :class:`weboob.core.bcall.BackendsCall` object (iterable)
+
+        When a deadline expires, results already gathered are still yielded
+        and late backends are reported in :class:`weboob.core.bcall.CallErrors`
+        with a :class:`weboob.core.bcall.CallTimeout` error.
         """
         backends = list(self.backend_instances.values())
         _backends = kwargs.pop('backends', None)
         if _backends is not None:
-            if isinstance(_backends, Module):
+            if isinstance(_backends, (Module, LazyBackend)):
                 backends = [_backends]
             elif isinstance(_backends, basestring):
                 if len(_backends) > 0:
@@ -271,11 +325,32 @@ class WebNip(object):
             caps = kwargs.pop('caps')
             backends = [backend for backend in backends if backend.has_caps(caps)]
 
+        if kwargs.pop('processes', False):
+            kwargs['process_pool'] = self.process_pool
+
         # The return value MUST BE the BackendsCall instance. Please never iterate
         # here on this object, because caller might want to use other methods, like
         # wait() on callback_thread().
         # Thanks a lot.
-        return BackendsCall(backends, function, *args, **kwargs)
+        return BackendsCall(backends, function, *args, pool=self.pool, **kwargs)
+
+    def ado(self, function, *args, **kwargs):
+        """
+        Do calls on loaded backends like :func:`do`, but return an
+        asynchronous iterator to use in an :mod:`asyncio` event loop::
+
+            async for account in weboob.ado('iter_accounts', caps=CapBank, timeout=30):
+                print(account.label)
+
+        It takes the same parameters than :func:`do`, and also:
+
+        :param loop: event loop; default is the running one, so it has to be
+                     given when it is not called from a coroutine
+        :type loop: :class:`asyncio.AbstractEventLoop`
+        :rtype: :class:`weboob.core.bcall.AsyncBackendsCall`
+        """
+        loop = kwargs.pop('loop', None)
+        return AsyncBackendsCall(self.do(function, *args, **kwargs), loop)
 
     def schedule(self, interval, function, *args):
         """
@@ -321,6 +396,7 @@ class WebNip(object):
         """
         Run the scheduler loop
         """
+        startup_profiler.stop()
         return self.scheduler.run()
 
     def load_or_install_module(self, module_name):
@@ -342,11 +418,15 @@ class Weboob(WebNip):
     :type backends_filename: str
     :param storage: provide a storage where backends can save data
     :type storage: :class:`weboob.tools.storage.IStorage`
+    :param pool: pool of threads used to call backends
+    :type pool: :class:`weboob.core.bcall.WorkerPool`
     """
     BACKENDS_FILENAME = 'backends'
+    # Maximum number of modules and backends loaded at the same time.
+    LOAD_WORKERS = 8
 
-    def __init__(self, workdir=None, datadir=None, backends_filename=None, scheduler=None, storage=None):
-        super(Weboob, self).__init__(modules_path=False, scheduler=scheduler, storage=storage)
+    def __init__(self, workdir=None, datadir=None, backends_filename=None, scheduler=None, storage=None, pool=None):
+        super(Weboob, self).__init__(modules_path=False, scheduler=scheduler, storage=storage, pool=pool)
 
         # Create WORKDIR
         if workdir is None:
@@ -371,7 +451,8 @@ class Weboob(WebNip):
         self._create_dir(_datadir)
 
         # Modules management
-        self.repositories = Repositories(workdir, _datadir, self.VERSION)
+        with startup_profiler.phase('repositories'):
+            self.repositories = Repositories(workdir, _datadir, self.VERSION)
         self.modules_loader = RepositoryModulesLoader(self.repositories)
 
         # Backend instances config
@@ -381,6 +462,10 @@ class Weboob(WebNip):
             backends_filename = os.path.join(self.workdir, backends_filename)
         self.backends_config = BackendsConfig(backends_filename)
 
+        # Durations of the import of the module and of the creation of each
+        # backend loaded by load_backends(), in seconds.
+        self.load_times = {}
+
     def _create_dir(self, name):
         if not os.path.exists(name):
             os.makedirs(name)
@@ -423,7 +508,7 @@ class Weboob(WebNip):
 
         return super(Weboob, self).build_backend(module_name, params, storage, name, nofail)
 
-    def load_backends(self, caps=None, names=None, modules=None, exclude=None, storage=None, errors=None):
+    def load_backends(self, caps=None, names=None, modules=None, exclude=None, storage=None, errors=None, lazy=False):
         """
         Load backends listed in config file.
 
@@ -439,10 +524,19 @@ class Weboob(WebNip):
         :type storage: :class:`weboob.tools.storage.IStorage`
         :param errors: if specified, store every errors in this list
         :type errors: list[:class:`LoadError`]
+        :param lazy: do not import modules, but return proxies which create
+                     backends on first use (see
+                     :class:`weboob.core.modules.LazyBackend`)
+        :type lazy: :class:`bool`
+
+        Modules are installed and imported, and backends created, by up to
+        :attr:`LOAD_WORKERS` threads; backends are still added in the order
+        of the configuration. Durations are stored in :attr:`load_times`.
+
         :returns: loaded backends
         :rtype: dict[:class:`str`, :class:`weboob.tools.backend.Module`]
         """
-        loaded = {}
+        loaded = OrderedDict()
         if storage is None:
             storage = self.storage
 
@@ -450,6 +544,9 @@ class Weboob(WebNip):
             self.logger.error(u'Repositories are not consistent with the sources.list')
             raise VersionsMismatchError(u'Versions mismatch, please run "weboob-config update"')
 
+        # Backends to load, in order of the configuration, and their modules.
+        to_load = []
+        minfos = OrderedDict()
         for backend_name, module_name, params in self.backends_config.iter_backends():
             if '_enabled' in params and not params['_enabled'].lower() in ('1', 'y', 'true', 'on', 'yes') or \
                names is not None and backend_name not in names or \
@@ -466,29 +563,72 @@ class Weboob(WebNip):
             if caps is not None and not minfo.has_caps(caps):
                 continue
 
-            if not minfo.is_installed():
-                self.repositories.install(minfo)
-
-            module = None
-            try:
-                module = self.modules_loader.get_or_load_module(module_name)
-            except ModuleLoadError as e:
-                self.logger.error(u'Unable to load module "%s": %s', module_name, e)
-                continue
-
             if backend_name in self.backend_instances:
                 self.logger.warning(u'Oops, the backend "%s" is already loaded. Unload it before reloading...', backend_name)
                 self.unload_backends(backend_name)
 
-            try:
-                backend_instance = module.create_instance(self, backend_name, params, storage)
-            except Module.ConfigError as e:
-                if errors is not None:
-                    errors.append(self.LoadError(backend_name, e))
-            else:
-                self.backend_instances[backend_name] = loaded[backend_name] = backend_instance
+            to_load.append((backend_name, module_name, params))
+            minfos[module_name] = minfo
+
+        if lazy:
+            for backend_name, module_name, params in to_load:
+                self.backend_instances[backend_name] = loaded[backend_name] = \
+                    LazyBackend(self, minfos[module_name], backend_name, params, storage)
+            return loaded
+
+        # Modules are installed and imported concurrently, then backends
+        # are created as soon as their module is ready (reading passwords
+        # with external commands may be slow). Modules jobs are submitted
+        # first, so a backend job never waits for a job which has not
+        # started yet.
+        executor = ThreadPoolExecutor(max_workers=self.LOAD_WORKERS)
+        try:
+            modules_jobs = dict((module_name, executor.submit(self._load_module, minfo))
+                                for module_name, minfo in minfos.items())
+            backends_jobs = [(backend_name, executor.submit(self._create_backend, modules_jobs[module_name],
+                                                            backend_name, params, storage))
+                             for backend_name, module_name, params in to_load]
+
+            for backend_name, job in backends_jobs:
+                try:
+                    backend_instance = job.result()
+                except Module.ConfigError as e:
+                    if errors is not None:
+                        errors.append(self.LoadError(backend_name, e))
+                else:
+                    if backend_instance is not None:
+                        self.backend_instances[backend_name] = loaded[backend_name] = backend_instance
+        finally:
+            executor.shutdown()
+
         return loaded
 
+    def _load_module(self, minfo):
+        start = time()
+        if not minfo.is_installed():
+            self.repositories.install(minfo)
+
+        try:
+            module = self.modules_loader.get_or_load_module(minfo.name)
+        except ModuleLoadError as e:
+            self.logger.error(u'Unable to load module "%s": %s', minfo.name, e)
+            module = None
+
+        return module, time() - start
+
+    def _create_backend(self, module_job, backend_name, params, storage):
+        module, module_time = module_job.result()
+        if module is None:
+            return None
+
+        start = time()
+        try:
+            return module.create_instance(self, backend_name, params, storage)
+        finally:
+            self.load_times[backend_name] = (module_time, time() - start)
+            self.logger.debug(u'Backend "%s" loaded in %.3fs (module %s: %.3fs)',
+                              backend_name, time() - start, module.name, module_time)
+
     def load_or_install_module(self, module_name):
         """ Load a backend, and install it if not done before """
         try:
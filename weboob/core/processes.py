@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+
+import multiprocessing
+import pickle
+import sys
+from collections import deque
+from importlib import import_module
+from itertools import count
+from threading import Lock, Thread
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+from weboob.core.modules import LazyBackend, ModulesLoader
+from weboob.tools.compat import basestring
+from weboob.tools.log import getLogger
+from weboob.tools.misc import get_backtrace
+
+
+__all__ = ['ProcessPool', 'RemoteError']
+
+
+class RemoteError(Exception):
+    """
+    Raised when an error of a worker process can't be sent back, or when
+    the worker process died.
+    """
+
+
+def _dumps(obj):
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def _get_context():
+    # Worker processes are forked, so they inherit the weboob instance and
+    # the configuration of the parent process.
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 always forks on POSIX systems.
+        return multiprocessing
+    except ValueError:
+        raise NotImplementedError('Process pools require the fork start method')
+
+
+def _load_class(weboob, modname, classname, module_name):
+    """
+    Get the class of a backend in a worker process.
+
+    :param modname: python module where the class is defined
+    :param classname: name of the class
+    :param module_name: name of the weboob module
+    """
+    if modname not in sys.modules:
+        # Imported by the parent process after the fork, for example on
+        # first use of a LazyBackend.
+        loader = getattr(weboob, 'modules_loader', None)
+        if isinstance(loader, ModulesLoader) and module_name:
+            loader.get_or_load_module(module_name)
+        if modname not in sys.modules:
+            import_module(modname)
+    return getattr(sys.modules[modname], classname)
+
+
+class WorkerProcess(object):
+    """
+    A forked process running tasks of backends, one at a time.
+
+    Backends are built again in the process, with their own browsers, the
+    first time they are used, and kept alive until the end.
+
+    :param weboob: weboob instance used to build backends in the process
+    :type weboob: :class:`weboob.core.ouiboube.WebNip`
+    :param inherited: connections of other workers, closed in this process
+    :type inherited: list
+    """
+
+    def __init__(self, weboob, inherited=()):
+        self.logger = getLogger('processes')
+        context = _get_context()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=self._child_run,
+                                       args=(weboob, child_conn, list(inherited) + [self.conn]))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+        self.lock = Lock()
+        self.ids = count()
+        # Queues of results of running jobs, by job id.
+        self.jobs = {}
+        # Browsers states sent back by the process when it exits.
+        self.states = {}
+        self.alive = True
+
+        self.reader = Thread(target=self._read_run, name='process-reader-%d' % self.process.pid)
+        self.reader.daemon = True
+        self.reader.start()
+
+    # -- parent side ------------
+
+    def _read_run(self):
+        while True:
+            try:
+                kind, job_id, data = self.conn.recv()
+            except (EOFError, IOError, OSError):
+                break
+
+            try:
+                payload = pickle.loads(data)
+            except Exception as e:
+                kind, payload = 'error', (RemoteError('Unable to load result: %r' % e), get_backtrace(e))
+
+            if kind == 'state':
+                name, state = payload
+                self.states[name] = state
+                continue
+
+            with self.lock:
+                queue = self.jobs.get(job_id)
+            if queue is not None:
+                queue.put((kind, payload))
+
+        with self.lock:
+            self.alive = False
+            jobs, self.jobs = self.jobs, {}
+        for queue in jobs.values():
+            queue.put(('error', (RemoteError('Worker process %d died' % self.process.pid), '')))
+            queue.put(('done', None))
+
+    def _send(self, msg):
+        with self.lock:
+            if not self.alive:
+                raise RemoteError('Worker process %d died' % self.process.pid)
+            self.conn.send(msg)
+
+    def run(self, recipe, function, args, kwargs):
+        """
+        Run a task in the process.
+
+        :param recipe: (python module and name of the backend class, name
+                       of the weboob module, backend name, params) used to
+                       build the backend in the process
+        :type recipe: tuple
+        :returns: an iterator on results
+        """
+        # Arguments are pickled here to raise errors in the calling thread.
+        data = _dumps((recipe, function, args, kwargs))
+
+        job_id = next(self.ids)
+        queue = Queue.Queue()
+        with self.lock:
+            self.jobs[job_id] = queue
+        self._send(('run', job_id, data))
+
+        finished = False
+        try:
+            while True:
+                kind, payload = queue.get()
+                if kind == 'result':
+                    yield payload
+                elif kind == 'error':
+                    error, backtrace = payload
+                    error.remote_backtrace = backtrace
+                    raise error
+                else:
+                    finished = True
+                    return
+        finally:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+            if not finished:
+                try:
+                    self._send(('stop', job_id, None))
+                except (RemoteError, IOError, OSError):
+                    pass
+
+    def stop(self):
+        """
+        Ask the process to exit, and wait for it.
+        """
+        try:
+            self._send(('exit', None, None))
+        except (RemoteError, IOError, OSError):
+            pass
+        self.reader.join()
+        self.process.join()
+
+    # -- child side -------------
+
+    @classmethod
+    def _child_run(cls, weboob, conn, inherited):
+        from weboob.core.bcall import WorkerPool
+
+        for c in inherited:
+            c.close()
+
+        # Threads of the parent do not exist in this process.
+        weboob.pool = WorkerPool()
+        weboob._process_pool = None
+
+        backends = {}
+        pending = deque()
+
+        def send(kind, job_id, payload):
+            conn.send((kind, job_id, _dumps(payload)))
+
+        def is_stopped(job_id):
+            # Read messages received while running a job, to know if it has
+            # to stop.
+            while conn.poll():
+                msg = conn.recv()
+                if msg[0] == 'stop' and msg[1] == job_id:
+                    return True
+                pending.append(msg)
+            return False
+
+        while True:
+            try:
+                kind, job_id, data = pending.popleft() if pending else conn.recv()
+            except EOFError:
+                break
+
+            if kind == 'exit':
+                break
+            if kind != 'run':
+                # A stop for a job already finished.
+                continue
+
+            try:
+                recipe, function, args, kwargs = pickle.loads(data)
+
+                modname, classname, module_name, backend_name, params = recipe
+                backend = backends.get(backend_name)
+                if backend is None:
+                    klass = _load_class(weboob, modname, classname, module_name)
+                    backend = klass(weboob, backend_name, params, weboob.storage)
+                    backends[backend_name] = backend
+
+                if callable(function):
+                    result = function(backend, *args, **kwargs)
+                else:
+                    result = getattr(backend, function)(*args, **kwargs)
+
+                if hasattr(result, '__iter__') and not isinstance(result, (bytes, basestring)):
+                    for subresult in result:
+                        send('result', job_id, subresult)
+                        if is_stopped(job_id):
+                            break
+                elif result is not None:
+                    send('result', job_id, result)
+            except Exception as error:
+                backtrace = get_backtrace(error)
+                try:
+                    # Be sure the error can be rebuilt by the parent.
+                    pickle.loads(_dumps(error))
+                except Exception:
+                    error = RemoteError('%s: %s' % (type(error).__name__, error))
+                send('error', job_id, (error, backtrace))
+
+            send('done', job_id, None)
+
+        for name, backend in backends.items():
+            if backend._browser is not None and hasattr(backend.browser, 'dump_state'):
+                send('state', None, (name, backend.browser.dump_state()))
+        conn.close()
+
+
+class ProcessPool(object):
+    """
+    Pool of processes used to run tasks of CPU-bound backends.
+
+    Each backend is pinned to one process, where it is built again with its
+    own browser, so the browser state stays in this process. When the pool
+    is shut down, browsers states are sent back to the parent process.
+
+    Arguments, results and errors are pickled; results which are
+    :class:`weboob.capabilities.base.BaseObject` only carry their fields
+    values. Functions given as callables have to be picklable, so use method
+    names when possible.
+
+    :param weboob: weboob instance
+    :type weboob: :class:`weboob.core.ouiboube.WebNip`
+    :param max_processes: maximum number of processes; default is the number of CPUs
+    :type max_processes: int
+    """
+
+    def __init__(self, weboob, max_processes=None):
+        self.logger = getLogger('processes')
+        self.weboob = weboob
+        self.max_processes = max_processes or multiprocessing.cpu_count()
+        self.lock = Lock()
+        self.workers = []
+        # Worker process of each backend, by backend name.
+        self.assigned = {}
+
+    def get_worker(self, backend):
+        """
+        Get the process where a backend is pinned.
+
+        :rtype: :class:`WorkerProcess`
+        """
+        with self.lock:
+            worker = self.assigned.get(backend.name)
+            if worker is not None and worker.alive:
+                return worker
+
+            self.workers = [w for w in self.workers if w.alive]
+            if len(self.workers) < self.max_processes:
+                worker = WorkerProcess(self.weboob, [w.conn for w in self.workers])
+                self.workers.append(worker)
+                self.logger.debug('Started worker process %d', worker.process.pid)
+            else:
+                load = dict((w, 0) for w in self.workers)
+                for w in self.assigned.values():
+                    if w in load:
+                        load[w] += 1
+                worker = min(self.workers, key=lambda w: load[w])
+
+            self.assigned[backend.name] = worker
+            return worker
+
+    def run(self, backend, function, args, kwargs):
+        """
+        Run a task of a backend in its process.
+
+        :returns: an iterator on results
+        """
+        if isinstance(backend, LazyBackend):
+            backend = backend.backend
+        params = dict((key, value.get()) for key, value in backend.config.items())
+        params.update(backend._private_config)
+        # The class is sent by name, as its module may have been imported
+        # after the worker process was forked.
+        klass = type(backend)
+        recipe = (klass.__module__, klass.__name__, klass.NAME, backend.name, params)
+        return self.get_worker(backend).run(recipe, function, args, kwargs)
+
+    def shutdown(self):
+        """
+        Stop every process.
+
+        :returns: browsers states sent back by processes, by backend name
+        :rtype: dict
+        """
+        with self.lock:
+            workers, self.workers = self.workers, []
+            self.assigned = {}
+
+        states = {}
+        for worker in workers:
+            worker.stop()
+            states.update(worker.states)
+        return states
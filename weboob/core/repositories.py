@@ -30,10 +30,14 @@ import hashlib
 from datetime import datetime
 from contextlib import closing
 from compileall import compile_dir
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from io import BytesIO, StringIO
+from threading import Lock, local
 
+import weboob
 from weboob.exceptions import BrowserHTTPError, BrowserHTTPNotFound, ModuleInstallError
 from .modules import LoadedModule
+from weboob.tools.backend import SharedLock
 from weboob.tools.log import getLogger
 from weboob.tools.misc import get_backtrace, to_unicode, find_exe
 from weboob.tools.compat import basestring, unicode
@@ -41,6 +45,10 @@ try:
     from ConfigParser import RawConfigParser, DEFAULTSECT
 except ImportError:
     from configparser import RawConfigParser, DEFAULTSECT
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 
 def open_for_config(filename):
@@ -62,6 +70,9 @@ class ModuleInfo(object):
         self.path = None
         self.url = None
         self.repo_url = None
+        # URL of the manifest of files of the module, if they can be
+        # downloaded one by one (see ModuleManifest).
+        self.manifest_url = None
 
         self.version = 0
         self.capabilities = ()
@@ -108,6 +119,104 @@ class ModuleInfo(object):
                )
 
 
+def read_module_info(path, name):
+    """
+    Import a module from the sources of a repository, and get its information.
+
+    It is run in worker processes by :func:`Repository.build_index`, so
+    errors are returned instead of raised.
+
+    :returns: module information, error message and backtrace
+    :rtype: tuple[:class:`ModuleInfo`, str, str]
+    """
+    try:
+        fp, pathname, description = imp.find_module(name, [path])
+        try:
+            module = LoadedModule(imp.load_module(name, fp, pathname, description))
+        finally:
+            if fp:
+                fp.close()
+    except Exception as e:
+        return None, '[%s] %s' % (type(e).__name__, e), get_backtrace(e)
+
+    m = ModuleInfo(module.name)
+    m.capabilities = sorted(set([c.__name__ for c in module.iter_caps()]))
+    m.description = module.description
+    m.maintainer = module.maintainer
+    m.license = module.license
+    m.icon = module.icon or ''
+    return m, None, None
+
+
+class ModuleManifest(object):
+    """
+    Files of a module with the SHA-256 hash of their contents.
+
+    Repositories built with manifests also serve every file in their
+    *objects/* directory by hash, so clients only download files which
+    changed since the installed version.
+
+    :param files: hashes by relative paths
+    :type files: dict[str, str]
+    """
+    OBJECTS_DIR = 'objects'
+
+    def __init__(self, files=None):
+        self.files = files or {}
+
+    @classmethod
+    def from_tree(cls, path, exclude=None):
+        """
+        Build the manifest of files of a directory.
+
+        :param exclude: function which returns True for filenames to skip
+        :type exclude: callable
+        """
+        files = {}
+        for root, dirs, filenames in os.walk(path):
+            for filename in filenames:
+                filename = os.path.join(root, filename)
+                if exclude is None or not exclude(filename):
+                    relpath = os.path.relpath(filename, path).replace(os.sep, '/')
+                    files[relpath] = cls.hash_file(filename)
+        return cls(files)
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Parse a manifest, as returned by :func:`dump`.
+
+        :type data: bytes
+        """
+        files = {}
+        for line in data.decode('utf-8').splitlines():
+            digest, relpath = line.split('  ', 1)
+            if not re.match('^[0-9a-f]{64}$', digest) or relpath.startswith('/') or '..' in relpath.split('/'):
+                raise ValueError('Invalid line in manifest: %r' % line)
+            files[relpath] = digest
+        return cls(files)
+
+    def dump(self):
+        """
+        Dump manifest, with a line "HASH  PATH" per file.
+
+        :rtype: bytes
+        """
+        return u''.join(u'%s  %s\n' % (digest, relpath) for relpath, digest in sorted(self.files.items())).encode('utf-8')
+
+    @staticmethod
+    def hash_file(filename):
+        with open(filename, 'rb') as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+
+    @classmethod
+    def object_path(cls, digest):
+        """
+        Get path of a file, relative to the repository or to the local store.
+        """
+        return posixpath.join(cls.OBJECTS_DIR, digest[:2], digest[2:])
+
+
 class RepositoryUnavailable(Exception):
     """
     Repository in not available.
@@ -131,6 +240,7 @@ class Repository(object):
         self.signed = False
         self.key_update = 0
         self.obsolete = False
+        self.manifests = False
         self.logger = getLogger('repository')
 
         self.modules = {}
@@ -148,6 +258,15 @@ class Repository(object):
     def __repr__(self):
         return '<Repository %r>' % self.name
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['logger']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = getLogger('repository')
+
     def localurl2path(self):
         """
         Get a local path of a file:// URL.
@@ -239,6 +358,7 @@ class Repository(object):
             self.signed = bool(int(items.get('signed', '0')))
             self.key_update = int(items.get('key_update', '0'))
             self.obsolete = bool(int(items.get('obsolete', '0')))
+            self.manifests = bool(int(items.get('manifests', '0')))
         except KeyError as e:
             raise RepositoryUnavailable('Missing global parameters in repository: %s' % e)
         except ValueError as e:
@@ -262,16 +382,29 @@ class Repository(object):
                 module.url = posixpath.join(self.url, '%s.tar.gz' % module.name)
                 module.repo_url = self.url
                 module.signed = self.signed
+                if self.manifests:
+                    module.manifest_url = posixpath.join(self.url, '%s.manifest' % module.name)
             self.modules[section] = module
 
-    def build_index(self, path, filename):
+    def build_index(self, path, filename, cache_path=None, max_workers=None):
         """
         Rebuild index of modules of repository.
 
+        Modules are imported in up to *max_workers* processes. With a
+        *cache_path*, only modules whose files changed since the previous
+        build are imported, information about other ones is read from this
+        cache. The index is the same as with a full rebuild.
+
         :param path: path of the repository
         :type path: str
         :param filename: file to save index
         :type filename: str
+        :param cache_path: file where information of modules is kept between
+                           builds; it should not be in the published
+                           repository
+        :type cache_path: str
+        :param max_workers: number of processes, by default the number of CPUs
+        :type max_workers: int
         """
         self.logger.debug('Rebuild index')
         self.modules.clear()
@@ -283,47 +416,128 @@ class Repository(object):
             self.signed = False
             self.key_update = 0
 
+        # Information of modules may also depend on the core (capabilities
+        # they inherit, for example), so a new core invalidates the cache.
+        core_key = self.get_core_key()
+        cache = self.load_build_cache(cache_path, core_key) if cache_path else {}
+
+        hashes = {}
+        infos = {}
         for name in sorted(os.listdir(path)):
             module_path = os.path.join(path, name)
             if not os.path.isdir(module_path) or '.' in name or name == self.KEYDIR:
                 continue
 
-            try:
-                fp, pathname, description = imp.find_module(name, [path])
-                try:
-                    module = LoadedModule(imp.load_module(name, fp, pathname, description))
-                finally:
-                    if fp:
-                        fp.close()
-            except Exception as e:
-                print('Unable to build module %s: [%s] %s' % (name, type(e).__name__, e), file=sys.stderr)
-                self.logger.debug(get_backtrace(e))
+            hashes[name] = self.get_tree_hash(module_path)
+            if name in cache and cache[name][0] == hashes[name]:
+                infos[name] = cache[name][1]
             else:
-                m = ModuleInfo(module.name)
-                m.version = self.get_tree_mtime(module_path)
-                m.capabilities = list(set([c.__name__ for c in module.iter_caps()]))
-                m.description = module.description
-                m.maintainer = module.maintainer
-                m.license = module.license
-                m.icon = module.icon or ''
-                self.modules[module.name] = m
+                infos[name] = None
+
+        to_import = [name for name, m in infos.items() if m is None]
+        self.logger.debug('Import %d modules of %d', len(to_import), len(infos))
+        if to_import:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                jobs = [(name, executor.submit(read_module_info, path, name)) for name in sorted(to_import)]
+                for name, job in jobs:
+                    m, error, backtrace = job.result()
+                    if m is None:
+                        print('Unable to build module %s: %s' % (name, error), file=sys.stderr)
+                        self.logger.debug(backtrace)
+                    infos[name] = m
+
+        for name, m in sorted(infos.items()):
+            if m is None:
+                continue
+            m.version = self.get_tree_mtime(os.path.join(path, name))
+            self.modules[m.name] = m
 
         self.update = int(datetime.now().strftime('%Y%m%d%H%M'))
         self.save(filename)
+        if cache_path:
+            self.save_build_cache(cache_path, core_key,
+                                  dict((name, (hashes[name], m)) for name, m in infos.items() if m is not None))
+
+    @classmethod
+    def get_core_key(cls):
+        """
+        Get a key of the weboob package, which changes when one of its files
+        is modified. Files are not read, as they are many.
+        """
+        path = os.path.dirname(weboob.__file__)
+        return repr(max([os.path.getmtime(filename) for filename in cls.iter_tree_files(path)] or [0]))
 
     @staticmethod
-    def get_tree_mtime(path, include_root=False):
-        mtime = 0
-        if include_root:
-            mtime = int(datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d%H%M'))
+    def load_build_cache(filename, core_key):
+        """
+        Load the cache of a previous build of the index.
+
+        :returns: hash and information of every module, by directory name
+        :rtype: dict[str, tuple[str, :class:`ModuleInfo`]]
+        """
+        config = RawConfigParser()
+        if not config.read(filename) or config.defaults().get('core') != core_key:
+            return {}
+
+        cache = {}
+        for section in config.sections():
+            items = dict(config.items(section))
+            m = ModuleInfo(to_unicode(items['name']))
+            m.load(items)
+            m.icon = m.icon or ''
+            cache[section] = (items['hash'], m)
+        return cache
+
+    @staticmethod
+    def save_build_cache(filename, core_key, cache):
+        config = RawConfigParser()
+        config.set(DEFAULTSECT, 'core', core_key)
+        for name, (tree_hash, module) in sorted(cache.items()):
+            config.add_section(name)
+            for key, value in (('hash', tree_hash), ('name', module.name)) + module.dump():
+                if sys.version_info.major == 2:
+                    config.set(name, key, to_unicode(value).encode('utf-8'))
+                else:
+                    config.set(name, key, value)
+
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open_for_config(filename) as f:
+            config.write(f)
+
+    @staticmethod
+    def iter_tree_files(path):
         for root, dirs, files in os.walk(path):
-            for f in files:
+            dirs.sort()
+            for f in sorted(files):
                 if f.endswith('.pyc'):
                     continue
-                m = int(datetime.fromtimestamp(os.path.getmtime(os.path.join(root, f))).strftime('%Y%m%d%H%M'))
-                mtime = max(mtime, m)
+                yield os.path.join(root, f)
 
-        return mtime
+    @classmethod
+    def get_tree_mtime(cls, path, include_root=False):
+        mtime = 0
+        if include_root:
+            mtime = os.path.getmtime(path)
+        for filename in cls.iter_tree_files(path):
+            mtime = max(mtime, os.path.getmtime(filename))
+
+        if not mtime:
+            return 0
+        return int(datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M'))
+
+    @classmethod
+    def get_tree_hash(cls, path):
+        """
+        Get a hash of names and contents of files of a tree.
+        """
+        h = hashlib.sha1()
+        for filename in cls.iter_tree_files(path):
+            h.update(os.path.relpath(filename, path).encode('utf-8'))
+            h.update(b'\0')
+            with open(filename, 'rb') as fp:
+                h.update(hashlib.sha1(fp.read()).digest())
+        return h.hexdigest()
 
     def save(self, filename, private=False):
         """
@@ -340,10 +554,12 @@ class Repository(object):
         config.set(DEFAULTSECT, 'maintainer', self.maintainer)
         config.set(DEFAULTSECT, 'signed', int(self.signed))
         config.set(DEFAULTSECT, 'key_update', self.key_update)
+        if self.manifests:
+            config.set(DEFAULTSECT, 'manifests', 1)
         if private:
             config.set(DEFAULTSECT, 'url', self.url)
 
-        for module in self.modules.values():
+        for module in sorted(self.modules.values(), key=lambda module: module.name):
             config.add_section(module.name)
             for key, value in module.dump():
                 if sys.version_info.major == 2:
@@ -359,9 +575,16 @@ class Repository(object):
 class Versions(object):
     VERSIONS_LIST = 'versions.list'
 
-    def __init__(self, path):
+    def __init__(self, path, versions=None):
         self.path = path
         self.versions = {}
+        # Modules can be installed concurrently by Weboob.load_backends().
+        self.lock = Lock()
+
+        if versions is not None:
+            # Read from the cache of Repositories.
+            self.versions.update(versions)
+            return
 
         try:
             with open(os.path.join(self.path, self.VERSIONS_LIST), 'r') as fp:
@@ -378,16 +601,21 @@ class Versions(object):
         return self.versions.get(name, None)
 
     def set(self, name, version):
-        self.versions[name] = int(version)
-        self.save()
+        with self.lock:
+            self.versions[name] = int(version)
+            self.save()
 
     def save(self):
         config = RawConfigParser()
         for name, version in self.versions.items():
             config.set(DEFAULTSECT, name, version)
 
-        with open_for_config(os.path.join(self.path, self.VERSIONS_LIST)) as fp:
+        # The file is replaced and not rewritten, as it may be shared with a
+        # copy of the modules directory (see Repositories.update()).
+        filename = os.path.join(self.path, self.VERSIONS_LIST)
+        with open_for_config(filename + '.tmp') as fp:
             config.write(fp)
+        os.rename(filename + '.tmp', filename)
 
 
 class IProgress(object):
@@ -437,14 +665,31 @@ class Repositories(object):
     REPOS_DIR = 'repositories'
     KEYRINGS_DIR = 'keyrings'
     ICONS_DIR = 'icons'
+    OBJECTS_DIR = ModuleManifest.OBJECTS_DIR
+
+    SHARE_DIRS = [MODULES_DIR, REPOS_DIR, KEYRINGS_DIR, ICONS_DIR, OBJECTS_DIR]
 
-    SHARE_DIRS = [MODULES_DIR, REPOS_DIR, KEYRINGS_DIR, ICONS_DIR]
+    CACHE = 'repositories.cache'
+    CACHE_VERSION = 1
+
+    UPDATE_WORKERS = 8
+    """
+    Number of modules downloaded concurrently by :func:`update`.
+    """
+
+    VERIFY_BATCH = 16
+    """
+    Number of downloaded modules which signatures are checked together.
+    """
 
     def __init__(self, workdir, datadir, version):
         self.logger = getLogger('repositories')
         self.version = version
 
         self.browser = None
+        self.browser_lock = Lock()
+        # Browsers used by installs, which may run concurrently.
+        self.thread_browsers = local()
 
         self.workdir = workdir
         self.datadir = datadir
@@ -453,14 +698,31 @@ class Repositories(object):
         self.repos_dir = os.path.join(self.datadir, self.REPOS_DIR)
         self.keyrings_dir = os.path.join(self.datadir, self.KEYRINGS_DIR)
         self.icons_dir = os.path.join(self.datadir, self.ICONS_DIR)
+        # Files of modules installed with manifests, by hash.
+        self.objects_dir = os.path.join(self.datadir, self.OBJECTS_DIR)
+        self.objects_lock = Lock()
+        self.objects_locks = {}
+        # Held shared from the download of files of modules until their
+        # manifests are written, and exclusively to prune the store.
+        self.store_lock = SharedLock()
 
         self.create_dir(self.datadir)
+        if not os.path.exists(self.modules_dir) and os.path.isdir(self.modules_dir + '.old'):
+            # An update has been interrupted while it was replacing modules.
+            os.rename(self.modules_dir + '.old', self.modules_dir)
         self.create_dir(self.modules_dir)
         self.create_dir(self.repos_dir)
         self.create_dir(self.keyrings_dir)
         self.create_dir(self.icons_dir)
+        self.create_dir(self.objects_dir)
 
-        self.versions = Versions(self.modules_dir)
+        self.cache_path = os.path.join(self.datadir, self.CACHE)
+        # State of repositories and versions of modules, parsed from their
+        # files and cached in one file. It is valid as long as these files
+        # and sources.list are not modified.
+        self.cache = None
+        cache = self.read_cache()
+        self.versions = Versions(self.modules_dir, cache and cache['versions'])
 
         self.repositories = []
 
@@ -468,17 +730,88 @@ class Repositories(object):
             with open_for_config(self.sources_list) as f:
                 f.write(DEFAULT_SOURCES_LIST)
             self.update()
+        elif cache is not None:
+            self.repositories = cache['repositories']
+            self.cache = cache
         else:
             self.load()
 
-    def load_browser(self):
+    def get_cache_stamps(self):
+        """
+        Get modification times, sizes and inodes of files which are cached.
+        """
+        stamps = []
+        filenames = [self.sources_list, os.path.join(self.modules_dir, Versions.VERSIONS_LIST)]
+        filenames += [os.path.join(self.repos_dir, name) for name in sorted(os.listdir(self.repos_dir))]
+        for filename in filenames:
+            try:
+                st = os.stat(filename)
+            except OSError:
+                stamps.append((filename, None))
+            else:
+                stamps.append((filename, st.st_mtime, st.st_size, st.st_ino))
+        return stamps
+
+    def read_cache(self):
+        """
+        Read the cache, if it is up to date.
+
+        :rtype: dict
+        """
+        try:
+            with open(self.cache_path, 'rb') as fp:
+                cache = pickle.load(fp)
+        except Exception:
+            # Missing, or written by another version of Python or of weboob.
+            return None
+
+        if not isinstance(cache, dict) or cache.get('version') != (self.CACHE_VERSION, self.version) or \
+           cache.get('stamps') != self.get_cache_stamps():
+            return None
+        return cache
+
+    def save_cache(self):
+        """
+        Save state of repositories, as it has been parsed from their files.
+        """
+        cache = {'version': (self.CACHE_VERSION, self.version),
+                 'stamps': self.get_cache_stamps(),
+                 'repositories': self.repositories,
+                 'versions': dict(self.versions.versions),
+                 'consistent': self.check_repositories(),
+                }
+        try:
+            tmpname = '%s.%d' % (self.cache_path, os.getpid())
+            with open(tmpname, 'wb') as fp:
+                pickle.dump(cache, fp, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, self.cache_path)
+        except (IOError, OSError) as e:
+            self.logger.warning(u'Unable to save cache of repositories: %s', e)
+        else:
+            self.cache = cache
+
+    def build_browser(self):
         from weboob.browser.browsers import Browser
         from weboob.browser.profiles import Weboob as WeboobProfile
 
         class WeboobBrowser(Browser):
             PROFILE = WeboobProfile(self.version)
-        if self.browser is None:
-            self.browser = WeboobBrowser()
+        return WeboobBrowser()
+
+    def load_browser(self):
+        with self.browser_lock:
+            if self.browser is None:
+                self.browser = self.build_browser()
+
+    def get_thread_browser(self):
+        """
+        Get a browser used only by the current thread, as browsers are not
+        thread-safe.
+        """
+        browser = getattr(self.thread_browsers, 'browser', None)
+        if browser is None:
+            browser = self.thread_browsers.browser = self.build_browser()
+        return browser
 
     def create_dir(self, name):
         if not os.path.exists(name):
@@ -528,22 +861,32 @@ class Repositories(object):
         Load repositories from ~/.local/share/weboob/repositories/.
         """
         self.repositories = []
+        self.cache = None
+        failed = False
         for name in sorted(os.listdir(self.repos_dir)):
             path = os.path.join(self.repos_dir, name)
             try:
                 repository = Repository(path)
                 self.repositories.append(repository)
             except RepositoryUnavailable as e:
+                failed = True
                 print('Unable to load repository %s (%s), try to update repositories.' % (name, e), file=sys.stderr)
 
+        if not failed:
+            self.save_cache()
+
     def get_module_icon_path(self, module):
         return os.path.join(self.icons_dir, '%s.png' % module.name)
 
-    def retrieve_icon(self, module):
+    def retrieve_icon(self, module, browser=None):
         """
         Retrieve the icon of a module and save it in ~/.local/share/weboob/icons/.
+
+        :param browser: browser to use instead of the one of repositories
         """
-        self.load_browser()
+        if browser is None:
+            self.load_browser()
+            browser = self.browser
         if not isinstance(module, ModuleInfo):
             module = self.get_module_info(module)
 
@@ -560,7 +903,7 @@ class Repositories(object):
                 icon_url = module.url.replace('.tar.gz', '.png')
 
         try:
-            icon = self.browser.open(icon_url)
+            icon = browser.open(icon_url)
         except BrowserHTTPNotFound:
             pass  # no icon, no problem
         else:
@@ -618,6 +961,9 @@ class Repositories(object):
         """
         Check if sources.list is consistent with repositories
         """
+        if self.cache is not None and self.cache['stamps'] == self.get_cache_stamps():
+            return self.cache['consistent']
+
         l = []
         for line in self._parse_source_list():
             repository = Repository(line)
@@ -633,6 +979,13 @@ class Repositories(object):
         """
         Update repositories and install new packages versions.
 
+        Modules are downloaded concurrently, and while next ones are
+        downloading, signatures of downloaded ones are checked by batches
+        and they are extracted to a copy of the modules directory. This copy
+        replaces the modules directory only at the end, so an interrupted
+        update never leaves a mix of old and new modules. Files of the copy
+        are hard links, so unchanged files of modules are kept as is.
+
         :param progress: observer object.
         :type progress: :class:`IProgress`
         """
@@ -648,19 +1001,88 @@ class Repositories(object):
             progress.progress(1.0, 'All modules are up-to-date.')
             return
 
-        class InstallProgress(PrintProgress):
-            def __init__(self, n):
-                self.n = n
-
-            def progress(self, percent, message):
-                progress.progress(float(self.n)/len(to_update) + 1.0/len(to_update)*percent, message)
-
-        for n, info in enumerate(to_update):
-            inst_progress = InstallProgress(n)
-            try:
-                self.install(info, inst_progress)
-            except ModuleInstallError as e:
-                inst_progress.progress(1.0, unicode(e))
+        staging = self.modules_dir + '.update'
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        self.link_tree(self.modules_dir, staging)
+
+        versions = Versions(staging)
+        installed = []
+        done = []
+
+        # Browsers are not thread-safe, each worker has its own.
+        workers = local()
+        browsers = []
+
+        def get_browser():
+            browser = getattr(workers, 'browser', None)
+            if browser is None:
+                browser = workers.browser = self.build_browser()
+                browsers.append(browser)
+            return browser
+
+        def download(info):
+            return self.download_module(info, get_browser())
+
+        def retrieve_icon(info):
+            self.retrieve_icon(info, get_browser())
+
+        def setup(batch):
+            for (info, tardata, sigdata), error in zip(batch, self.check_signatures(batch)):
+                if error is None:
+                    try:
+                        self.extract_module(info, tardata, staging)
+                    except ModuleInstallError as e:
+                        error = e
+                    else:
+                        versions.set(info.name, info.version)
+                        installed.append(info)
+                done.append(info)
+                progress.progress(float(len(done)) / len(to_update),
+                                  unicode(error) if error else 'Module %s is ready' % info.name)
+
+        self.store_lock.acquire_shared()
+        try:
+            with ThreadPoolExecutor(max_workers=self.UPDATE_WORKERS) as executor:
+                progress.progress(0.0, 'Downloading %d modules...' % len(to_update))
+                jobs = dict((executor.submit(download, info), info) for info in to_update)
+                batch = []
+                for job in as_completed(jobs):
+                    try:
+                        batch.append((jobs[job],) + job.result())
+                    except ModuleInstallError as e:
+                        done.append(jobs[job])
+                        progress.progress(float(len(done)) / len(to_update), unicode(e))
+                    if len(batch) >= self.VERIFY_BATCH:
+                        setup(batch)
+                        batch = []
+                setup(batch)
+
+                if installed:
+                    old = self.modules_dir + '.old'
+                    if os.path.exists(old):
+                        shutil.rmtree(old)
+                    os.rename(self.modules_dir, old)
+                    os.rename(staging, self.modules_dir)
+                    shutil.rmtree(old)
+                    self.versions = Versions(self.modules_dir)
+
+                    jobs = dict((executor.submit(retrieve_icon, info), info) for info in installed)
+                    for job in as_completed(jobs):
+                        try:
+                            job.result()
+                        except Exception as e:
+                            # Modules are installed anyway.
+                            self.logger.warning(u'Unable to retrieve icon of %s: %s', jobs[job].name, e)
+        finally:
+            self.store_lock.release_shared()
+            for browser in browsers:
+                browser.deinit()
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            self.prune_objects()
+
+        progress.progress(1.0, '%d of %d modules have been updated.' % (len(installed), len(to_update)))
 
     def install(self, module, progress=PrintProgress()):
         """
@@ -671,8 +1093,8 @@ class Repositories(object):
         :param progress: observer object
         :type progress: :class:`IProgress`
         """
-        import tarfile
-        self.load_browser()
+        # Modules may be installed concurrently by Weboob.load_backends().
+        browser = self.get_thread_browser()
 
         if isinstance(module, ModuleInfo):
             info = module
@@ -698,40 +1120,278 @@ class Repositories(object):
         else:
             raise ModuleInstallError('The latest version of %s is already installed' % module.name)
 
-        progress.progress(0.2, 'Downloading module...')
+        self.store_lock.acquire_shared()
         try:
-            tardata = self.browser.open(module.url).content
+            progress.progress(0.2, 'Downloading module...')
+            tardata, sigdata = self.download_module(module, browser)
+
+            if sigdata is not None:
+                progress.progress(0.5, 'Checking module authenticity...')
+                error, = self.check_signatures([(module, tardata, sigdata)])
+                if error is not None:
+                    raise error
+
+            progress.progress(0.7, 'Setting up module...')
+            self.extract_module(module, tardata, self.modules_dir)
+        finally:
+            self.store_lock.release_shared()
+            self.prune_objects()
+
+        self.versions.set(module.name, module.version)
+
+        progress.progress(0.9, 'Downloading icon...')
+        self.retrieve_icon(module, browser)
+
+        progress.progress(1.0, 'Module %s has been installed!' % module.name)
+
+    def download_module(self, module, browser=None):
+        """
+        Download the archive of a module, and its signature if it can be
+        checked.
+
+        If the repository provides manifests, the manifest of the module is
+        downloaded instead of the archive, and files which are not in the
+        local store yet are downloaded to it.
+
+        :param browser: browser to use instead of the one of repositories
+        :returns: archive or manifest, and signature (None if it isn't checked)
+        :rtype: tuple[bytes, bytes]
+        """
+        if browser is None:
+            self.load_browser()
+            browser = self.browser
+        url = module.manifest_url or module.url
+        try:
+            data = browser.open(url).content
+            sigdata = None
+            if module.signed and (Keyring.find_gpg() or Keyring.find_gpgv()):
+                sigdata = browser.open(url + '.sig').content
+
+            if module.manifest_url:
+                # Files are checked against their hash, and they are not used
+                # until the signature of the manifest is checked.
+                try:
+                    manifest = ModuleManifest.parse(data)
+                except ValueError as e:
+                    raise ModuleInstallError('The manifest for %s looks invalid: %s' % (module.name, e))
+                for digest in sorted(set(manifest.files.values())):
+                    self.fetch_object(module.repo_url, digest, browser)
         except BrowserHTTPError as e:
             raise ModuleInstallError('Unable to fetch module: %s' % e)
+        return data, sigdata
+
+    def fetch_object(self, repo_url, digest, browser=None):
+        """
+        Download a file of modules to the local store, if it is missing.
+
+        :param browser: browser to use instead of the one of repositories
+        """
+        if browser is None:
+            self.load_browser()
+            browser = self.browser
+        # Modules downloaded concurrently may share files.
+        with self.objects_lock:
+            lock = self.objects_locks.setdefault(digest, Lock())
+        with lock:
+            if not os.path.exists(self.get_object_path(digest)):
+                content = browser.open(posixpath.join(repo_url, ModuleManifest.object_path(digest))).content
+                self.store_object(digest, content)
+
+    def get_object_path(self, digest):
+        return os.path.join(self.datadir, *ModuleManifest.object_path(digest).split('/'))
+
+    def store_object(self, digest, content):
+        """
+        Store a file of modules by its hash.
+        """
+        if hashlib.sha256(content).hexdigest() != digest:
+            raise ModuleInstallError('Unexpected content for file %s' % digest)
 
-        # Check signature
-        if module.signed and (Keyring.find_gpg() or Keyring.find_gpgv()):
-            progress.progress(0.5, 'Checking module authenticity...')
-            sig_data = self.browser.open(posixpath.join(module.url + '.sig')).content
-            keyring_path = os.path.join(self.keyrings_dir, self.url2filename(module.repo_url))
+        from tempfile import NamedTemporaryFile
+        path = self.get_object_path(digest)
+        self.create_dir(os.path.dirname(path))
+        with NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as fp:
+            fp.write(content)
+        os.rename(fp.name, path)
+
+    @staticmethod
+    def link_tree(src, dst):
+        """
+        Copy a tree with hard links (or with copies if they are not
+        supported).
+        """
+        for root, dirs, files in os.walk(src):
+            target = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target)
+            for filename in files:
+                try:
+                    os.link(os.path.join(root, filename), os.path.join(target, filename))
+                except OSError:
+                    shutil.copy2(os.path.join(root, filename), os.path.join(target, filename))
+
+    def check_signatures(self, modules):
+        """
+        Check signatures of downloaded modules, with one call of gpg by
+        keyring.
+
+        :param modules: modules with their archive and signature (None if it
+                        isn't checked)
+        :type modules: list[tuple[:class:`ModuleInfo`, bytes, bytes]]
+        :returns: errors, None for valid modules
+        :rtype: list[:class:`weboob.exceptions.ModuleInstallError`]
+        """
+        errors = [None] * len(modules)
+        by_keyring = {}
+        for i, (module, tardata, sigdata) in enumerate(modules):
+            if sigdata is not None:
+                keyring_path = os.path.join(self.keyrings_dir, self.url2filename(module.repo_url))
+                by_keyring.setdefault(keyring_path, []).append(i)
+
+        for keyring_path, indexes in by_keyring.items():
             keyring = Keyring(keyring_path)
             if not keyring.exists():
-                raise ModuleInstallError('No keyring found, please update repos.')
-            if not keyring.is_valid(tardata, sig_data):
-                raise ModuleInstallError('Invalid signature for %s.' % module.name)
-
-        # Extract module from tarball.
-        if os.path.isdir(module_dir):
-            shutil.rmtree(module_dir)
-        progress.progress(0.7, 'Setting up module...')
-        with closing(tarfile.open('', 'r:gz', BytesIO(tardata))) as tar:
-            tar.extractall(self.modules_dir)
-        if not os.path.isdir(module_dir):
-            raise ModuleInstallError('The archive for %s looks invalid.' % module.name)
-        # Precompile
-        compile_dir(module_dir, quiet=True)
+                for i in indexes:
+                    errors[i] = ModuleInstallError('No keyring found, please update repos.')
+                continue
 
-        self.versions.set(module.name, module.version)
+            valid = keyring.are_valid([modules[i][1:] for i in indexes])
+            for i, is_valid in zip(indexes, valid):
+                if not is_valid:
+                    errors[i] = ModuleInstallError('Invalid signature for %s.' % modules[i][0].name)
+        return errors
 
-        progress.progress(0.9, 'Downloading icon...')
-        self.retrieve_icon(module)
+    def extract_module(self, module, tardata, modules_dir):
+        """
+        Extract the archive of a module, and compile it.
 
-        progress.progress(1.0, 'Module %s has been installed!' % module.name)
+        :param modules_dir: directory to extract module in, which has to be
+                            moved to the modules directory
+        :type modules_dir: str
+        """
+        import tarfile
+
+        if module.manifest_url:
+            self.copy_module(module, ModuleManifest.parse(tardata), modules_dir)
+            compile_dir(os.path.join(modules_dir, module.name),
+                        ddir=os.path.join(self.modules_dir, module.name), quiet=True)
+            return
+
+        from tempfile import mkdtemp
+
+        # The previous version is replaced only if the archive is valid.
+        tmpdir = mkdtemp(prefix='.%s.' % module.name, dir=modules_dir)
+        try:
+            try:
+                with closing(tarfile.open('', 'r:gz', BytesIO(tardata))) as tar:
+                    tar.extractall(tmpdir)
+            except tarfile.TarError as e:
+                raise ModuleInstallError('The archive for %s looks invalid: %s' % (module.name, e))
+            if not os.path.isdir(os.path.join(tmpdir, module.name)):
+                raise ModuleInstallError('The archive for %s looks invalid.' % module.name)
+
+            module_dir = os.path.join(modules_dir, module.name)
+            if os.path.isdir(module_dir):
+                shutil.rmtree(module_dir)
+            os.rename(os.path.join(tmpdir, module.name), module_dir)
+            # Files of the store are not used by this version anymore.
+            manifest_path = os.path.join(modules_dir, '%s.manifest' % module.name)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+        finally:
+            shutil.rmtree(tmpdir)
+        # Precompile, with paths of the modules directory in tracebacks.
+        compile_dir(module_dir, ddir=os.path.join(self.modules_dir, module.name), quiet=True)
+
+    def copy_module(self, module, manifest, modules_dir):
+        """
+        Update files of a module with copies of files of the local store.
+
+        Files which did not change are not touched, and files are replaced
+        and not rewritten, as they may be shared with another copy of the
+        modules directory. The manifest is saved next to the module, so
+        :func:`prune_objects` keeps the files it uses in the store.
+
+        :type manifest: :class:`ModuleManifest`
+        """
+        module_dir = os.path.join(modules_dir, module.name)
+        for relpath, digest in sorted(manifest.files.items()):
+            filename = os.path.join(module_dir, *relpath.split('/'))
+            obj = self.get_object_path(digest)
+            if not os.path.exists(obj):
+                raise ModuleInstallError('File %s of %s is missing.' % (relpath, module.name))
+            if os.path.exists(filename) and ModuleManifest.hash_file(filename) == digest:
+                continue
+
+            # Copied, so the store is not changed if the installed file is
+            # edited.
+            self.create_dir(os.path.dirname(filename))
+            tmpname = os.path.join(os.path.dirname(filename), '.%s.new' % os.path.basename(filename))
+            shutil.copy2(obj, tmpname)
+            os.rename(tmpname, filename)
+            self.remove_compiled(filename)
+
+        for root, dirs, files in os.walk(module_dir):
+            for filename in files:
+                relpath = os.path.relpath(os.path.join(root, filename), module_dir).replace(os.sep, '/')
+                if relpath in manifest.files or os.path.basename(root) == '__pycache__' or \
+                   relpath.endswith('.pyc') and relpath[:-1] in manifest.files:
+                    continue
+                os.remove(os.path.join(root, filename))
+                self.remove_compiled(os.path.join(root, filename))
+
+        manifest_path = os.path.join(modules_dir, '%s.manifest' % module.name)
+        with open(manifest_path + '.new', 'wb') as fp:
+            fp.write(manifest.dump())
+        os.rename(manifest_path + '.new', manifest_path)
+
+    def prune_objects(self):
+        """
+        Remove files of the local store which are not used by the installed
+        version of a module, for any version of weboob.
+
+        It waits for installs and updates in progress.
+        """
+        with self.store_lock:
+            self._prune_objects()
+
+    def _prune_objects(self):
+        used = set()
+        modules_root = os.path.dirname(self.modules_dir)
+        for version in os.listdir(modules_root):
+            if not os.path.isdir(os.path.join(modules_root, version)):
+                continue
+            for name in sorted(os.listdir(os.path.join(modules_root, version))):
+                path = os.path.join(modules_root, version, name)
+                if not name.endswith('.manifest') or not os.path.isdir(path[:-len('.manifest')]):
+                    continue
+                with open(path, 'rb') as fp:
+                    try:
+                        used.update(ModuleManifest.parse(fp.read()).files.values())
+                    except ValueError as e:
+                        # Keep the store as is rather than remove used files.
+                        self.logger.warning('Unable to read %s: %s', path, e)
+                        return
+
+        for root, dirs, files in os.walk(self.objects_dir):
+            for filename in files:
+                if os.path.basename(root) + filename not in used:
+                    os.remove(os.path.join(root, filename))
+
+    @staticmethod
+    def remove_compiled(filename):
+        """
+        Remove compiled files of a source file, which may be hard links.
+        """
+        if not filename.endswith('.py'):
+            return
+        compiled = [filename + 'c']
+        cache_dir = os.path.join(os.path.dirname(filename), '__pycache__')
+        if os.path.isdir(cache_dir):
+            prefix = os.path.basename(filename)[:-len('.py')] + '.'
+            compiled += [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.startswith(prefix)]
+        for name in compiled:
+            if os.path.exists(name):
+                os.remove(name)
 
     @staticmethod
     def url2filename(url):
@@ -841,6 +1501,67 @@ class Keyring(object):
                 return False
         return True
 
+    def are_valid(self, items):
+        """
+        Check signatures of several data, with only one call of gpg.
+
+        :param items: data and signatures
+        :type items: list[tuple[bytes, bytes]]
+        :rtype: list[bool]
+        """
+        gpg = self.find_gpg()
+        if not gpg or len(items) < 2:
+            # gpgv checks only one signature at once.
+            return [self.is_valid(data, sigdata) for data, sigdata in items]
+
+        from tempfile import mkdtemp
+        tmpdir = mkdtemp(prefix='weboob_gpg_')
+        try:
+            # With --verify-files, data of "N.sig" is read from "N".
+            for i, (data, sigdata) in enumerate(items):
+                with open(os.path.join(tmpdir, str(i)), 'wb') as fp:
+                    fp.write(data)
+                with open(os.path.join(tmpdir, '%d.sig' % i), 'wb') as fp:
+                    fp.write(sigdata)
+            gpg_homedir = os.path.join(tmpdir, 'home')
+            os.mkdir(gpg_homedir, 0o700)
+            proc = subprocess.Popen([gpg, '--verify-files', '--no-options',
+                                     '--no-default-keyring', '--quiet',
+                                     '--homedir', gpg_homedir,
+                                     '--status-fd', '1',
+                                     '--keyring', os.path.realpath(self.path)] +
+                                    ['%d.sig' % i for i in range(len(items))],
+                                    cwd=tmpdir,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            out, err = proc.communicate()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        # gpg fails if any signature is invalid, so read status of each file.
+        status = {}
+        current = None
+        for line in out.splitlines():
+            words = line.split()
+            if len(words) < 2 or words[0] != b'[GNUPG:]':
+                continue
+            if words[1] == b'FILE_START':
+                current = status[words[-1]] = set()
+            elif words[1] == b'FILE_DONE':
+                current = None
+            elif current is not None:
+                current.add(words[1])
+
+        valid = []
+        for i, (data, sigdata) in enumerate(items):
+            keywords = status.get(('%d.sig' % i).encode('ascii'), set())
+            if b'GOODSIG' in keywords and b'VALIDSIG' in keywords and not keywords & set([b'BADSIG', b'ERRSIG']):
+                valid.append(True)
+            else:
+                # Check it alone to report the error.
+                valid.append(self.is_valid(data, sigdata))
+        return valid
+
     def __str__(self):
         if self.exists():
             with open(self.path, 'rb') as f:
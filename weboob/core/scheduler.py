@@ -20,12 +20,17 @@
 
 from __future__ import print_function
 
-from threading import Event, RLock
+import heapq
+from random import uniform
+from threading import Condition, Event, RLock, Thread
 try:
-    from threading import _Timer as Timer
+    from time import monotonic
 except ImportError:
-    from threading import Timer
+    from time import time as monotonic
 
+from concurrent.futures import ThreadPoolExecutor
+
+from weboob.tools.compat import basestring
 from weboob.tools.log import getLogger
 from weboob.tools.misc import get_backtrace
 
@@ -84,60 +89,190 @@ class IScheduler(object):
         raise NotImplementedError()
 
 
-class RepeatedTimer(Timer):
-    def run(self):
-        while not self.finished.isSet():
-            try:
-                self.function(*self.args, **self.kwargs)
-            except Exception:
-                # do not stop timer because of an exception
-                print(get_backtrace())
-            self.finished.wait(self.interval)
-        self.finished.set()
+class ScheduledEvent(object):
+    """
+    Event in the queue of :class:`Scheduler`.
+
+    :param id: event identificator
+    :type id: int
+    :param interval: delay before the call, or between two calls
+    :type interval: float
+    :param function: function to call
+    :type function: callable
+    :param args: arguments to give to function
+    :type args: tuple
+    :param repeat: call function every interval
+    :type repeat: bool
+    :param key: calls of events with the same key are spaced out
+    """
+
+    def __init__(self, id, interval, function, args, repeat=False, key=None):
+        self.id = id
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.repeat = repeat
+        self.key = key
+        self.due = None
+        self.canceled = False
+
+    def __lt__(self, other):
+        return self.id < other.id
+
+    def __repr__(self):
+        return '<ScheduledEvent %d %r>' % (self.id, self.function.__name__)
 
 
 class Scheduler(IScheduler):
-    """Scheduler using Python's :mod:`threading`."""
-
-    def __init__(self):
+    """
+    Scheduler with a single thread.
+
+    Events are kept in a heap ordered by due time. A dispatcher thread waits
+    for the next event, then gives the call to a pool of threads, so at most
+    ``max_workers`` calls run at the same time, whatever the number of
+    events.
+
+    A repeated event is called right away, then planned again after its
+    call has returned. If the
+    call has lasted longer than its interval, the missed calls are
+    coalesced in one call, done immediately.
+
+    :param max_workers: maximum number of concurrent calls
+    :type max_workers: int
+    :param jitter: calls are delayed by a random time up to this ratio of
+                   their interval, to avoid synchronized polls
+    :type jitter: float
+    :param spacing: minimum delay in seconds between the start of two calls
+                    with the same key
+    :type spacing: float
+    :param key: function called with the function and the arguments of an
+                event, which returns the key of its calls, or None to not
+                space them out (by default, the name of the backend which is
+                the object of a bound method or an argument of the function)
+    :type key: callable
+    """
+
+    MAX_WORKERS = 8
+
+    def __init__(self, max_workers=MAX_WORKERS, jitter=0, spacing=0, key=None):
         self.logger = getLogger('scheduler')
         self.mutex = RLock()
+        self.condition = Condition(self.mutex)
         self.stop_event = Event()
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.spacing = spacing
+        self.key = key or self.get_backend_name
         self.count = 0
         self.queue = {}
+        self.heap = []
+        self.last_starts = {}
+        self.dispatcher = None
+        self.executor = None
 
     def schedule(self, interval, function, *args):
-        return self._schedule(Timer, interval, self._schedule_callback, function, *args)
+        return self._schedule(interval, function, args, False)
 
     def repeat(self, interval, function, *args):
-        return self._schedule(RepeatedTimer, interval, self._repeat_callback, function, *args)
+        return self._schedule(interval, function, args, True)
 
-    def _schedule(self, klass, interval, meta_func, function, *args):
-        if self.stop_event.isSet():
+    @staticmethod
+    def get_backend_name(function, args):
+        """
+        Get the name of the backend of a call.
+        """
+        for obj in (getattr(function, '__self__', None),) + tuple(args):
+            # Backends are recognized by their attributes, as lazy ones
+            # are not Module instances.
+            name = getattr(obj, 'name', None)
+            if isinstance(name, basestring) and hasattr(obj, 'weboob'):
+                return name
+
+    def _schedule(self, interval, function, args, repeat):
+        if self.stop_event.is_set():
             return
 
         with self.mutex:
             self.count += 1
-            self.logger.debug('function "%s" will be called in %s seconds' % (function.__name__, interval))
-            timer = klass(interval, meta_func, (self.count, interval, function, args))
-            self.queue[self.count] = timer
-            timer.start()
-            return self.count
-
-    def _schedule_callback(self, count, interval, function, args):
+            event = ScheduledEvent(self.count, interval, function, args, repeat, self.key(function, args))
+            self.queue[event.id] = event
+            if repeat:
+                # The first call of a repeated event is done right away.
+                self.logger.debug('function "%s" will be called every %s seconds' % (function.__name__, interval))
+                self._push(event, monotonic())
+            else:
+                self.logger.debug('function "%s" will be called in %s seconds' % (function.__name__, interval))
+                self._push(event, monotonic() + interval)
+
+            if self.dispatcher is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self.dispatcher = Thread(target=self._dispatch, name='scheduler')
+                self.dispatcher.daemon = True
+                self.dispatcher.start()
+            return event.id
+
+    def _push(self, event, due):
+        if self.jitter:
+            due += uniform(0, self.jitter * event.interval)
+        event.due = due
+        heapq.heappush(self.heap, (due, event))
+        self.condition.notify()
+
+    def _dispatch(self):
         with self.mutex:
-            self.queue.pop(count)
-        return function(*args)
+            while not self.stop_event.is_set():
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                due, event = self.heap[0]
+                if event.canceled:
+                    heapq.heappop(self.heap)
+                    continue
+
+                now = monotonic()
+                if due > now:
+                    self.condition.wait(due - now)
+                    continue
+
+                heapq.heappop(self.heap)
+                if self.spacing and event.key is not None:
+                    last_start = self.last_starts.get(event.key)
+                    if last_start is not None and last_start + self.spacing > now:
+                        event.due = last_start + self.spacing
+                        heapq.heappush(self.heap, (event.due, event))
+                        continue
+                    self.last_starts[event.key] = now
+
+                if not event.repeat:
+                    self.queue.pop(event.id, None)
+                self.executor.submit(self._call, event)
+
+    def _call(self, event):
+        if event.canceled:
+            return
+
+        try:
+            event.function(*event.args)
+        except Exception:
+            # do not stop repeated calls because of an exception
+            self.logger.error('error in scheduled function "%s":\n%s' % (event.function.__name__, get_backtrace()))
+
+        if not event.repeat:
+            return
 
-    def _repeat_callback(self, count, interval, function, args):
-        function(*args)
         with self.mutex:
-            try:
-                e = self.queue[count]
-            except KeyError:
+            if event.canceled or self.stop_event.is_set():
                 return
-            else:
-                self.logger.debug('function "%s" will be called in %s seconds' % (function.__name__, e.interval))
+
+            now = monotonic()
+            due = event.due + event.interval
+            if due <= now:
+                self.logger.debug('function "%s" took too long, %d calls are coalesced'
+                                  % (event.function.__name__, (now - event.due) // event.interval))
+                due = now
+            self.logger.debug('function "%s" will be called in %.1f seconds' % (event.function.__name__, due - now))
+            self._push(event, due)
 
     def cancel(self, ev):
         with self.mutex:
@@ -145,22 +280,23 @@ class Scheduler(IScheduler):
                 e = self.queue.pop(ev)
             except KeyError:
                 return False
-            e.cancel()
+            # The event is removed from the heap by the dispatcher.
+            e.canceled = True
             self.logger.debug('scheduled function "%s" is canceled' % e.function.__name__)
             return True
 
     def _wait_to_stop(self):
         self.want_stop()
-        with self.mutex:
-            for e in self.queue.values():
-                e.cancel()
-                e.join()
-            self.queue = {}
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+            self.executor.shutdown()
 
     def run(self):
         try:
-            while True:
-                self.stop_event.wait(0.1)
+            # With Python 2, waiting without a timeout can't be interrupted
+            # by KeyboardInterrupt.
+            while not self.stop_event.is_set():
+                self.stop_event.wait(1)
         except KeyboardInterrupt:
             self._wait_to_stop()
             raise
@@ -169,10 +305,12 @@ class Scheduler(IScheduler):
         return True
 
     def want_stop(self):
-        self.stop_event.set()
         with self.mutex:
-            for t in self.queue.values():
-                t.cancel()
-                # Contrary to _wait_to_stop(), don't call t.join
-                # because want_stop() have to be non-blocking.
+            self.stop_event.set()
+            for e in self.queue.values():
+                e.canceled = True
             self.queue = {}
+            self.heap = []
+            # Calls already running are not interrupted, but
+            # want_stop() have to be non-blocking.
+            self.condition.notify()
@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event, Lock, Thread
+from time import sleep, time
+from unittest import TestCase, skipIf
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+from weboob.browser.browsers import Browser, StatesMixin
+from weboob.capabilities.base import Capability
+from weboob.core.bcall import CallErrors, CallTimeout, WorkerPool
+from weboob.core.ouiboube import WebNip
+from weboob.exceptions import CallCancelled
+from weboob.tools.backend import Module, SharedLock
+from weboob.tools.cancel import CancelToken
+from weboob.tools.storage import StandardStorage
+from weboob.tools.compat import StopAsyncIteration
+
+
+class CapFake(Capability):
+    pass
+
+
+class SlowAdapter(BaseAdapter):
+    def __init__(self):
+        super(SlowAdapter, self).__init__()
+        self.sent = 0
+        # Cleared to block requests.
+        self.gate = Event()
+        self.gate.set()
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        self.gate.wait()
+        sleep(0.02)
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = b''
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeBrowser(Browser):
+    def __init__(self, *args, **kwargs):
+        super(FakeBrowser, self).__init__(*args, **kwargs)
+        self.adapter = SlowAdapter()
+        self.session.mount('http://', self.adapter)
+
+
+class FakeStatesBrowser(StatesMixin, FakeBrowser):
+    __states__ = ('token',)
+    token = None
+
+
+class FakeModule(Module, CapFake):
+    NAME = 'fake'
+    BROWSER = FakeBrowser
+
+    running = 0
+    max_running = 0
+    counter_lock = Lock()
+
+    def iter_numbers(self, count, delay=0):
+        with self.counter_lock:
+            FakeModule.running += 1
+            FakeModule.max_running = max(FakeModule.running, FakeModule.max_running)
+        try:
+            for i in range(count):
+                sleep(delay)
+                yield i
+        finally:
+            with self.counter_lock:
+                FakeModule.running -= 1
+
+    def iter_slow(self, delays):
+        for i, delay in enumerate(delays[self.name]):
+            sleep(delay)
+            yield '%s-%d' % (self.name, i)
+
+    def iter_values(self, values, delay=0):
+        for value in values[self.name]:
+            sleep(delay)
+            yield value
+
+    def use_browser(self, delay):
+        browser = self.browser
+        with self.counter_lock:
+            FakeModule.running += 1
+            FakeModule.max_running = max(FakeModule.running, FakeModule.max_running)
+        sleep(delay)
+        with self.counter_lock:
+            FakeModule.running -= 1
+        return id(browser)
+
+    def iter_pages(self, count):
+        for i in range(count):
+            self.browser.open('http://example.org/%d' % i)
+            yield i
+
+    def iter_pages_ignoring_errors(self, count):
+        for i in range(count):
+            try:
+                self.browser.open('http://example.org/%d' % i)
+            except Exception:
+                continue
+            yield i
+        self.finished = True
+
+    def fail(self):
+        raise ValueError('failed on %s' % self.name)
+
+    def nested(self, target):
+        return list(self.weboob.do('iter_numbers', 2, backends=target))
+
+
+class FakeModulesTestCase(TestCase):
+    def setUp(self):
+        FakeModule.running = FakeModule.max_running = 0
+
+    def build(self, count, **kwargs):
+        weboob = WebNip(modules_path=False, pool=WorkerPool(**kwargs))
+        for i in range(count):
+            name = 'fake%d' % i
+            weboob.backend_instances[name] = FakeModule(weboob, name)
+        return weboob
+
+
+class BackendsCallTest(FakeModulesTestCase):
+
+    def test_results(self):
+        weboob = self.build(5)
+        results = list(weboob.do('iter_numbers', 3))
+        self.assertEqual(sorted(results), sorted(list(range(3)) * 5))
+        weboob.deinit()
+
+    def test_errors(self):
+        weboob = self.build(3)
+        with self.assertRaises(CallErrors) as cm:
+            list(weboob.do('fail'))
+        self.assertEqual(sorted(backend.name for backend, _, _ in cm.exception),
+                         ['fake0', 'fake1', 'fake2'])
+        weboob.deinit()
+
+    def test_pool_reused(self):
+        weboob = self.build(20, max_workers=4)
+        for _ in range(3):
+            self.assertEqual(len(list(weboob.do('iter_numbers', 2, delay=0.001))), 40)
+        self.assertEqual(weboob.pool.started, 4)
+        self.assertLessEqual(FakeModule.max_running, 4)
+        weboob.deinit()
+
+    def test_idle_workers(self):
+        weboob = self.build(10, max_workers=10)
+        list(weboob.do('iter_numbers', 1, backends='fake0'))
+        # A worker is idle, the next jobs must not all wait for it.
+        FakeModule.max_running = 0
+        start = time()
+        self.assertEqual(len(list(weboob.do('iter_numbers', 1, delay=0.2))), 10)
+        self.assertGreater(FakeModule.max_running, 5)
+        self.assertLess(time() - start, 1)
+        weboob.deinit()
+
+    def test_caps_limits(self):
+        weboob = self.build(10, max_workers=8, caps_limits={CapFake: 2})
+        self.assertEqual(len(list(weboob.do('iter_numbers', 5, delay=0.001))), 50)
+        self.assertLessEqual(FakeModule.max_running, 2)
+        weboob.deinit()
+
+    def test_nested_call(self):
+        weboob = self.build(2, max_workers=1, caps_limits={CapFake: 1})
+        results = list(weboob.do('nested', 'fake1', backends='fake0'))
+        self.assertEqual(results, [0, 1])
+        weboob.deinit()
+
+    def test_callback_thread(self):
+        weboob = self.build(4, max_workers=2)
+        results = []
+        done = []
+        thread = weboob.do('iter_numbers', 2).callback_thread(results.append, finishback=lambda: done.append(True))
+        thread.join()
+        self.assertEqual(len(results), 8)
+        self.assertEqual(done, [True])
+        weboob.deinit()
+
+    def test_timeout(self):
+        weboob = self.build(3)
+        delays = {'fake0': [0, 0], 'fake1': [0, 1], 'fake2': [1]}
+        results = []
+        start = time()
+        try:
+            with self.assertRaises(CallErrors) as cm:
+                for result in weboob.do('iter_slow', delays, timeout=0.3):
+                    results.append(result)
+            self.assertLess(time() - start, 0.9)
+            self.assertEqual(sorted(results), ['fake0-0', 'fake0-1', 'fake1-0'])
+            self.assertEqual(sorted((backend.name, type(error)) for backend, error, _ in cm.exception),
+                             [('fake1', CallTimeout), ('fake2', CallTimeout)])
+        finally:
+            weboob.deinit()
+
+    def test_timeout_fast_producer(self):
+        # Results are always queued, the consumer never waits.
+        weboob = self.build(1)
+        for kwargs in ({}, {'merge_key': lambda number: number}):
+            call = weboob.do('iter_numbers', 10 ** 6, timeout=0.3, queue_size=5, **kwargs)
+            start = time()
+            with self.assertRaises(CallErrors) as cm:
+                for _ in call:
+                    sleep(0.001)
+            self.assertLess(time() - start, 2)
+            self.assertEqual([type(error) for _, error, _ in cm.exception], [CallTimeout])
+        weboob.deinit()
+
+    def test_per_backend_timeout(self):
+        weboob = self.build(2, max_workers=1)
+        delays = {'fake0': [1], 'fake1': [0]}
+        try:
+            with self.assertRaises(CallErrors) as cm:
+                weboob.do('iter_slow', delays, per_backend_timeout=0.2).wait()
+            self.assertEqual([(backend.name, type(error)) for backend, error, _ in cm.exception],
+                             [('fake0', CallTimeout)])
+        finally:
+            weboob.deinit()
+
+    def test_queue_size(self):
+        weboob = self.build(3)
+        call = weboob.do('iter_numbers', 100, queue_size=5)
+        count = 0
+        for _ in call:
+            self.assertLessEqual(len(call.responses), 5)
+            count += 1
+        self.assertEqual(count, 300)
+
+        # Stopping the consumer releases blocked backends.
+        call = weboob.do('iter_numbers', 100, queue_size=5)
+        for i, _ in enumerate(call):
+            if i == 10:
+                break
+        call.wait()
+        self.assertFalse(call.unfinished)
+        weboob.deinit()
+
+
+class CancelTest(FakeModulesTestCase):
+    def test_stop(self):
+        weboob = self.build(2)
+        call = weboob.do('iter_pages', 100)
+        for _ in call:
+            break
+        call.wait()
+        for backend in weboob.iter_backends():
+            self.assertLess(backend.browser.adapter.sent, 10)
+            self.assertIsNone(backend.cancel_token)
+        weboob.deinit()
+
+    def test_broad_except(self):
+        weboob = self.build(1)
+        call = weboob.do('iter_pages_ignoring_errors', 100)
+        for _ in call:
+            break
+        call.wait()
+        # The cancellation is not caught as an error of the module.
+        self.assertFalse(getattr(weboob['fake0'], 'finished', False))
+        weboob.deinit()
+
+    def test_timeout(self):
+        weboob = self.build(1)
+        call = weboob.do('iter_pages', 100, timeout=0.1)
+        with self.assertRaises(CallErrors) as cm:
+            list(call)
+        self.assertEqual([type(error) for _, error, _ in cm.exception], [CallTimeout])
+        # Let the task notice the cancellation.
+        sleep(0.1)
+        self.assertLess(weboob['fake0'].browser.adapter.sent, 10)
+        weboob.deinit()
+
+    def test_browser(self):
+        browser = FakeBrowser()
+        browser.cancel_token = CancelToken()
+        browser.adapter.gate.clear()
+        future = browser.async_open('http://example.org/')
+        pending = [browser.async_open('http://example.org/%d' % i) for i in range(20)]
+        browser.cancel_token.cancel()
+        browser.adapter.gate.set()
+        with self.assertRaises(CallCancelled):
+            browser.open('http://example.org/')
+        with self.assertRaises(CallCancelled):
+            future.result()
+        self.assertEqual(browser.cancel_token.saved, 1 + sum(f.cancelled() for f in pending))
+        self.assertLess(browser.adapter.sent, 21)
+        browser.deinit()
+
+
+class BrowserPoolTest(FakeModulesTestCase):
+    def run_calls(self, backend, count):
+        weboob = backend.weboob
+        weboob.backend_instances[backend.name] = backend
+        calls = [weboob.do('use_browser', 0.1) for _ in range(count)]
+        return set(result for call in calls for result in call)
+
+    def test_pool(self):
+        weboob = WebNip(modules_path=False)
+        backend = FakeModule(weboob, 'fake', {'_browser_pool': '2'})
+        browsers = self.run_calls(backend, 4)
+        self.assertEqual(FakeModule.max_running, 2)
+        self.assertEqual(len(browsers), 2)
+        self.assertIsNone(backend._browser)
+        weboob.deinit()
+        self.assertEqual(backend.browser_pool.count, 0)
+
+    def test_unload(self):
+        weboob = WebNip(modules_path=False)
+        backend = FakeModule(weboob, 'fake', {'_browser_pool': '2'})
+        weboob.backend_instances[backend.name] = backend
+        calls = [weboob.do('use_browser', 0.3) for _ in range(2)]
+        while FakeModule.running < 2:
+            sleep(0.01)
+        # Calls in progress are not disturbed by deinit.
+        weboob.unload_backends()
+        self.assertEqual(FakeModule.running, 0)
+        self.assertEqual(len(set(result for call in calls for result in call)), 2)
+        self.assertEqual(backend.browser_pool.count, 0)
+        weboob.deinit()
+
+    def test_not_poolable(self):
+        class SerialModule(FakeModule):
+            BROWSER_POOLABLE = False
+
+        weboob = WebNip(modules_path=False)
+        backend = SerialModule(weboob, 'fake', {'_browser_pool': '2'})
+        self.assertIsNone(backend.browser_pool)
+        self.assertEqual(len(self.run_calls(backend, 2)), 1)
+        self.assertEqual(FakeModule.max_running, 1)
+        weboob.deinit()
+
+    def test_shared_state(self):
+        class StatesModule(FakeModule):
+            BROWSER = FakeStatesBrowser
+
+        tmpdir = mkdtemp()
+        try:
+            weboob = WebNip(modules_path=False, storage=StandardStorage(os.path.join(tmpdir, 'storage')))
+            backend = StatesModule(weboob, 'fake', {'_browser_pool': '2'}, weboob.storage)
+            with backend:
+                backend.browser.token = 'logged'
+                with backend:
+                    # Nested calls get the same browser.
+                    self.assertEqual(backend.browser.token, 'logged')
+            pool = backend.browser_pool
+            first = pool.checkout()
+            second = pool.checkout()
+            self.assertIsNot(first, second)
+            self.assertEqual(second.token, 'logged')
+            pool.checkin(first)
+            pool.checkin(second)
+            weboob.deinit()
+        finally:
+            rmtree(tmpdir)
+
+
+class SharedLockTest(TestCase):
+    def test_lock(self):
+        lock = SharedLock()
+        events = []
+
+        def exclusive():
+            with lock:
+                events.append('exclusive')
+
+        lock.acquire_shared()
+        lock.acquire_shared()
+        thread = Thread(target=exclusive)
+        thread.start()
+        sleep(0.05)
+        self.assertEqual(events, [])
+        lock.release_shared()
+        sleep(0.05)
+        self.assertEqual(events, [])
+        # Upgraded once other threads released it.
+        with lock:
+            lock.acquire_shared()
+            lock.release_shared()
+        lock.release_shared()
+        thread.join()
+        self.assertEqual(events, ['exclusive'])
+        self.assertEqual((lock.owner, lock.readers), (None, {}))
+
+        with self.assertRaises(RuntimeError):
+            lock.release()
+
+
+class MergeTest(FakeModulesTestCase):
+    def test_merge(self):
+        weboob = self.build(3)
+        values = {'fake0': [1, 4, 7, 9], 'fake1': [2, 3, 8], 'fake2': []}
+        results = list(weboob.do('iter_values', values, merge_key=lambda v: v, reorder_size=0))
+        self.assertEqual(results, [1, 2, 3, 4, 7, 8, 9])
+
+        results = list(weboob.do('iter_values', dict((k, v[::-1]) for k, v in values.items()),
+                                 merge_key=lambda v: v, merge_reverse=True))
+        self.assertEqual(results, [9, 8, 7, 4, 3, 2, 1])
+        weboob.deinit()
+
+    def test_reorder(self):
+        weboob = self.build(2)
+        values = {'fake0': [2, 1, 4, 3, 6, 5], 'fake1': [1, 3, 2]}
+        results = list(weboob.do('iter_values', values, merge_key=lambda v: v, reorder_size=1))
+        self.assertEqual(results, [1, 1, 2, 2, 3, 3, 4, 5, 6])
+        weboob.deinit()
+
+    def test_streaming(self):
+        weboob = self.build(2)
+        values = {'fake0': list(range(0, 100, 2)), 'fake1': list(range(1, 100, 2))}
+        call = weboob.do('iter_values', values, 0.01, merge_key=lambda v: v, reorder_size=0)
+        self.assertEqual(next(iter(call)), 0)
+        self.assertTrue(call.unfinished)
+        call.stop(wait=True)
+        weboob.deinit()
+
+    def test_queue_size(self):
+        weboob = self.build(3)
+        values = dict(('fake%d' % i, list(range(i, 300, 3))) for i in range(3))
+        call = weboob.do('iter_values', values, merge_key=lambda v: v, queue_size=2, reorder_size=4)
+        results = []
+        for result in call:
+            self.assertLessEqual(max(call.pending.values()), 5)
+            results.append(result)
+        self.assertEqual(results, list(range(300)))
+        weboob.deinit()
+
+    def test_errors(self):
+        weboob = self.build(2)
+        values = {'fake0': [1, 3, 'x', 5], 'fake1': [2, 4]}
+        with self.assertRaises(CallErrors) as cm:
+            list(weboob.do('iter_values', values, merge_key=lambda v: -v, merge_reverse=True))
+        self.assertEqual([backend.name for backend, _, _ in cm.exception], ['fake0'])
+        weboob.deinit()
+
+
+@skipIf(sys.version_info < (3, 5), 'asyncio is not available')
+class AsyncBackendsCallTest(FakeModulesTestCase):
+    def setUp(self):
+        super(AsyncBackendsCallTest, self).setUp()
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def collect(self, iterator):
+        results = []
+        while True:
+            try:
+                results.append(self.loop.run_until_complete(iterator.__anext__()))
+            except StopAsyncIteration:
+                return results
+
+    def test_results(self):
+        weboob = self.build(5)
+        results = self.collect(weboob.ado('iter_numbers', 3, delay=0.001, loop=self.loop))
+        self.assertEqual(sorted(results), sorted(list(range(3)) * 5))
+        weboob.deinit()
+
+    def test_errors(self):
+        weboob = self.build(2)
+        with self.assertRaises(CallErrors):
+            self.collect(weboob.ado('fail', loop=self.loop))
+        weboob.deinit()
+
+    def test_timeout(self):
+        weboob = self.build(2)
+        delays = {'fake0': [0], 'fake1': [0, 1]}
+        iterator = weboob.ado('iter_slow', delays, timeout=0.3, loop=self.loop)
+        results = []
+        try:
+            with self.assertRaises(CallErrors) as cm:
+                while True:
+                    results.append(self.loop.run_until_complete(iterator.__anext__()))
+            self.assertEqual(sorted(results), ['fake0-0', 'fake1-0'])
+            self.assertEqual([type(error) for _, error, _ in cm.exception], [CallTimeout])
+        finally:
+            weboob.deinit()
+
+    def test_running_loop(self):
+        weboob = self.build(1)
+        with self.assertRaises(RuntimeError):
+            weboob.ado('iter_numbers', 1)
+
+        future = self.loop.create_future()
+        self.loop.call_soon(lambda: future.set_result(weboob.ado('iter_numbers', 1)))
+        iterator = self.loop.run_until_complete(future)
+        self.assertIs(iterator.loop, self.loop)
+        self.assertEqual(self.collect(iterator), [0])
+        weboob.deinit()
+
+    def test_cancel(self):
+        import asyncio
+        weboob = self.build(1)
+        iterator = weboob.ado('iter_numbers', 1000, delay=0.01, loop=self.loop)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(asyncio.wait_for(iterator.__anext__(), 0.001))
+        iterator.call.wait()
+        self.assertTrue(iterator.call.stop_event.is_set())
+        weboob.deinit()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+from unittest import TestCase
+
+from weboob.capabilities.weather import CapWeather
+from weboob.core.bcall import CallErrors
+from weboob.core.modules import _get_capabilities_attrs
+from weboob.core.ouiboube import Weboob
+from weboob.core.repositories import IProgress
+from weboob.tools.backend import Module
+
+
+MODULE = '''
+from weboob.tools.backend import BackendConfig, Module
+from weboob.tools.value import ValueBackendPassword
+
+
+class %(name)sModule(Module):
+    NAME = '%(name)s'
+    VERSION = '%(version)s'
+    CONFIG = BackendConfig(ValueBackendPassword('password'))
+'''
+
+
+class QuietProgress(IProgress):
+    def progress(self, percent, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+class LocalRepositoryTestCase(TestCase):
+    """
+    Weboob with a local repository of fake modules.
+    """
+
+    MODULES = ()
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        repo = os.path.join(self.tmpdir, 'repo')
+        for name in self.MODULES:
+            os.makedirs(os.path.join(repo, name))
+            with open(os.path.join(repo, name, '__init__.py'), 'w') as f:
+                f.write('from .module import %sModule\n' % name)
+            with open(os.path.join(repo, name, 'module.py'), 'w') as f:
+                f.write(MODULE % {'name': name, 'version': Weboob.VERSION})
+
+        with open(os.path.join(self.tmpdir, 'sources.list'), 'w') as f:
+            f.write('file://%s\n' % repo)
+
+        self.weboob = Weboob(workdir=self.tmpdir, datadir=self.tmpdir)
+        self.weboob.repositories.update_repositories(QuietProgress())
+
+    def tearDown(self):
+        self.weboob.deinit()
+        rmtree(self.tmpdir)
+
+    def write_backends(self, backends):
+        path = os.path.join(self.tmpdir, 'backends')
+        with open(path, 'w') as f:
+            for name, module, password in backends:
+                f.write('[%s]\n_module = %s\n' % (name, module))
+                if password is not None:
+                    f.write('password = %s\n' % password)
+        os.chmod(path, 0o600)
+
+
+class LoadBackendsTest(LocalRepositoryTestCase):
+    MODULES = ('fakea', 'fakeb')
+
+    def test_load_backends(self):
+        # Passwords are read with a slow external command.
+        backends = [('b%d' % i, 'fakea' if i % 2 else 'fakeb', '`sleep 0.2; echo pw`') for i in range(6)]
+        backends.insert(3, ('nopassword', 'fakea', None))
+        self.write_backends(backends)
+
+        errors = []
+        start = time()
+        loaded = self.weboob.load_backends(errors=errors)
+        self.assertLess(time() - start, 0.2 * 6)
+
+        names = ['b%d' % i for i in range(6)]
+        self.assertEqual(list(loaded), names)
+        self.assertEqual(list(self.weboob.backend_instances), names)
+        self.assertEqual(self.weboob['b1'].config['password'].get(), 'pw')
+        self.assertEqual([error.backend_name for error in errors], ['nopassword'])
+        self.assertEqual(sorted(self.weboob.load_times), sorted(names + ['nopassword']))
+
+
+class LazyBackendsTest(LocalRepositoryTestCase):
+    MODULES = ('lazya', 'lazyb')
+
+    def setUp(self):
+        super(LazyBackendsTest, self).setUp()
+        self.write_backends([('a', 'lazya', 'pw'), ('b', 'lazyb', 'pw'), ('nopassword', 'lazya', None)])
+
+    def test_not_imported(self):
+        loaded = self.weboob.load_backends(lazy=True)
+        self.assertEqual(list(loaded), ['a', 'b', 'nopassword'])
+        self.assertEqual(self.weboob.modules_loader.loaded, {})
+
+        self.assertEqual(list(self.weboob.iter_backends(caps=CapWeather)), [])
+        self.assertIsNone(getattr(loaded['a'], 'iter_city_search', None))
+        self.assertEqual(self.weboob.modules_loader.loaded, {})
+
+    def test_capabilities_attrs(self):
+        # Found once for each set of capabilities.
+        self.assertIs(_get_capabilities_attrs(['CapWeather']), _get_capabilities_attrs(['CapWeather']))
+        self.assertTrue(_get_capabilities_attrs(['CapWeather'])['iter_city_search'])
+        self.assertFalse(_get_capabilities_attrs([])['iter_city_search'])
+        self.assertNotIn('config', _get_capabilities_attrs([]))
+
+    def test_first_use(self):
+        loaded = self.weboob.load_backends(lazy=True)
+        self.assertEqual(loaded['a'].config['password'].get(), 'pw')
+        self.assertTrue(loaded['a'].loaded)
+        self.assertFalse(loaded['b'].loaded)
+        self.assertEqual(list(self.weboob.modules_loader.loaded), ['lazya'])
+
+        self.assertEqual(list(self.weboob.do(lambda backend: backend.NAME + backend.VERSION, backends=['a', 'b'])),
+                         ['lazya' + Weboob.VERSION, 'lazyb' + Weboob.VERSION])
+        self.assertTrue(loaded['b'].loaded)
+
+    def test_config_error(self):
+        self.weboob.load_backends(lazy=True)
+        try:
+            list(self.weboob.do(lambda backend: backend.VERSION, backends='nopassword'))
+        except CallErrors as errors:
+            self.assertIsInstance(errors.errors[0][1], Module.ConfigError)
+        else:
+            self.fail('CallErrors not raised')
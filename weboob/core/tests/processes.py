@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+import sys
+from shutil import rmtree
+from tempfile import mkdtemp
+from textwrap import dedent
+from unittest import TestCase, skipIf
+
+from weboob.browser.browsers import Browser, StatesMixin
+from weboob.capabilities.base import BaseObject, NotAvailable, NotLoaded, StringField
+from weboob.core.bcall import CallErrors
+from weboob.core.modules import ModulesLoader
+from weboob.core.ouiboube import WebNip
+from weboob.core.processes import ProcessPool
+from weboob.tools.backend import Module
+from weboob.tools.storage import StandardStorage
+
+
+class Number(BaseObject):
+    label = StringField('Label')
+    pid = StringField('Process of the backend')
+    missing = StringField('Missing value')
+
+
+class StatesBrowser(StatesMixin, Browser):
+    __states__ = ('token',)
+    token = None
+
+
+class ProcessModule(Module):
+    NAME = 'process'
+    BROWSER = StatesBrowser
+
+    def iter_numbers(self, count):
+        for i in range(count):
+            obj = Number(str(i))
+            obj.label = u'%s-%d' % (self.name, i)
+            obj.pid = u'%d' % os.getpid()
+            obj.missing = NotAvailable
+            yield obj
+
+    def fail(self):
+        raise ValueError('failed on %s' % self.name)
+
+    def login(self, token):
+        self.browser.token = token
+
+
+class PicklingTest(TestCase):
+    def test_singletons(self):
+        self.assertIs(pickle.loads(pickle.dumps(NotLoaded, 2)), NotLoaded)
+        self.assertIs(pickle.loads(pickle.dumps(NotAvailable, 2)), NotAvailable)
+
+    def test_object(self):
+        obj = Number('1')
+        obj.label = u'one'
+        obj = pickle.loads(pickle.dumps(obj, 2))
+        self.assertEqual(obj.id, '1')
+        self.assertEqual(obj.label, u'one')
+        self.assertIs(obj.pid, NotLoaded)
+
+
+@skipIf(sys.platform == 'win32', 'worker processes are forked')
+class ProcessPoolTest(TestCase):
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.weboob = WebNip(modules_path=False, storage=StandardStorage(os.path.join(self.tmpdir, 'storage')))
+        self.weboob._process_pool = ProcessPool(self.weboob, max_processes=2)
+        for i in range(3):
+            name = 'process%d' % i
+            self.weboob.backend_instances[name] = ProcessModule(self.weboob, name, storage=self.weboob.storage)
+
+    def tearDown(self):
+        self.weboob.deinit()
+        rmtree(self.tmpdir)
+
+    def test_results(self):
+        results = list(self.weboob.do('iter_numbers', 3, processes=True))
+        self.assertEqual(len(results), 9)
+        self.assertEqual(sorted(obj.fullid for obj in results),
+                         sorted('%d@process%d' % (i, j) for i in range(3) for j in range(3)))
+        for obj in results:
+            self.assertEqual(obj.label, u'%s-%s' % (obj.backend, obj.id))
+            self.assertNotEqual(obj.pid, u'%d' % os.getpid())
+            self.assertIs(obj.missing, NotAvailable)
+
+    def test_pinned(self):
+        def pids():
+            return dict((obj.backend, obj.pid) for obj in self.weboob.do('iter_numbers', 1, processes=True))
+
+        first = pids()
+        self.assertEqual(len(set(first.values())), 2)
+        self.assertEqual(pids(), first)
+
+    def test_errors(self):
+        with self.assertRaises(CallErrors) as cm:
+            list(self.weboob.do('fail', processes=True))
+        self.assertEqual(len(cm.exception.errors), 3)
+        for backend, error, backtrace in cm.exception:
+            self.assertIsInstance(error, ValueError)
+            self.assertEqual(str(error), 'failed on %s' % backend.name)
+            self.assertIn('in fail', backtrace)
+
+    def test_break(self):
+        call = self.weboob.do('iter_numbers', 10000, processes=True, backends='process0')
+        for obj in call:
+            break
+        call.wait()
+        # The worker process is still usable.
+        self.assertEqual(len(list(self.weboob.do('iter_numbers', 2, processes=True, backends='process0'))), 2)
+
+    def test_imported_after_fork(self):
+        # Weboob modules are not importable from sys.path.
+        os.makedirs(os.path.join(self.tmpdir, 'modules', 'late'))
+        with open(os.path.join(self.tmpdir, 'modules', 'late', '__init__.py'), 'w') as fp:
+            fp.write(dedent('''
+                import os
+
+                from weboob.tools.backend import Module
+
+
+                class LateModule(Module):
+                    NAME = 'late'
+                    VERSION = '%s'
+
+                    def get_pid(self):
+                        return os.getpid()
+            ''' % WebNip.VERSION))
+        self.weboob.modules_loader = ModulesLoader(os.path.join(self.tmpdir, 'modules'), WebNip.VERSION)
+        try:
+            self.weboob._process_pool = ProcessPool(self.weboob, max_processes=1)
+            obj, = self.weboob.do('iter_numbers', 1, processes=True, backends='process0')
+
+            self.weboob.load_backend('late', 'late')
+            self.assertEqual(list(self.weboob.do('get_pid', processes=True, backends='late')), [int(obj.pid)])
+        finally:
+            sys.modules.pop('late', None)
+
+    def test_states(self):
+        list(self.weboob.do('login', 'remote', processes=True, backends='process0'))
+        # Not used by calls, its state is older.
+        self.weboob['process0'].browser.token = 'local'
+        self.weboob.deinit()
+        self.assertEqual(self.weboob.storage.get('backends', 'process0', 'browser_state', 'token'), 'remote')
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import subprocess
+import tarfile
+from io import BytesIO
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread, current_thread
+from unittest import SkipTest, TestCase
+
+from weboob.core.ouiboube import Weboob
+from weboob.core.repositories import IProgress, Keyring, ModuleInfo, ModuleManifest, Repositories, Repository, Versions
+
+try:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+
+MODULE = '''
+import os
+
+from weboob.capabilities.weather import CapWeather
+from weboob.tools.backend import Module
+
+with open(os.path.join(os.path.dirname(__file__), '..', '..', 'imports'), 'a') as f:
+    f.write('%(name)s\\n')
+
+
+class %(name)sModule(Module, CapWeather):
+    NAME = '%(name)s'
+    DESCRIPTION = u'%(description)s'
+    MAINTAINER = u'Me'
+    LICENSE = 'AGPLv3+'
+'''
+
+
+class BuildIndexTest(TestCase):
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'modules')
+        for name in ('moda', 'modb', 'modc'):
+            self.write_module(name, u'Module %s' % name)
+        self.write_module('broken', 'Broken', error=True)
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def write_module(self, name, description, error=False):
+        path = os.path.join(self.source, name)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        with open(os.path.join(path, '__init__.py'), 'w') as f:
+            f.write('from .module import %sModule\n' % name)
+            if error:
+                f.write('raise ValueError\n')
+        with open(os.path.join(path, 'module.py'), 'w') as f:
+            f.write(MODULE % {'name': name, 'description': description})
+
+    def build(self, incremental=True):
+        cache_path = os.path.join(self.tmpdir, 'cache', 'build.cache') if incremental else None
+        with open(os.path.join(self.tmpdir, 'imports'), 'w'):
+            pass
+
+        r = Repository('file://%s' % self.source)
+        r.name = 'test'
+        r.build_index(self.source, os.path.join(self.tmpdir, Repository.INDEX), cache_path=cache_path)
+
+        with open(os.path.join(self.tmpdir, 'imports')) as f:
+            imported = sorted(f.read().split())
+        with open(os.path.join(self.tmpdir, Repository.INDEX)) as f:
+            index = [line for line in f if not line.startswith('update = ')]
+        return r, imported, index
+
+    def test_incremental(self):
+        r, imported, full = self.build()
+        self.assertEqual(imported, ['broken', 'moda', 'modb', 'modc'])
+        self.assertEqual(sorted(r.modules), ['moda', 'modb', 'modc'])
+        self.assertEqual(r.modules['moda'].capabilities, ['CapWeather'])
+
+        r, imported, index = self.build()
+        self.assertEqual(imported, ['broken'])
+        self.assertEqual(index, full)
+        # Nothing but the index is written next to it.
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['cache', 'imports', 'modules', Repository.INDEX])
+
+        self.write_module('modb', u'Changed')
+        r, imported, index = self.build()
+        self.assertEqual(imported, ['broken', 'modb'])
+        self.assertEqual(r.modules['modb'].description, u'Changed')
+
+        r, imported, full = self.build(incremental=False)
+        self.assertEqual(imported, ['broken', 'moda', 'modb', 'modc'])
+        self.assertEqual(index, full)
+
+
+class QuietProgress(IProgress):
+    def progress(self, percent, message):
+        pass
+
+    def error(self, message):
+        pass
+
+    def prompt(self, message):
+        return True
+
+
+class RequestHandler(SimpleHTTPRequestHandler):
+    def translate_path(self, path):
+        self.server.requests.append(path)
+        path = os.path.relpath(SimpleHTTPRequestHandler.translate_path(self, path), os.getcwd())
+        return os.path.join(self.server.root, path)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteRepositoryTestCase(TestCase):
+    """
+    Repositories with a remote repository served on localhost.
+    """
+
+    MODULES = ('moda', 'modb', 'modc')
+    MANIFESTS = False
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.remote = os.path.join(self.tmpdir, 'remote')
+        os.mkdir(self.remote)
+
+        self.server = HTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.root = self.remote
+        self.server.requests = []
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        with open(os.path.join(self.tmpdir, 'sources.list'), 'w') as f:
+            f.write('http://127.0.0.1:%d/\n' % self.server.server_port)
+        self.publish(1)
+
+        self.repositories = Repositories(self.tmpdir, self.tmpdir, Weboob.VERSION)
+        self.repositories.update_repositories(QuietProgress())
+        for name in self.MODULES:
+            self.repositories.install(name, QuietProgress())
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        rmtree(self.tmpdir)
+
+    def publish(self, version):
+        r = Repository('http://')
+        r.name = 'remote'
+        r.update = version
+        for name in self.MODULES:
+            m = r.modules[name] = ModuleInfo(name)
+            m.version = version
+
+            files = {'__init__.py': ('VERSION = %d\n' % version).encode('ascii'),
+                     'browser.py': b'UNCHANGED = True\n'}
+            with tarfile.open(os.path.join(self.remote, '%s.tar.gz' % name), 'w:gz') as tar:
+                for filename, data in files.items():
+                    info = tarfile.TarInfo('%s/%s' % (name, filename))
+                    info.size = len(data)
+                    tar.addfile(info, BytesIO(data))
+
+            if self.MANIFESTS:
+                r.manifests = True
+                manifest = ModuleManifest()
+                for filename, data in files.items():
+                    digest = manifest.files[filename] = hashlib.sha256(data).hexdigest()
+                    path = os.path.join(self.remote, ModuleManifest.object_path(digest))
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    with open(path, 'wb') as f:
+                        f.write(data)
+                with open(os.path.join(self.remote, '%s.manifest' % name), 'wb') as f:
+                    f.write(manifest.dump())
+        r.save(os.path.join(self.remote, r.INDEX))
+
+    def installed(self):
+        versions = {}
+        for name in self.MODULES:
+            with open(os.path.join(self.repositories.modules_dir, name, '__init__.py')) as f:
+                versions[name] = (f.read(), self.repositories.versions.get(name))
+        return versions
+
+
+class UpdateTest(RemoteRepositoryTestCase):
+    def test_update(self):
+        self.publish(2)
+        self.repositories.update(QuietProgress())
+
+        self.assertEqual(self.installed(), dict((name, ('VERSION = 2\n', 2)) for name in self.MODULES))
+        self.assertEqual(Versions(self.repositories.modules_dir).get('moda'), 2)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.repositories.modules_dir))), [Weboob.VERSION])
+
+    def test_icons(self):
+        self.publish(2)
+        browsers = {}
+        warnings = []
+
+        def retrieve_icon(module, browser=None):
+            browsers.setdefault(browser, set()).add(current_thread())
+            if module.name == 'modb':
+                raise ValueError('no icon')
+
+        self.repositories.retrieve_icon = retrieve_icon
+        self.repositories.logger.warning = lambda *args: warnings.append(args)
+        self.repositories.update(QuietProgress())
+
+        self.assertEqual(self.installed(), dict((name, ('VERSION = 2\n', 2)) for name in self.MODULES))
+        # Each worker has its own browser.
+        self.assertNotIn(self.repositories.browser, browsers)
+        self.assertTrue(all(len(threads) == 1 for threads in browsers.values()))
+        # Errors are not lost.
+        self.assertEqual([args[1] for args in warnings], ['modb'])
+
+    def test_concurrent_install(self):
+        for name in self.MODULES:
+            rmtree(os.path.join(self.repositories.modules_dir, name))
+        download_module = self.repositories.download_module
+        browsers = []
+
+        def download(module, browser=None):
+            browsers.append(browser)
+            return download_module(module, browser)
+
+        self.repositories.download_module = download
+        threads = [Thread(target=self.repositories.install, args=(name, QuietProgress())) for name in self.MODULES]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.installed(), dict((name, ('VERSION = 1\n', 1)) for name in self.MODULES))
+        # Each thread has its own browser.
+        self.assertEqual(len(set(browsers)), len(self.MODULES))
+        self.assertNotIn(self.repositories.browser, browsers)
+
+    def test_invalid_module(self):
+        self.publish(2)
+        with open(os.path.join(self.remote, 'modb.tar.gz'), 'wb') as f:
+            f.write(b'not an archive')
+        self.repositories.update(QuietProgress())
+
+        installed = self.installed()
+        self.assertEqual(installed['moda'], ('VERSION = 2\n', 2))
+        self.assertEqual(installed['modb'], ('VERSION = 1\n', 1))
+
+    def test_interrupted(self):
+        self.publish(2)
+        extract_module = self.repositories.extract_module
+
+        def interrupt(module, tardata, modules_dir):
+            if module.name == 'modc':
+                raise KeyboardInterrupt()
+            extract_module(module, tardata, modules_dir)
+
+        self.repositories.extract_module = interrupt
+        with self.assertRaises(KeyboardInterrupt):
+            self.repositories.update(QuietProgress())
+
+        self.assertEqual(self.installed(), dict((name, ('VERSION = 1\n', 1)) for name in self.MODULES))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.repositories.modules_dir))), [Weboob.VERSION])
+
+
+class ManifestUpdateTest(UpdateTest):
+    MANIFESTS = True
+
+    def test_update(self):
+        browser = os.path.join(self.repositories.modules_dir, 'moda', 'browser.py')
+        inode = os.stat(browser).st_ino
+        self.publish(2)
+        del self.server.requests[:]
+        super(ManifestUpdateTest, self).test_update()
+
+        # Only the new __init__.py, shared by modules, is downloaded.
+        self.assertEqual(len([path for path in self.server.requests if path.startswith('/objects/')]), 1)
+        self.assertFalse([path for path in self.server.requests if path.endswith('.tar.gz')])
+        self.assertEqual(os.stat(browser).st_ino, inode)
+        # The previous __init__.py is removed from the local store.
+        self.assertEqual(len(self.objects()), 2)
+
+    def test_invalid_module(self):
+        self.publish(2)
+        with open(os.path.join(self.remote, 'modb.manifest'), 'wb') as f:
+            f.write(b'not a manifest')
+        self.repositories.update(QuietProgress())
+
+        installed = self.installed()
+        self.assertEqual(installed['moda'], ('VERSION = 2\n', 2))
+        self.assertEqual(installed['modb'], ('VERSION = 1\n', 1))
+
+    def objects(self):
+        return [os.path.join(root, filename) for root, dirs, files in os.walk(self.repositories.objects_dir)
+                for filename in files]
+
+    def test_install(self):
+        rmtree(os.path.join(self.repositories.modules_dir, 'moda'))
+        self.repositories.install('moda', QuietProgress())
+        # Files are copies of the local store.
+        browser = os.path.join(self.repositories.modules_dir, 'moda', 'browser.py')
+        self.assertEqual(os.stat(browser).st_nlink, 1)
+        with open(browser, 'a') as f:
+            f.write('EDITED = True\n')
+        for path in self.objects():
+            with open(path) as f:
+                self.assertNotIn('EDITED', f.read())
+
+    def test_concurrent_prune(self):
+        self.publish(2)
+        self.repositories.update_repositories(QuietProgress())
+        extract_module = self.repositories.extract_module
+        threads = []
+
+        def extract(module, tardata, modules_dir):
+            # Files of the module are downloaded, but not used by a
+            # manifest yet.
+            thread = Thread(target=self.repositories.prune_objects)
+            thread.start()
+            thread.join(0.2)
+            threads.append(thread)
+            extract_module(module, tardata, modules_dir)
+
+        self.repositories.extract_module = extract
+        self.repositories.install('moda', QuietProgress())
+        threads[0].join()
+        self.assertEqual(self.installed()['moda'], ('VERSION = 2\n', 2))
+
+    def test_prune(self):
+        self.assertEqual(len(self.objects()), 2)
+        self.repositories.store_object(hashlib.sha256(b'unused').hexdigest(), b'unused')
+        self.repositories.prune_objects()
+        self.assertEqual(len(self.objects()), 2)
+
+        # Files of a removed module are not used anymore.
+        for name in self.MODULES[1:]:
+            rmtree(os.path.join(self.repositories.modules_dir, name))
+        self.repositories.prune_objects()
+        self.assertEqual(len(self.objects()), 2)
+        rmtree(os.path.join(self.repositories.modules_dir, self.MODULES[0]))
+        self.repositories.prune_objects()
+        self.assertEqual(self.objects(), [])
+
+
+class CacheTest(RemoteRepositoryTestCase):
+    def load(self):
+        parsed = []
+        parse_index = Repository.parse_index
+
+        def parse(repository, fp):
+            parsed.append(repository)
+            return parse_index(repository, fp)
+
+        Repository.parse_index = parse
+        try:
+            return Repositories(self.tmpdir, self.tmpdir, Weboob.VERSION), len(parsed)
+        finally:
+            Repository.parse_index = parse_index
+
+    def test_cache(self):
+        # Versions changed since the cache was saved.
+        repositories, parsed = self.load()
+        self.assertEqual(parsed, 1)
+
+        repositories, parsed = self.load()
+        self.assertEqual(parsed, 0)
+        self.assertEqual(repositories.get_module_info('moda').version, 1)
+        self.assertEqual(repositories.get_module_info('moda').path, repositories.modules_dir)
+        self.assertEqual(repositories.versions.get('moda'), 1)
+        self.assertTrue(repositories.check_repositories())
+
+    def test_invalidation(self):
+        self.load()
+        self.publish(2)
+        self.repositories.update_repositories(QuietProgress())
+        repositories, parsed = self.load()
+        self.assertEqual(parsed, 1)
+        self.assertEqual(repositories.get_module_info('moda').version, 2)
+
+        repositories.versions.set('moda', 2)
+        self.assertEqual(self.load()[0].versions.get('moda'), 2)
+
+        with open(os.path.join(self.tmpdir, 'sources.list'), 'a') as f:
+            f.write('http://127.0.0.1:1/\n')
+        self.assertFalse(self.load()[0].check_repositories())
+
+
+class KeyringTest(TestCase):
+    def setUp(self):
+        if not Keyring.find_gpg():
+            raise SkipTest('gpg is not installed')
+
+        self.tmpdir = mkdtemp()
+        self.gpg = [Keyring.find_gpg(), '--batch', '--quiet', '--homedir', self.tmpdir, '--passphrase', '']
+        subprocess.check_call(self.gpg + ['--quick-gen-key', 'test@example.org', 'default', 'sign', 'never'],
+                              stderr=subprocess.PIPE)
+        self.keyring = Keyring(os.path.join(self.tmpdir, 'test'))
+        self.keyring.save(subprocess.check_output(self.gpg + ['--export']), 1)
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def sign(self, data):
+        proc = subprocess.Popen(self.gpg + ['--detach-sign'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return proc.communicate(data)[0]
+
+    def test_are_valid(self):
+        items = [(b'data%d' % i, self.sign(b'data%d' % i)) for i in range(4)]
+        items[1] = (b'tampered', items[1][1])
+        items[2] = (items[2][0], b'not a signature')
+        self.assertEqual(self.keyring.are_valid(items), [True, False, False, True])
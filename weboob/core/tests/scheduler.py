@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from time import sleep, time
+from unittest import TestCase
+
+from weboob.core.scheduler import Scheduler
+from weboob.tools.backend import Module
+
+
+class SchedulerModule(Module):
+    NAME = 'scheduler'
+
+    def poll(self, calls):
+        calls.append((self.name, time()))
+
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+
+    def tearDown(self):
+        self.scheduler._wait_to_stop()
+
+    def test_schedule(self):
+        calls = []
+        start = time()
+        self.scheduler.schedule(0.1, calls.append, 'late')
+        self.scheduler.schedule(0.05, calls.append, 'early')
+        self.scheduler.schedule(0, calls.append, 'now')
+        sleep(0.3)
+        self.assertEqual(calls, ['now', 'early', 'late'])
+        self.assertEqual(self.scheduler.queue, {})
+        self.assertLess(time() - start, 1)
+
+    def test_cancel(self):
+        calls = []
+        ev = self.scheduler.schedule(0.05, calls.append, 'canceled')
+        self.scheduler.schedule(0.1, calls.append, 'called')
+        self.assertTrue(self.scheduler.cancel(ev))
+        self.assertFalse(self.scheduler.cancel(ev))
+        sleep(0.2)
+        self.assertEqual(calls, ['called'])
+
+    def test_repeat(self):
+        calls = []
+        ev = self.scheduler.repeat(0.05, calls.append, 'call')
+        sleep(0.28)
+        self.scheduler.cancel(ev)
+        count = len(calls)
+        self.assertGreaterEqual(count, 4)
+        self.assertLessEqual(count, 6)
+        sleep(0.1)
+        self.assertEqual(len(calls), count)
+
+    def test_repeat_first_call(self):
+        calls = []
+        start = time()
+        ev = self.scheduler.repeat(10, lambda: calls.append(time()))
+        sleep(0.1)
+        self.scheduler.cancel(ev)
+        self.assertEqual(len(calls), 1)
+        self.assertLess(calls[0] - start, 0.05)
+
+    def test_single_thread(self):
+        threads = threading.active_count()
+        events = [self.scheduler.schedule(10, lambda: None) for _ in range(100)]
+        # The dispatcher only, calls have not started.
+        self.assertEqual(threading.active_count(), threads + 1)
+        for ev in events:
+            self.scheduler.cancel(ev)
+
+    def test_coalesce(self):
+        calls = []
+
+        def slow():
+            calls.append(time())
+            sleep(0.25)
+
+        ev = self.scheduler.repeat(0.05, slow)
+        sleep(0.6)
+        self.scheduler.cancel(ev)
+        # Missed calls are not run one after the other.
+        self.assertLessEqual(len(calls), 3)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.25)
+
+    def test_exception(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise ValueError('failed')
+
+        self.scheduler.repeat(0.05, fail)
+        sleep(0.2)
+        self.assertGreaterEqual(len(calls), 2)
+
+    def test_spacing(self):
+        self.scheduler = Scheduler(spacing=0.1)
+        calls = []
+        backend = SchedulerModule(None, 'b1')
+        other = SchedulerModule(None, 'b2')
+        for _ in range(3):
+            self.scheduler.schedule(0, backend.poll, calls)
+        self.scheduler.schedule(0, other.poll, calls)
+        sleep(0.35)
+
+        self.assertEqual(len(calls), 4)
+        starts = [t for name, t in calls if name == 'b1']
+        self.assertGreaterEqual(starts[1] - starts[0], 0.09)
+        self.assertGreaterEqual(starts[2] - starts[1], 0.09)
+        # Other backends are not delayed.
+        self.assertLess([t for name, t in calls if name == 'b2'][0] - starts[0], 0.05)
+
+    def test_spacing_key(self):
+        self.scheduler = Scheduler(spacing=0.1, key=lambda function, args: args[0])
+        calls = []
+        for name in ('a', 'a', 'b'):
+            self.scheduler.schedule(0, lambda name: calls.append((name, time())), name)
+        sleep(0.15)
+
+        self.assertEqual(sorted(name for name, t in calls), ['a', 'a', 'b'])
+        starts = [t for name, t in calls if name == 'a']
+        self.assertGreaterEqual(starts[1] - starts[0], 0.09)
+
+    def test_jitter(self):
+        self.scheduler = Scheduler(jitter=0.5)
+        calls = []
+        start = time()
+        self.scheduler.schedule(0.1, lambda: calls.append(time()))
+        sleep(0.25)
+        self.assertEqual(len(calls), 1)
+        self.assertGreaterEqual(calls[0] - start, 0.1)
+        self.assertLessEqual(calls[0] - start, 0.2)
+
+    def test_stop(self):
+        calls = []
+        self.scheduler.repeat(0.05, calls.append, 'call')
+        self.scheduler.schedule(0.1, self.scheduler.want_stop)
+        start = time()
+        self.assertTrue(self.scheduler.run())
+        self.assertLess(time() - start, 1.5)
+        count = len(calls)
+        self.assertIsNone(self.scheduler.schedule(0, calls.append, 'stopped'))
+        sleep(0.1)
+        self.assertEqual(len(calls), count)
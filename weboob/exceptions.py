@@ -103,3 +103,12 @@ class AuthMethodNotImplemented(ActionNeeded):
 
 class BrowserPasswordExpired(ActionNeeded):
     pass
+
+
+class CallCancelled(BaseException):
+    """
+    Raised by a browser when the call which runs it has been cancelled.
+
+    It is not an :class:`Exception`, so it is not caught by modules which
+    handle any error.
+    """
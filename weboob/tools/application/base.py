@@ -36,6 +36,7 @@ from weboob.tools.config.iconfig import ConfigError
 from weboob.exceptions import FormFieldConversionWarning
 from weboob.tools.log import createColoredFormatter, getLogger, DEBUG_FILTERS, settings as log_settings
 from weboob.tools.misc import to_unicode, guess_encoding
+from weboob.tools.profiler import startup_profiler
 from weboob.tools.compat import unicode
 
 from .results import ResultsConditionError
@@ -175,6 +176,9 @@ class Application(object):
         logging_options.add_option('--logging-file', action='store', type='string', dest='logging_file', help='file to save logs')
         logging_options.add_option('-a', '--save-responses', action='store_true', help='save every response')
         logging_options.add_option('--export-session', action='store_true', help='log browser session cookies after login')
+        logging_options.add_option('--profile-startup', action='store_true',
+                                   help='display durations of phases of the startup (imports, config, '
+                                        'repositories, backends, first request)')
         self._parser.add_option_group(logging_options)
         self._parser.add_option('--shell-completion', action='store_true', help=optparse.SUPPRESS_HELP)
         self._is_default_count = True
@@ -257,7 +261,8 @@ class Application(object):
             names = self.options.backends.split(',')
         if exclude is None and self.options.exclude_backends:
             exclude = self.options.exclude_backends.split(',')
-        loaded = self.weboob.load_backends(caps, names, exclude=exclude, *args, **kwargs)
+        with startup_profiler.phase('backends'):
+            loaded = self.weboob.load_backends(caps, names, exclude=exclude, *args, **kwargs)
         if not loaded:
             logging.info(u'No backend loaded')
         return loaded
@@ -479,16 +484,25 @@ class Application(object):
         if args is None:
             args = [(cls.stdin.encoding and isinstance(arg, bytes) and arg.decode(cls.stdin.encoding) or to_unicode(arg)) for arg in sys.argv]
 
+        # Options are parsed after the creation of the application, which
+        # is already profiled.
+        if '--profile-startup' in args:
+            startup_profiler.enable()
+
         try:
-            app = cls()
+            with startup_profiler.phase('config'):
+                app = cls()
         except BackendsConfig.WrongPermissions as e:
             print(e, file=cls.stderr)
             sys.exit(1)
 
         try:
             try:
-                args = app.parse_args(args)
-                sys.exit(app.main(args))
+                with startup_profiler.phase('config'):
+                    args = app.parse_args(args)
+                with startup_profiler.phase('main'):
+                    ret = app.main(args)
+                sys.exit(ret)
             except KeyboardInterrupt:
                 print('Program killed by SIGINT', file=cls.stderr)
                 sys.exit(0)
@@ -508,3 +522,5 @@ class Application(object):
                 sys.exit(1)
         finally:
             app.deinit()
+            if startup_profiler.start is not None:
+                startup_profiler.report(cls.stderr)
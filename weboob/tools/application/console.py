@@ -32,11 +32,13 @@ import os
 from weboob.capabilities import UserError
 from weboob.capabilities.account import CapAccount, Account, AccountRegisterError
 from weboob.core.backendscfg import BackendAlreadyExists
+from weboob.core.bcall import CallTimeout
 from weboob.core.repositories import IProgress
 from weboob.exceptions import BrowserUnavailable, BrowserIncorrectPassword, BrowserForbidden, \
                               BrowserSSLError, BrowserQuestion, BrowserHTTPSDowngrade, \
                               ModuleInstallError, ModuleLoadError, NoAccountsException, \
                               ActionNeeded, CaptchaQuestion
+from weboob.tools.backend import Module
 from weboob.tools.value import Value, ValueBool, ValueFloat, ValueInt, ValueBackendPassword
 from weboob.tools.misc import to_unicode
 from weboob.tools.compat import unicode, long
@@ -84,6 +86,10 @@ class ConsoleApplication(Application):
     """
 
     CAPS = None
+    # Set to True to create backends on first use, without importing their
+    # module at startup. A backend with an invalid configuration is then
+    # reported by the first command which calls it.
+    LAZY_BACKENDS = False
 
     # shell escape strings
     if sys.platform == 'win32' \
@@ -209,14 +215,15 @@ class ConsoleApplication(Application):
 
     def load_default_backends(self):
         """
-        By default loads all backends.
+        By default loads all backends, lazily if :attr:`LAZY_BACKENDS` is
+        set.
 
         Applications can overload this method to restrict backends loaded.
         """
         if len(self.STORAGE) > 0:
-            self.load_backends(self.CAPS, storage=self.create_storage())
+            self.load_backends(self.CAPS, storage=self.create_storage(), lazy=self.LAZY_BACKENDS)
         else:
-            self.load_backends(self.CAPS)
+            self.load_backends(self.CAPS, lazy=self.LAZY_BACKENDS)
 
     @classmethod
     def run(klass, args=None):
@@ -584,11 +591,11 @@ class ConsoleApplication(Application):
                     backend.config[field.id].set(v)
         elif isinstance(error, CaptchaQuestion):
             print(u'Warning(%s): Captcha has been found on login page' % backend.name, file=self.stderr)
-        elif isinstance(error, BrowserIncorrectPassword):
-            msg = unicode(error)
-            if not msg:
+        elif isinstance(error, (BrowserIncorrectPassword, Module.ConfigError)):
+            msg = to_unicode(error)
+            if not msg and isinstance(error, BrowserIncorrectPassword):
                 msg = 'invalid login/password.'
-            print('Error(%s): %s' % (backend.name, msg), file=self.stderr)
+            print(u'Error(%s): %s' % (backend.name, msg), file=self.stderr)
             if self.ask('Do you want to reconfigure this backend?', default=True):
                 self.unload_backends(names=[backend.name])
                 self.edit_backend(backend.name)
@@ -616,6 +623,9 @@ class ConsoleApplication(Application):
             print(u'Hint: There are more results for backend %s' % (backend.name), file=self.stderr)
         elif isinstance(error, NoAccountsException):
             print(u'Error(%s): %s' % (backend.name, to_unicode(error) or 'No account on this backend'), file=self.stderr)
+        elif isinstance(error, CallTimeout):
+            print(u'Error(%s): no answer after %.1f seconds, results may be incomplete.' % (backend.name, error.timeout),
+                  file=self.stderr)
         else:
             print(u'Bug(%s): %s' % (backend.name, to_unicode(error)), file=self.stderr)
 
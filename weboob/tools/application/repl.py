@@ -35,6 +35,7 @@ from weboob.core import CallErrors
 from weboob.tools.application.formatters.iformatter import MandatoryFieldsNotFound
 from weboob.tools.compat import range, basestring, unicode
 from weboob.tools.misc import to_unicode
+from weboob.tools.profiler import startup_profiler
 from weboob.tools.path import WorkingPath
 from weboob.capabilities.collection import Collection, BaseCollection, CapCollection, CollectionNotFound
 
@@ -157,6 +158,8 @@ class ReplApplication(ConsoleApplication, MyCmd):
         results_options.add_option('-n', '--count', type='int',
                                    help='limit number of results (from each backends)')
         results_options.add_option('-s', '--select', help='select result item keys to display (comma separated)')
+        results_options.add_option('--timeout', type='float',
+                                   help='display results received before this delay (in seconds) and give up on late backends')
         self._parser.add_option_group(results_options)
 
         formatting_options = OptionGroup(self._parser, 'Formatting Options')
@@ -347,6 +350,7 @@ class ReplApplication(ConsoleApplication, MyCmd):
 
             self.intro += '\nLoaded backends: %s\n' % ', '.join(sorted(backend.name for backend in self.weboob.iter_backends()))
             self._interactive = True
+            startup_profiler.stop()
             self.cmdloop()
 
     def do(self, function, *args, **kwargs):
@@ -386,6 +390,9 @@ class ReplApplication(ConsoleApplication, MyCmd):
                 print('Warning: some selected fields will not be displayed by the formatter. Fallback to another. Hint: use option -f', file=self.stderr)
                 self.formatter = self.formatters_loader.build_formatter(ReplApplication.DEFAULT_FORMATTER)
 
+        if self.options.timeout:
+            kwargs.setdefault('timeout', self.options.timeout)
+
         return self.weboob.do(self._do_complete, self.options.count, fields, function, *args, **kwargs)
 
     # -- command tools ------------
@@ -18,9 +18,10 @@
 
 
 import os
-from threading import RLock
+from threading import Condition, Lock, current_thread, local
 from copy import copy
 
+from weboob.browser.cache import CacheMixin, FileCacheStore
 from weboob.capabilities.base import BaseObject, FieldNotFound, \
     Capability, NotLoaded, NotAvailable
 from weboob.tools.misc import iter_fields
@@ -30,7 +31,7 @@ from weboob.tools.value import ValuesDict
 from weboob.exceptions import ModuleInstallError
 
 
-__all__ = ['BackendStorage', 'BackendConfig', 'Module']
+__all__ = ['BackendStorage', 'BackendConfig', 'BrowserPool', 'SharedLock', 'Module']
 
 
 class BackendStorage(object):
@@ -204,6 +205,162 @@ class BackendConfig(ValuesDict):
         self.weboob.backends_config.add_backend(self.instname, self.modname, dump, edit)
 
 
+class SharedLock(object):
+    """
+    Reentrant lock, held either by one thread (exclusive) or by several
+    threads at the same time (shared).
+
+    :meth:`acquire` and :meth:`release`, also used by the ``with``
+    statement, take the lock exclusively, like a :class:`threading.RLock`.
+    A thread holding the lock exclusively can also take it shared, and a
+    thread holding it shared can take it exclusively once other threads
+    released it. Threads waiting for the exclusive lock go before threads
+    which do not hold the lock yet.
+    """
+
+    def __init__(self):
+        self.cond = Condition(Lock())
+        self.owner = None
+        self.depth = 0
+        # Number of shared acquisitions by thread.
+        self.readers = {}
+        self.waiting = 0
+
+    def acquire(self):
+        """
+        Take the lock exclusively.
+        """
+        thread = current_thread()
+        with self.cond:
+            if self.owner is not thread:
+                self.waiting += 1
+                try:
+                    while self.owner is not None or any(reader is not thread for reader in self.readers):
+                        self.cond.wait()
+                finally:
+                    self.waiting -= 1
+                self.owner = thread
+            self.depth += 1
+        return True
+
+    def release(self):
+        """
+        Release the lock taken with :meth:`acquire`.
+        """
+        with self.cond:
+            if self.owner is not current_thread():
+                raise RuntimeError('cannot release un-acquired lock')
+            self.depth -= 1
+            if self.depth == 0:
+                self.owner = None
+                self.cond.notify_all()
+
+    def acquire_shared(self):
+        """
+        Take the lock shared.
+        """
+        thread = current_thread()
+        with self.cond:
+            if self.owner is not thread and thread not in self.readers:
+                while self.owner is not None or self.waiting:
+                    self.cond.wait()
+            self.readers[thread] = self.readers.get(thread, 0) + 1
+
+    def release_shared(self):
+        """
+        Release the lock taken with :meth:`acquire_shared`.
+        """
+        thread = current_thread()
+        with self.cond:
+            if thread not in self.readers:
+                raise RuntimeError('cannot release un-acquired lock')
+            self.readers[thread] -= 1
+            if self.readers[thread] == 0:
+                del self.readers[thread]
+                self.cond.notify_all()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, t, v, tb):
+        self.release()
+
+
+class BrowserPool(object):
+    """
+    Browsers of a backend, checked out by concurrent calls.
+
+    Browsers are created when needed, up to *size*. When a browser is
+    checked in, its state is stored in the backend storage, so browsers
+    created later reuse its session (cookies and saved attributes, see
+    :class:`weboob.browser.browsers.StatesMixin`) instead of logging in
+    again.
+
+    :param module: backend which owns browsers
+    :type module: :class:`Module`
+    :param size: maximum number of browsers
+    :type size: int
+    """
+
+    def __init__(self, module, size):
+        self.module = module
+        self.size = size
+        self.cond = Condition()
+        self.idle = []
+        self.count = 0
+        self.closed = False
+
+    def checkout(self):
+        """
+        Get a browser which is not used, waiting for one if there are
+        already *size* browsers in use.
+        """
+        with self.cond:
+            while not self.idle and self.count >= self.size:
+                self.cond.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.count += 1
+
+        try:
+            return self.module.create_default_browser()
+        except Exception:
+            with self.cond:
+                self.count -= 1
+                self.cond.notify()
+            raise
+
+    def checkin(self, browser):
+        """
+        Give back a browser, and share its state.
+        """
+        if hasattr(browser, 'dump_state'):
+            self.module.storage.set('browser_state', browser.dump_state())
+
+        with self.cond:
+            if not self.closed:
+                self.idle.append(browser)
+                self.cond.notify()
+                return
+            self.count -= 1
+
+        if hasattr(browser, 'deinit'):
+            browser.deinit()
+
+    def close(self):
+        """
+        Deinit idle browsers; browsers in use are deinit when checked in.
+        """
+        with self.cond:
+            self.closed = True
+            browsers, self.idle = self.idle, []
+            self.count -= len(browsers)
+
+        for browser in browsers:
+            if hasattr(browser, 'deinit'):
+                browser.deinit()
+
+
 class Module(object):
     """
     Base class for modules.
@@ -240,6 +397,15 @@ class Module(object):
     STORAGE = {}
     # Browser class
     BROWSER = None
+    # Set to False if several browsers of a backend can't be used at the
+    # same time (for example if the website kills concurrent sessions, or
+    # if the module keeps state outside of its browser), so the
+    # '_browser_pool' option is ignored.
+    BROWSER_POOLABLE = True
+    # Directory of the data directory where a browser using CacheMixin
+    # keeps responses, in a subdirectory for each backend. By default (None),
+    # they are kept in memory only.
+    CACHE_DIR = None
     # URL to an optional icon.
     # If you want to create your own icon, create a 'favicon.ico' ico in
     # the module's directory, and keep the ICON value to None.
@@ -257,10 +423,28 @@ class Module(object):
         """
 
     def __enter__(self):
-        self.lock.acquire()
+        if self.browser_pool is None:
+            self.lock.acquire()
+        else:
+            # Calls run concurrently, each one with its own browser, but
+            # wait for the exclusive lock (deinit, configuration changes).
+            self.lock.acquire_shared()
+            self._local.depth = getattr(self._local, 'depth', 0) + 1
 
     def __exit__(self, t, v, tb):
-        self.lock.release()
+        if self.browser_pool is None:
+            self.lock.release()
+            return
+
+        try:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                browser = getattr(self._local, 'browser', None)
+                self._local.browser = None
+                if browser is not None:
+                    self.browser_pool.checkin(browser)
+        finally:
+            self.lock.release_shared()
 
     def __repr__(self):
         return "<Backend %r>" % self.name
@@ -269,7 +453,9 @@ class Module(object):
         self.logger = getLogger(name, parent=logger)
         self.weboob = weboob
         self.name = name
-        self.lock = RLock()
+        # Held by calls, shared with a browser pool, and exclusively to
+        # deinit the backend or change its configuration.
+        self.lock = SharedLock()
         if config is None:
             config = {}
 
@@ -282,21 +468,49 @@ class Module(object):
         self.storage = BackendStorage(self.name, storage)
         self.storage.load(self.STORAGE)
 
+        # Per-thread state: cancel token and browser of the running call.
+        self._local = local()
+        self.browser_pool = None
+        pool_size = int(self._private_config.get('_browser_pool', 0) or 0)
+        if pool_size > 1 and self.BROWSER_POOLABLE and self.BROWSER:
+            self.browser_pool = BrowserPool(self, pool_size)
+
     def deinit(self):
         """
         This abstract method is called when the backend is unloaded.
         """
+        if self.browser_pool is not None:
+            # States of pooled browsers are stored when checked in.
+            self.browser_pool.close()
+            self.storage.save()
+
         if self._browser is None:
             return
 
-        if hasattr(self.browser, 'dump_state'):
-            self.storage.set('browser_state', self.browser.dump_state())
+        if hasattr(self._browser, 'dump_state'):
+            self.storage.set('browser_state', self._browser.dump_state())
             self.storage.save()
-        if hasattr(self.browser, 'deinit'):
-            self.browser.deinit()
+        if hasattr(self._browser, 'deinit'):
+            self._browser.deinit()
 
     _browser = None
 
+    @property
+    def cancel_token(self):
+        """
+        :class:`weboob.tools.cancel.CancelToken` of the task running in the
+        current thread, if any. It is given to the browser, so a cancelled
+        task stops sending requests.
+        """
+        return getattr(self._local, 'cancel_token', None)
+
+    @cancel_token.setter
+    def cancel_token(self, token):
+        self._local.cancel_token = token
+        browser = getattr(self._local, 'browser', None) or self._browser
+        if hasattr(browser, 'cancel_token'):
+            browser.cancel_token = token
+
     @property
     def browser(self):
         """
@@ -304,7 +518,18 @@ class Module(object):
         of this attribute, to avoid useless pages access.
 
         Note that the :func:`create_default_browser` method is called to create it.
+
+        With a :attr:`browser_pool`, a call (between ``__enter__`` and
+        ``__exit__``) gets a browser checked out from the pool.
         """
+        if self.browser_pool is not None and getattr(self._local, 'depth', 0):
+            if getattr(self._local, 'browser', None) is None:
+                browser = self.browser_pool.checkout()
+                if hasattr(browser, 'cancel_token'):
+                    browser.cancel_token = self.cancel_token
+                self._local.browser = browser
+            return self._local.browser
+
         if self._browser is None:
             self._browser = self.create_default_browser()
         return self._browser
@@ -341,9 +566,15 @@ class Module(object):
         if self._private_config.get('_highlight_el', ''):
             kwargs.setdefault('highlight_el', bool(int(self._private_config['_highlight_el'])))
 
+        if issubclass(klass, CacheMixin) and self.CACHE_DIR and getattr(self.weboob, 'repositories', None) is not None:
+            kwargs.setdefault('cache_store', FileCacheStore(os.path.join(self.weboob.repositories.datadir,
+                                                                         self.CACHE_DIR, self.name)))
 
         browser = klass(*args, **kwargs)
 
+        if hasattr(browser, 'cancel_token'):
+            browser.cancel_token = self.cancel_token
+
         if hasattr(browser, 'load_state'):
             browser.load_state(self.storage.get('browser_state', default={}))
 
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Event, Lock
+
+from weboob.exceptions import CallCancelled
+
+
+__all__ = ['CancelToken']
+
+
+class CancelToken(object):
+    """
+    Cooperative cancellation of the task of a backend.
+
+    The token is given by :class:`weboob.core.bcall.BackendsCall` to the
+    backend, which hands it to its browsers. Browsers check it before
+    sending each request, and stop paginating as soon as it is cancelled.
+
+    Asynchronous requests which have not been sent yet are cancelled too.
+    A request already in flight can't be interrupted, but its response is
+    dropped.
+    """
+
+    def __init__(self):
+        self.event = Event()
+        self.lock = Lock()
+        # Pending futures of asynchronous requests.
+        self.futures = set()
+        # Number of requests which have not been sent because of the
+        # cancellation.
+        self.saved = 0
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """
+        Cancel the task, and its pending asynchronous requests.
+        """
+        self.event.set()
+        with self.lock:
+            futures, self.futures = self.futures, set()
+        for future in futures:
+            if future.cancel():
+                with self.lock:
+                    self.saved += 1
+
+    def check(self, request=True):
+        """
+        Raise :class:`weboob.exceptions.CallCancelled` if the task is
+        cancelled.
+
+        :param request: if True, a request is about to be sent and is
+                        counted as saved
+        :type request: bool
+        """
+        if self.event.is_set():
+            if request:
+                with self.lock:
+                    self.saved += 1
+            raise CallCancelled()
+
+    def add_future(self, future):
+        """
+        Watch a future of an asynchronous request, to cancel it with the
+        task.
+        """
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._discard_future)
+        if self.event.is_set():
+            self.cancel()
+
+    def _discard_future(self, future):
+        with self.lock:
+            self.futures.discard(future)
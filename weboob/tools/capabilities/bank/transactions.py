@@ -17,14 +17,14 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
-from collections import OrderedDict
 from decimal import Decimal, InvalidOperation
+from heapq import heappop, heappush, heapreplace
 import datetime
 import re
 
 from weboob.capabilities.bank import Transaction, Account
 from weboob.capabilities import NotAvailable, NotLoaded
-from weboob.tools.misc import to_unicode
+from weboob.tools.misc import ReversedKey, to_unicode
 from weboob.tools.log import getLogger
 from weboob.tools.date import new_datetime
 
@@ -361,24 +361,23 @@ def merge_iterators(*iterables):
     Each iterator must already be sorted in reverse chronological order.
     """
 
-    def keyfunc(kv):
-        return (kv[1].date, kv[1].rdate)
+    heap = []
+    for index, it in enumerate(iterables):
+        it = iter(it)
+        for tr in it:
+            heappush(heap, (ReversedKey((tr.date, tr.rdate)), index, tr, it))
+            break
 
-    its = OrderedDict((iter(it), None) for it in iterables)
-    for k in list(its):
-        try:
-            its[k] = next(k)
-        except StopIteration:
-            del its[k]
+    while heap:
+        _, index, tr, it = heap[0]
+        yield tr
 
-    while its:
-        k, v = max(its.items(), key=keyfunc)
-        yield v
+        for tr in it:
+            heapreplace(heap, (ReversedKey((tr.date, tr.rdate)), index, tr, it))
+            break
+        else:
+            heappop(heap)
 
-        try:
-            its[k] = next(k)
-        except StopIteration:
-            del its[k]
 
 def test():
     clean_amount = AmericanTransaction.clean_amount
@@ -392,3 +391,11 @@ def test():
     decimal_amount = AmericanTransaction.decimal_amount
     assert decimal_amount('$12,442.12 USD') == Decimal('12442.12')
     assert decimal_amount('') == Decimal('0')
+
+    def tr(day, label):
+        t = Transaction()
+        t.date = t.rdate = datetime.date(2018, 1, day)
+        t.label = label
+        return t
+    merged = merge_iterators([tr(5, 'a'), tr(2, 'a')], [], [tr(5, 'c'), tr(3, 'c'), tr(1, 'c')])
+    assert [(t.date.day, t.label) for t in merged] == [(5, 'a'), (5, 'c'), (3, 'c'), (2, 'a'), (1, 'c')]
@@ -20,7 +20,7 @@
 import sys
 
 
-__all__ = ['unicode', 'long', 'basestring', 'check_output', 'range',
+__all__ = ['unicode', 'long', 'basestring', 'check_output', 'range', 'StopAsyncIteration',
            'with_metaclass',
            'quote', 'quote_plus', 'unquote', 'unquote_plus',
            'urlparse', 'urlunparse', 'urlsplit', 'urlunsplit',
@@ -49,6 +49,12 @@ try:
 except NameError:
     range = range
 
+try:
+    StopAsyncIteration = StopAsyncIteration
+except NameError:
+    class StopAsyncIteration(Exception):
+        pass
+
 
 from subprocess import check_output
 
@@ -29,7 +29,7 @@ from .compat import unicode
 
 
 __all__ = ['get_backtrace', 'get_bytes_size', 'iter_fields',
-            'to_unicode', 'limit', 'find_exe']
+            'to_unicode', 'limit', 'ReversedKey', 'find_exe']
 
 
 def get_backtrace(empty="Empty backtrace."):
@@ -128,6 +128,30 @@ def limit(iterator, lim):
         count += 1
 
 
+class ReversedKey(object):
+    """
+    Wrap a sort key to reverse its order, for example to get the greatest
+    element first from a :mod:`heapq`.
+
+    >>> sorted([2, 3, 1], key=ReversedKey)
+    [3, 2, 1]
+    """
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+
 def ratelimit(group, delay):
     """
     Simple rate limiting.
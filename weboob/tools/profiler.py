@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2018 weboob project
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock, local
+from time import time
+
+
+__all__ = ['StartupProfiler', 'startup_profiler']
+
+
+def get_process_start_time():
+    """
+    Get the time when the current process started, if it is known.
+
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, skip it.
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        # /proc/stat has the boot time in seconds only, compute it from
+        # the uptime which is precise to the hundredth of a second.
+        return time() - uptime + float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+class StartupProfiler(object):
+    """
+    Measure the duration of phases of the startup of an application.
+
+    Phases can be nested: time spent in a nested phase is not counted in the
+    outer one. Phases run in several threads are summed.
+
+    Nothing is measured until :func:`enable` is called, and after
+    :func:`stop` is called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start = None
+        self.end = None
+        self.first_request = None
+        # True while the first request of browsers is expected, checked
+        # before calling request_done() on each response.
+        self.waiting_request = False
+        self.durations = OrderedDict()
+        self.lock = Lock()
+        self.local = local()
+
+    def enable(self):
+        """
+        Start to measure phases. Time since the process started is
+        counted in the "imports" phase.
+        """
+        now = time()
+        self.enabled = True
+        self.waiting_request = True
+        self.start = get_process_start_time() or now
+        if self.start < now:
+            self.add('imports', now - self.start)
+
+    def add(self, name, duration):
+        with self.lock:
+            self.durations[name] = self.durations.get(name, 0) + duration
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure a phase.
+
+        >>> with startup_profiler.phase('config'):
+        ...     pass
+        """
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        now = time()
+        if stack:
+            # Pause the outer phase.
+            self.add(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time()
+            start = stack.pop()[1]
+            if self.end is None:
+                self.add(name, now - start)
+                if stack:
+                    stack[-1][1] = now
+
+    def stop(self):
+        """
+        End the measures, before the main loop of an application, which
+        waits for the user.
+        """
+        if not self.enabled:
+            return
+
+        now = time()
+        for name, start in getattr(self.local, 'stack', ()):
+            self.add(name, now - start)
+        self.end = now
+        self.enabled = self.waiting_request = False
+
+    def request_done(self):
+        """
+        Record the end of the first request of browsers.
+        """
+        if self.waiting_request:
+            self.waiting_request = False
+            self.first_request = time() - self.start
+
+    def report(self, stream):
+        """
+        Print durations of phases.
+        """
+        print('Startup profile:', file=stream)
+        for name, duration in self.durations.items():
+            print('  %-16s %9.1f ms' % (name, duration * 1000), file=stream)
+        print('  %-16s %9.1f ms' % ('total', ((self.end or time()) - self.start) * 1000), file=stream)
+        if self.first_request is not None:
+            print('  %-16s %9.1f ms' % ('first request', self.first_request * 1000), file=stream)
+
+
+startup_profiler = StartupProfiler()